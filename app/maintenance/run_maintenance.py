@@ -0,0 +1,273 @@
+"""
+Обслуживание всех сохраненных миров без бота. Миры обрабатываются параллельно в нескольких процессах.
+Запуск: PYTHONPATH=. python -m app.maintenance.run_maintenance [--workers N] [--storage-dir DIR] <команда>
+Команды:
+    validate - проверить, что каждый мир читается
+    report - размеры миров и длина их истории
+    render - отрисовать карты миров в кэш, настройки кодирования берутся из окружения, как у бота
+    resave - переписать миры в текущем формате, запускать при остановленном боте
+    export ARCHIVE - выгрузить миры в архив tar.gz
+    import ARCHIVE - загрузить миры из архива, прерванный импорт продолжается с того же места
+    sweep - заморозить заброшенные миры, бот делает это и сам
+    migrate [--dry-run] - перевести миры в текущую схему, перед записью каждого мира сохраняется его копия
+    rollback - вернуть миры из копий, сделанных migrate, запускать при остановленном боте
+    check [--repair] - найти поврежденные миры, с --repair исправить их, нечитаемые перенести в карантин,
+        бот делает это сам при запуске, с --repair запускать при остановленном боте
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, as_completed, wait
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from pathlib import Path
+from typing import Callable, Optional
+
+from app.maintenance.world_tasks import (
+    WorldReport,
+    check_world_integrity,
+    describe_world,
+    freeze_world,
+    import_world,
+    migrate_stored_world,
+    render_world,
+    resave_world,
+    restore_stored_world,
+    validate_world,
+)
+from app.storage.archive import ImportJournal, WorldArchiveWriter, iter_archive_worlds
+from app.storage.storage import STORAGE_DIR, Storage
+from app.storage.sweeper import FINISHED_MAX_IDLE, MAX_IDLE, find_abandoned_worlds
+from app.world_creator.image_encoder import EncodingPolicy
+from app.world_creator.model import SCHEMA_VERSION
+
+MEGABYTE = 1024 * 1024
+#: Сколько миров из архива на одного рабочего может ждать записи, ограничивает память импорта
+IMPORT_QUEUE_PER_WORKER = 2
+
+
+def get_stage_task(args: argparse.Namespace) -> Callable[[Path, int], WorldReport]:
+    if args.command == 'validate':
+        return validate_world
+    if args.command == 'report':
+        return describe_world
+    if args.command == 'render':
+        return partial(render_world, policy=EncodingPolicy.from_env())
+    if args.command == 'resave':
+        return resave_world
+    if args.command == 'migrate':
+        return partial(migrate_stored_world, backup_dir=args.backup_dir, dry_run=args.dry_run)
+    if args.command == 'rollback':
+        return partial(restore_stored_world, backup_dir=args.backup_dir)
+    if args.command == 'check':
+        return partial(check_world_integrity, repair=args.repair)
+    raise ValueError(f'Неизвестная команда {args.command}')
+
+
+def format_throughput(num_worlds: int, num_bytes: int, elapsed: float) -> str:
+    elapsed = max(elapsed, 1e-6)
+    return f'{num_worlds / elapsed:.1f} миров/с, {num_bytes / MEGABYTE / elapsed:.2f} МБ/с'
+
+
+class Progress:
+    def __init__(self, name: str, total: Optional[int] = None):
+        """Печатает ход выполнения команды и скорость обработки, total - количество миров, если оно известно"""
+        self.name = name
+        self.total = total
+        self.reports: list[WorldReport] = []
+        self.num_bytes = 0
+        self.start_time = time.perf_counter()
+
+    def add(self, report: WorldReport):
+        self.reports.append(report)
+        self.num_bytes += report.num_bytes
+        counter = f'{len(self.reports)}/{self.total}' if self.total is not None else str(len(self.reports))
+        status = report.details if report.is_ok else f'ОШИБКА {report.error}'
+        throughput = format_throughput(len(self.reports), self.num_bytes, time.perf_counter() - self.start_time)
+        print(f'[{counter}] мир {report.world_id}: {status} ({throughput})', flush=True)
+
+    def finish(self) -> list[WorldReport]:
+        elapsed = time.perf_counter() - self.start_time
+        num_errors = sum(not report.is_ok for report in self.reports)
+        print(
+            f'{self.name}: обработано миров {len(self.reports)} за {elapsed:.2f} с '
+            f'({format_throughput(len(self.reports), self.num_bytes, elapsed)}), ошибок {num_errors}',
+            flush=True,
+        )
+        return sorted(self.reports, key=lambda report: report.world_id)
+
+
+def run_stage(
+        name: str,
+        task: Callable[[Path, int], WorldReport],
+        storage_dir: Path,
+        world_ids: list[int],
+        workers: int,
+) -> list[WorldReport]:
+    """Запускает task для каждого мира в пуле процессов"""
+    print(f'{name}: миров {len(world_ids)}, процессов {workers}', flush=True)
+    progress = Progress(name, len(world_ids))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(task, storage_dir, world_id) for world_id in world_ids]
+        for future in as_completed(futures):
+            progress.add(future.result())
+    return progress.finish()
+
+
+def export_worlds(storage: Storage, world_ids: list[int], archive_path: Path) -> list[WorldReport]:
+    """
+    Пишет миры в архив по одному, в памяти находятся секции только одного мира.
+    Архив пишется во временный файл и появляется под своим именем только целиком
+    """
+    print(f'export: миров {len(world_ids)} в {archive_path}', flush=True)
+    progress = Progress('export', len(world_ids))
+    tmp_path = archive_path.with_name(f'{archive_path.name}.tmp')
+    with open(tmp_path, 'wb') as file, WorldArchiveWriter(file) as writer:
+        for world_id in world_ids:
+            report = WorldReport(world_id=world_id)
+            try:
+                sections = storage.read_world_sections(world_id)
+                report.num_bytes = writer.add_world(world_id, sections)
+                report.details = f'секций: {len(sections)}'
+            except Exception as error:
+                report.error = f'{type(error).__name__}: {error}'
+            progress.add(report)
+    os.replace(tmp_path, archive_path)
+    return progress.finish()
+
+
+def import_worlds(
+        storage_dir: Path,
+        archive_path: Path,
+        journal: ImportJournal,
+        workers: int,
+        overwrite: bool,
+        world_ids: Optional[list[int]] = None,
+) -> list[WorldReport]:
+    """
+    Читает архив потоком и раздает миры процессам на проверку и запись.
+    Записанные миры отмечаются в журнале, после успешного импорта журнал удаляется
+    """
+    imported_ids = journal.load()
+    print(f'import: из {archive_path}, процессов {workers}, уже импортировано миров {len(imported_ids)}', flush=True)
+    progress = Progress('import')
+
+    def collect(done: set[Future]):
+        for future in done:
+            report = future.result()
+            if report.is_ok:
+                journal.record(report.world_id)
+            progress.add(report)
+
+    with open(archive_path, 'rb') as file, ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: set[Future] = set()
+        for archived in iter_archive_worlds(file):
+            world_id = archived.manifest.world_id
+            if world_id in imported_ids or (world_ids and world_id not in world_ids):
+                continue
+            if len(pending) >= workers * IMPORT_QUEUE_PER_WORKER:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(import_world, storage_dir, archived, overwrite))
+        collect(wait(pending).done)
+
+    reports = progress.finish()
+    if all(report.is_ok for report in reports):
+        journal.path.unlink(missing_ok=True)
+    return reports
+
+
+def print_size_report(reports: list[WorldReport]):
+    print(f'{"мир":>16} {"байт":>12} {"записей":>8}  описание')
+    for report in sorted(reports, key=lambda report: report.num_bytes, reverse=True):
+        log_length = '-' if report.log_length is None else report.log_length
+        print(f'{report.world_id:>16} {report.num_bytes:>12} {log_length:>8}  {report.details or report.error}')
+    print(
+        f'{"всего":>16} {sum(report.num_bytes for report in reports):>12} '
+        f'{sum(report.log_length or 0 for report in reports):>8}'
+    )
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Обслуживание сохраненных миров')
+    parser.add_argument('--storage-dir', type=Path, default=STORAGE_DIR, help='папка хранилища миров')
+    parser.add_argument(
+        '--workers', type=int, default=os.cpu_count() or 1, help='сколько процессов обрабатывают миры одновременно'
+    )
+    parser.add_argument('--world', type=int, action='append', dest='world_ids', help='обработать только этот мир')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('validate', help='проверить, что каждый мир читается')
+    subparsers.add_parser('report', help='размеры миров и длина их истории')
+    subparsers.add_parser('render', help='отрисовать карты миров в кэш')
+    subparsers.add_parser('resave', help='переписать миры в текущем формате, запускать при остановленном боте')
+    export_parser = subparsers.add_parser('export', help='выгрузить миры в архив tar.gz')
+    export_parser.add_argument('archive', type=Path)
+    import_parser = subparsers.add_parser('import', help='загрузить миры из архива tar.gz')
+    import_parser.add_argument('archive', type=Path)
+    import_parser.add_argument(
+        '--journal', type=Path, help='журнал импорта для продолжения после обрыва, по умолчанию ARCHIVE.journal'
+    )
+    import_parser.add_argument('--overwrite', action='store_true', help='заменять миры, которые уже есть в хранилище')
+    sweep_parser = subparsers.add_parser('sweep', help='заморозить заброшенные миры')
+    sweep_parser.add_argument(
+        '--max-idle-days', type=float, default=MAX_IDLE.days, help='сколько дней мир может не меняться'
+    )
+    sweep_parser.add_argument(
+        '--finished-max-idle-days', type=float, default=FINISHED_MAX_IDLE.days,
+        help='то же для миров, создание которых закончено',
+    )
+    backup_dir_help = f'папка копий миров, по умолчанию STORAGE_DIR/backups/schema_{SCHEMA_VERSION}'
+    migrate_parser = subparsers.add_parser('migrate', help='перевести миры в текущую схему')
+    migrate_parser.add_argument('--backup-dir', type=Path, help=backup_dir_help)
+    migrate_parser.add_argument(
+        '--dry-run', action='store_true', help='только проверить, что миры читаются в новой схеме'
+    )
+    rollback_parser = subparsers.add_parser('rollback', help='вернуть миры из копий, сделанных перед миграцией')
+    rollback_parser.add_argument('--backup-dir', type=Path, help=backup_dir_help)
+    check_parser = subparsers.add_parser('check', help='найти поврежденные миры')
+    check_parser.add_argument(
+        '--repair', action='store_true', help='исправить что можно, нечитаемые миры перенести в карантин'
+    )
+    check_parser.add_argument('--include-frozen', action='store_true', help='проверить и замороженные миры')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('--workers должно быть не меньше 1')
+    if args.command in ('migrate', 'rollback') and args.backup_dir is None:
+        args.backup_dir = args.storage_dir / 'backups' / f'schema_{SCHEMA_VERSION}'
+    return args
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    storage = Storage(args.storage_dir)
+    if args.command == 'import':
+        journal = ImportJournal(args.journal or args.archive.with_name(f'{args.archive.name}.journal'))
+        reports = import_worlds(args.storage_dir, args.archive, journal, args.workers, args.overwrite, args.world_ids)
+    elif args.command == 'export':
+        reports = export_worlds(storage, args.world_ids or storage.get_world_ids(include_frozen=True), args.archive)
+    elif args.command == 'sweep':
+        abandoned_ids = find_abandoned_worlds(
+            storage,
+            datetime.now(timezone.utc),
+            timedelta(days=args.max_idle_days),
+            timedelta(days=args.finished_max_idle_days),
+        )
+        world_ids = [world_id for world_id in abandoned_ids if not args.world_ids or world_id in args.world_ids]
+        reports = run_stage(args.command, freeze_world, args.storage_dir, world_ids, args.workers)
+    elif args.command == 'rollback':
+        world_ids = args.world_ids or Storage.get_backup_world_ids(args.backup_dir)
+        reports = run_stage(args.command, get_stage_task(args), args.storage_dir, world_ids, args.workers)
+    elif args.command == 'check':
+        world_ids = args.world_ids or storage.get_world_ids(include_frozen=args.include_frozen)
+        reports = run_stage(args.command, get_stage_task(args), args.storage_dir, world_ids, args.workers)
+    else:
+        world_ids = args.world_ids or storage.get_world_ids()
+        reports = run_stage(args.command, get_stage_task(args), args.storage_dir, world_ids, args.workers)
+    if args.command == 'report':
+        print_size_report(reports)
+    return 0 if all(report.is_ok for report in reports) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
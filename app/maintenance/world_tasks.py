@@ -0,0 +1,170 @@
+"""
+Обработка одного мира для команд обслуживания.
+Функции запускаются в отдельных процессах, поэтому принимают папку хранилища, а не Storage,
+и возвращают WorldReport, а не бросают исключения
+"""
+from pathlib import Path
+from typing import Callable, Optional
+
+from pydantic import Field
+
+from app.storage.archive import ArchivedWorld, parse_world_sections
+from app.storage.integrity import check_world
+from app.storage.lazy_world import LazyWorld
+from app.storage.storage import Storage, WorldChangedError
+from app.world_creator.base_model import BaseModel
+from app.world_creator.controller import WorldController
+from app.world_creator.image_encoder import EncodingPolicy
+from app.world_creator.model import SCHEMA_VERSION
+
+
+class WorldReport(BaseModel):
+    world_id: int = Field(...)
+    num_bytes: int = Field(0, description='Сколько байт мир занимает на диске')
+    log_length: Optional[int] = Field(None)
+    details: str = Field('')
+    error: Optional[str] = Field(None)
+
+    @property
+    def is_ok(self) -> bool:
+        return self.error is None
+
+
+def _run(storage_dir: Path, world_id: int, process: Callable[[Storage, WorldReport], None]) -> WorldReport:
+    storage = Storage(storage_dir)
+    report = WorldReport(world_id=world_id)
+    try:
+        report.num_bytes = storage.get_world_size(world_id)
+        process(storage, report)
+    except Exception as error:
+        report.error = f'{type(error).__name__}: {error}'
+    return report
+
+
+def validate_world(storage_dir: Path, world_id: int) -> WorldReport:
+    """Читает все секции мира и проверяет их схемой"""
+    def process(storage: Storage, report: WorldReport):
+        world = storage.load_world(world_id)
+        if isinstance(world, LazyWorld):
+            world.load_all()
+        report.log_length = world.log_length
+
+    return _run(storage_dir, world_id, process)
+
+
+def describe_world(storage_dir: Path, world_id: int) -> WorldReport:
+    """Размер мира и длина истории, читаются только общие данные и оглавление истории"""
+    def process(storage: Storage, report: WorldReport):
+        world = storage.load_world(world_id)
+        layout = 'по секциям' if isinstance(world, LazyWorld) else 'одним файлом'
+        report.log_length = world.log_length
+        report.details = f'{world.name}, {world.layers_shape[0]}x{world.layers_shape[1]}, {layout}'
+
+    return _run(storage_dir, world_id, process)
+
+
+def render_world(storage_dir: Path, world_id: int, policy: EncodingPolicy) -> WorldReport:
+    """Отрисовывает карту мира в кэш, бот потом отправляет ее без отрисовки"""
+    def process(storage: Storage, report: WorldReport):
+        controller = WorldController(world_id, god_id=0, storage=storage)
+        path = controller.get_map_path(policy)
+        report.log_length = controller.world.log_length
+        report.details = f'{path.name}, {path.stat().st_size} байт'
+
+    return _run(storage_dir, world_id, process)
+
+
+def resave_world(storage_dir: Path, world_id: int) -> WorldReport:
+    """
+    Переписывает мир в текущем формате: мир одним файлом раскладывается по секциям,
+    у мира по секциям переписываются секции, которые сохранены в старом формате
+    """
+    def process(storage: Storage, report: WorldReport):
+        world = storage.load_world(world_id)
+        if isinstance(world, LazyWorld):
+            world.load_all()
+        sections = storage.save_world(world_id, world, touch=False)
+        report.log_length = world.log_length
+        report.details = f'переписано секций: {len(sections)}'
+
+    return _run(storage_dir, world_id, process)
+
+
+def import_world(storage_dir: Path, archived: ArchivedWorld, overwrite: bool) -> WorldReport:
+    """Проверяет контрольные суммы и схему мира из архива и записывает его в хранилище"""
+    def process(storage: Storage, report: WorldReport):
+        report.num_bytes = sum(len(section.encode()) for section in archived.sections.values())
+        archived.manifest.verify(archived.sections)
+        report.log_length = parse_world_sections(archived.sections).log_length
+        if storage.is_world_exist(archived.manifest.world_id) and not overwrite:
+            report.details = 'уже есть в хранилище, пропущен'
+            return
+        storage.write_world_sections(archived.manifest.world_id, archived.sections)
+        report.details = f'записано секций: {len(archived.sections)}'
+
+    return _run(storage_dir, archived.manifest.world_id, process)
+
+
+def freeze_world(storage_dir: Path, world_id: int) -> WorldReport:
+    """Переносит мир в холодное хранилище, мир, который сохранили во время заморозки, остается на месте"""
+    def process(storage: Storage, report: WorldReport):
+        try:
+            num_bytes = storage.freeze_world(world_id)
+        except WorldChangedError:
+            report.details = 'сохранен во время заморозки, пропущен'
+            return
+        report.details = f'заморожен, архив {num_bytes} байт'
+
+    return _run(storage_dir, world_id, process)
+
+
+def migrate_stored_world(storage_dir: Path, world_id: int, backup_dir: Path, dry_run: bool) -> WorldReport:
+    """
+    Переводит мир в текущую схему и переписывает изменившиеся секции, перед записью сохраняет копию мира.
+    При dry_run мир только читается в новой схеме, без записи
+    """
+    def process(storage: Storage, report: WorldReport):
+        version = storage.get_stored_schema_version(world_id)
+        if version == SCHEMA_VERSION and not storage.is_world_legacy(world_id):
+            report.details = 'уже в текущей схеме'
+            return
+
+        world = storage.load_world(world_id)
+        if isinstance(world, LazyWorld):
+            world.load_all()
+        report.log_length = world.log_length
+        if dry_run:
+            num_sections = len(world.get_changed_sections()) if isinstance(world, LazyWorld) else 'все'
+            report.details = f'схема {version} -> {SCHEMA_VERSION}, будет переписано секций: {num_sections}'
+            return
+
+        backup_path = storage.backup_world(world_id, backup_dir)
+        sections = storage.save_world(world_id, world, touch=False)
+        report.details = f'схема {version} -> {SCHEMA_VERSION}, переписано секций: {len(sections)}, копия {backup_path}'
+
+    return _run(storage_dir, world_id, process)
+
+
+def restore_stored_world(storage_dir: Path, world_id: int, backup_dir: Path) -> WorldReport:
+    """Возвращает мир из копии, сделанной перед миграцией"""
+    def process(storage: Storage, report: WorldReport):
+        storage.restore_world(world_id, backup_dir)
+        report.details = f'восстановлен, схема {storage.get_stored_schema_version(world_id)}'
+
+    return _run(storage_dir, world_id, process)
+
+
+def check_world_integrity(storage_dir: Path, world_id: int, repair: bool) -> WorldReport:
+    """Ищет повреждения мира, при repair исправляет их или переносит мир в карантин"""
+    def process(storage: Storage, report: WorldReport):
+        integrity = check_world(storage, world_id, repair)
+        if integrity.is_ok:
+            report.details = 'в порядке'
+        elif integrity.is_resolved:
+            report.details = f'исправлен: {integrity.summary}'
+        elif integrity.quarantine_path is not None:
+            report.error = f'перенесен в карантин {integrity.quarantine_path}: {integrity.summary}'
+        else:
+            report.error = integrity.summary
+
+    return _run(storage_dir, world_id, process)
@@ -0,0 +1,138 @@
+"""
+Архив миров tar.gz для резервных копий и переноса между серверами.
+Архив пишется и читается потоком, в памяти одновременно находятся секции только одного мира.
+Мир в архиве - его секции worlds/{id}/{секция}.json и за ними manifest.json с контрольными суммами секций,
+манифест пишется последним, поэтому мир без манифеста в оборванном архиве не читается
+"""
+import hashlib
+import io
+import os
+import tarfile
+from functools import partial
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from pydantic import Field
+
+from app.storage.lazy_world import LazyWorld
+from app.storage.sections import get_child_sections
+from app.world_creator.base_model import BaseModel
+from app.world_creator.model import World
+
+ARCHIVE_FORMAT = 1
+ARCHIVE_ROOT = 'worlds'
+MANIFEST_NAME = 'manifest'
+
+
+def get_checksum(section: str) -> str:
+    return hashlib.sha256(section.encode()).hexdigest()
+
+
+class WorldManifest(BaseModel):
+    archive_format: int = Field(ARCHIVE_FORMAT)
+    world_id: int = Field(...)
+    checksums: dict[str, str] = Field(..., description='Секция - sha256 ее содержимого')
+
+    def verify(self, sections: dict[str, str]):
+        if set(sections) != set(self.checksums):
+            raise ValueError(f'Секции мира {self.world_id} не совпадают с манифестом')
+        for section_name, section in sections.items():
+            if get_checksum(section) != self.checksums[section_name]:
+                raise ValueError(f'Контрольная сумма секции {section_name} мира {self.world_id} не совпадает')
+
+
+class ArchivedWorld(BaseModel):
+    manifest: WorldManifest = Field(...)
+    sections: dict[str, str] = Field(...)
+
+
+def parse_world_sections(sections: dict[str, str]) -> World:
+    """Читает мир из секций в памяти, чтобы проверить их схемой до записи в хранилище"""
+    return LazyWorld.from_sections(sections.__getitem__, partial(get_child_sections, sections)).load_all()
+
+
+class WorldArchiveWriter:
+    def __init__(self, file: BinaryIO):
+        """Пишет архив в файл или поток, например в stdout, без перемотки"""
+        self._tar = tarfile.open(fileobj=file, mode='w|gz')
+
+    def _add(self, name: str, data: bytes):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def add_world(self, world_id: int, sections: dict[str, str]) -> int:
+        """:return: сколько байт секций записано"""
+        num_bytes = 0
+        for section_name, section in sections.items():
+            data = section.encode()
+            self._add(f'{ARCHIVE_ROOT}/{world_id}/{section_name}.json', data)
+            num_bytes += len(data)
+        manifest = WorldManifest(
+            world_id=world_id,
+            checksums={section_name: get_checksum(section) for section_name, section in sections.items()},
+        )
+        self._add(f'{ARCHIVE_ROOT}/{world_id}/{MANIFEST_NAME}.json', manifest.json().encode())
+        return num_bytes
+
+    def close(self):
+        self._tar.close()
+
+    def __enter__(self) -> 'WorldArchiveWriter':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_archive_worlds(file: BinaryIO) -> Iterator[ArchivedWorld]:
+    """
+    Миры архива по очереди. Контрольные суммы не проверяются, это делает тот, кто записывает мир,
+    чтобы проверку можно было выполнять параллельно
+    """
+    sections: dict[str, str] = {}
+    with tarfile.open(fileobj=file, mode='r|gz') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            root, world_id, section_file = member.name.split('/', 2)
+            if root != ARCHIVE_ROOT or not section_file.endswith('.json'):
+                raise ValueError(f'Неизвестный файл в архиве {member.name}')
+            extracted = tar.extractfile(member)
+            assert extracted  # для mypy
+            data = extracted.read().decode()
+            section_name = section_file[:-len('.json')]
+            if section_name != MANIFEST_NAME:
+                sections[section_name] = data
+                continue
+
+            manifest = WorldManifest.parse_raw(data)
+            if manifest.archive_format > ARCHIVE_FORMAT:
+                raise ValueError(f'Архив записан более новой версией, формат {manifest.archive_format}')
+            if str(manifest.world_id) != world_id:
+                raise ValueError(f'Манифест мира {manifest.world_id} лежит в папке {world_id}')
+            yield ArchivedWorld(manifest=manifest, sections=sections)
+            sections = {}
+
+    if sections:
+        raise ValueError('Архив оборван: у последнего мира нет манифеста')
+
+
+class ImportJournal:
+    def __init__(self, path: Path):
+        """
+        Журнал импорта: id миров, которые уже записаны в хранилище, по строке на мир.
+        Повторный импорт того же архива пропускает записанные миры
+        """
+        self.path = path
+
+    def load(self) -> set[int]:
+        if not self.path.exists():
+            return set()
+        return {int(line) for line in self.path.read_text().split()}
+
+    def record(self, world_id: int):
+        with open(self.path, 'a') as file:
+            file.write(f'{world_id}\n')
+            file.flush()
+            os.fsync(file.fileno())
@@ -0,0 +1,241 @@
+"""
+Проверка целостности сохраненных миров: поврежденный JSON (файл, записанный не до конца),
+слои, тайлы которых не совпадают с размером слоя, ссылки на несуществующих богов и расы.
+Проблемы, которые исправляются без потери данных игроков, исправляются, остальные только попадают в отчет и лог.
+В карантин переносятся лишь миры, которые не читаются, чтобы обработчики бота не падали на них
+при каждом обращении к миру
+"""
+import gzip
+import json
+import logging
+import os
+import tarfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+from pydantic import Field
+
+from app.storage.archive import parse_world_sections
+from app.storage.sections import META_SECTION, get_layer_section_name, split_world
+from app.storage.storage import Storage
+from app.world_creator.base_model import BaseModel
+from app.world_creator.model import Layer, LayerChunk, SparseLayer, World
+from app.world_creator.tiles import Tile
+
+logger = logging.getLogger(__name__)
+#: Ошибки чтения, которые означают, что мир поврежден. Остальные ошибки, например мир сохраняют во время чтения,
+#: говорят о том, что проверить мир сейчас не удалось, такой мир в карантин не переносится
+READ_ERRORS = (ValueError, LookupError, TypeError, EOFError, tarfile.TarError, gzip.BadGzipFile)
+
+
+class Problem(BaseModel):
+    section: Optional[str] = Field(None, description='Секция мира с проблемой, None - мир целиком')
+    message: str = Field(...)
+    is_repairable: bool = Field(False, description='Исправляется без потери данных игроков')
+    is_fatal: bool = Field(False, description='Мир не читается, его нужно убрать в карантин')
+
+    def __str__(self):
+        return f'{self.section or "мир"}: {self.message}{" (исправимо)" if self.is_repairable else ""}'
+
+
+class IntegrityReport(BaseModel):
+    world_id: int = Field(...)
+    problems: list[Problem] = Field([])
+    is_repaired: bool = Field(False)
+    quarantine_path: Optional[Path] = Field(None)
+
+    @property
+    def is_ok(self) -> bool:
+        return not self.problems
+
+    @property
+    def is_fatal(self) -> bool:
+        """Мир не читается, его надо убрать в карантин"""
+        return any(problem.is_fatal for problem in self.problems)
+
+    @property
+    def is_resolved(self) -> bool:
+        """Мир исправлен и других проблем в нем нет"""
+        return self.is_repaired and all(problem.is_repairable for problem in self.problems)
+
+    @property
+    def summary(self) -> str:
+        return '; '.join(str(problem) for problem in self.problems)
+
+
+#: Проверки прочитанного мира. Проверка возвращает найденные проблемы,
+#: при repair=True сразу исправляет те из них, что помечены исправимыми
+CHECKS: list[Callable[[World, bool], list[Problem]]] = []
+
+
+def integrity_check(function: Callable[[World, bool], list[Problem]]) -> Callable[[World, bool], list[Problem]]:
+    CHECKS.append(function)
+    return function
+
+
+def find_corrupt_sections(sections: dict[str, str]) -> list[Problem]:
+    """Секции, которые не читаются как JSON, обычно это файлы, запись которых оборвалась"""
+    problems = []
+    for section_name, section in sections.items():
+        try:
+            json.loads(section)
+        except ValueError as error:
+            problems.append(Problem(section=section_name, message=f'поврежденный JSON: {error}', is_fatal=True))
+    return problems
+
+
+def _get_empty_tiles(layer: Layer, chunk_position: int, start: int, num_tiles: int) -> list[Tile]:
+    return [
+        Tile(position=layer.get_position_from_chunk(chunk_position, local_position))
+        for local_position in range(start, num_tiles)
+    ]
+
+
+def _check_chunked_layer(layer: Layer, repair: bool) -> list[str]:
+    """:raises ValueError: слой нельзя исправить"""
+    extra_chunks = sorted(chunk_position for chunk_position in layer.chunks if chunk_position >= layer.num_chunks)
+    if extra_chunks:
+        raise ValueError(f'чанки {extra_chunks} за пределами слоя')
+
+    problems = []
+    for chunk_position in range(layer.num_chunks):
+        shape = layer.get_chunk_shape(chunk_position)
+        num_tiles = shape[0] * shape[1]
+        chunk = layer.chunks.get(chunk_position)
+        if chunk is None:
+            problems.append(f'нет чанка {chunk_position}')
+            if repair:
+                layer.chunks[chunk_position] = LayerChunk(
+                    shape=shape, tiles=_get_empty_tiles(layer, chunk_position, 0, num_tiles)
+                )
+            continue
+
+        if tuple(chunk.shape) != shape:
+            raise ValueError(f'размер чанка {chunk_position} {chunk.shape}, а должен быть {shape}')
+        if len(chunk.tiles) > num_tiles:
+            raise ValueError(f'в чанке {chunk_position} тайлов {len(chunk.tiles)}, а должно быть {num_tiles}')
+        for local_position, tile in enumerate(chunk.tiles):
+            position = layer.get_position_from_chunk(chunk_position, local_position)
+            if tile.position != position:
+                raise ValueError(f'тайл {tile.position} лежит в чанке {chunk_position} на месте тайла {position}')
+        if len(chunk.tiles) < num_tiles:
+            problems.append(f'в чанке {chunk_position} тайлов {len(chunk.tiles)} из {num_tiles}')
+            if repair:
+                chunk.tiles.extend(_get_empty_tiles(layer, chunk_position, len(chunk.tiles), num_tiles))
+    return problems
+
+
+@integrity_check
+def check_layers(world: World, repair: bool) -> list[Problem]:
+    """
+    Тайлы слоя должны покрывать его размер. Недостающие тайлы, например чанк, оборванный при записи,
+    заполняются пустыми, тайлы разреженного слоя за пределами размера слоя отбрасываются.
+    Слой с лишними или перепутанными тайлами исправить нельзя, о нем только сообщается
+    """
+    problems = []
+    for layer_name, layer in world.layers.items():
+        section = get_layer_section_name(layer_name)
+        if isinstance(layer, SparseLayer):
+            outside = sorted(position for position in layer.filled_tiles if not 0 <= position < layer.num_tiles)
+            if outside:
+                problems.append(
+                    Problem(section=section, message=f'тайлы {outside} за пределами слоя', is_repairable=True)
+                )
+                if repair:
+                    for position in outside:
+                        del layer.filled_tiles[position]
+            continue
+        try:
+            problems.extend(
+                Problem(section=section, message=message, is_repairable=True)
+                for message in _check_chunked_layer(layer, repair)
+            )
+        except ValueError as error:
+            problems.append(Problem(section=section, message=str(error)))
+    return problems
+
+
+@integrity_check
+def check_redactor_god(world: World, repair: bool) -> list[Problem]:
+    """Ход бога, которого нет в мире, передается первому богу, который еще не завершил раунд"""
+    if world.redactor_god_id is None or world.redactor_god_id in world.gods:
+        return []
+    problem = Problem(
+        section=META_SECTION, message=f'ход передан несуществующему богу {world.redactor_god_id}', is_repairable=True
+    )
+    if repair:
+        god_ids = [god_id for god_id, god in world.gods.items() if not god.confirm_end_round]
+        world.set_trusted(redactor_god_id=god_ids[0] if god_ids else None)
+    return [problem]
+
+
+@integrity_check
+def check_cities(world: World, repair: bool) -> list[Problem]:
+    """Город без расы удалять нельзя, его создал игрок, поэтому о нем только сообщается"""
+    return [
+        Problem(section='cities', message=f'город {city.name} основан несуществующей расой {city.base_race_name}')
+        for city in world.cities if city.base_race_name not in world.races
+    ]
+
+
+def check_world(storage: Storage, world_id: int, repair: bool = False) -> IntegrityReport:
+    """
+    Читает все секции мира и проверяет их.
+    При repair исправимые проблемы исправляются и мир переписывается целиком,
+    мир, который не читается, переносится в карантин
+    """
+    report = IntegrityReport(world_id=world_id)
+    world = None
+    try:
+        sections = storage.read_world_sections(world_id)
+        report.problems.extend(find_corrupt_sections(sections))
+        if report.is_ok:
+            world = parse_world_sections(sections)
+    except READ_ERRORS as error:
+        report.problems.append(Problem(message=f'не читается: {type(error).__name__}: {error}', is_fatal=True))
+    if world is not None:
+        for check in CHECKS:
+            report.problems.extend(check(world, repair))
+
+    if not repair or report.is_ok:
+        return report
+    if report.is_fatal:
+        report.quarantine_path = storage.quarantine_world(
+            world_id, '\n'.join(str(problem) for problem in report.problems)
+        )
+    elif any(problem.is_repairable for problem in report.problems):
+        assert world is not None  # для mypy
+        storage.write_world_sections(world_id, split_world(world))
+        report.is_repaired = True
+    return report
+
+
+def _check_stored_world(storage_dir: Path, world_id: int, repair: bool) -> IntegrityReport:
+    try:
+        return check_world(Storage(storage_dir), world_id, repair)
+    except Exception as error:
+        return IntegrityReport(world_id=world_id, problems=[Problem(message=f'{type(error).__name__}: {error}')])
+
+
+def check_storage(
+        storage: Storage,
+        repair: bool = False,
+        workers: Optional[int] = None,
+        include_frozen: bool = False,
+) -> list[IntegrityReport]:
+    """Проверяет все миры хранилища параллельно в нескольких процессах и пишет в лог найденные проблемы"""
+    world_ids = storage.get_world_ids(include_frozen=include_frozen)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        reports = list(executor.map(
+            _check_stored_world, [storage.storage_dir] * len(world_ids), world_ids, [repair] * len(world_ids)
+        ))
+    for report in reports:
+        if report.quarantine_path is not None:
+            logger.error('Мир %s перенесен в карантин %s: %s', report.world_id, report.quarantine_path, report.summary)
+        elif report.is_resolved:
+            logger.warning('Мир %s исправлен: %s', report.world_id, report.summary)
+        elif not report.is_ok:
+            logger.error('В мире %s найдены проблемы: %s', report.world_id, report.summary)
+    logger.info('Проверено миров %s, с проблемами %s', len(reports), sum(not report.is_ok for report in reports))
+    return reports
@@ -0,0 +1,345 @@
+import json
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Iterator, Optional
+
+from pydantic import PrivateAttr
+
+from app.storage.migrations import LAYER, LOG_ENTRY, META, get_schema_version, migrate
+from app.storage.sections import (
+    LAYER_SECTION_PREFIX,
+    LIST_SECTIONS,
+    LOG_SECTION_PREFIX,
+    LOG_SEGMENT_SIZE,
+    META_SECTION,
+    dump_section,
+    get_child_sections,
+    get_chunk_section_name,
+    get_layer_chunks,
+    get_layer_header,
+    get_layer_section_name,
+    get_log_section_name,
+    get_meta_section,
+    is_whole_layer,
+    join_layer,
+    split_log,
+)
+from app.world_creator.model import LAYERS, SCHEMA_VERSION, Layer, LayerChunk, LogEntry, SparseLayer, World
+
+
+def get_chunk_fingerprint(chunk: LayerChunk) -> int:
+    """Отпечаток содержимого чанка, считается намного быстрее сериализации"""
+    return hash(tuple(tuple(tile.__dict__.values()) for tile in chunk.tiles))
+
+
+class LazyDict(dict):
+    """Словарь, каждое значение которого читается из хранилища при первом обращении к нему: слои мира или чанки слоя"""
+
+    def __init__(self, keys: list, load: Callable[[Any], Any]):
+        super().__init__()
+        self._keys = list(keys)
+        self._load_value = load
+
+    def _load(self, key):
+        if key in self._keys and not super().__contains__(key):
+            super().__setitem__(key, self._load_value(key))
+
+    def __getitem__(self, key):
+        self._load(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        if key not in self._keys:
+            self._keys.append(key)
+        super().__setitem__(key, value)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self) -> Iterator:
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, key, default=None):
+        return self[key] if key in self._keys else default
+
+    def keys(self):
+        return list(self._keys)
+
+    def values(self):
+        return [self[key] for key in self._keys]
+
+    def items(self):
+        return [(key, self[key]) for key in self._keys]
+
+    def get_loaded(self) -> dict:
+        """Прочитанные или записанные значения, без чтения остальных"""
+        return {key: dict.__getitem__(self, key) for key in self._keys if dict.__contains__(self, key)}
+
+
+def get_loaded_chunks(layer: Layer) -> dict[int, LayerChunk]:
+    """Прочитанные чанки слоя, остальные не могли измениться"""
+    if isinstance(layer.chunks, LazyDict):
+        return layer.chunks.get_loaded()
+    return layer.chunks
+
+
+class LazyWorld(World):
+    """
+    Мир, секции которого (слои, расы, города, события, история) читаются из хранилища при первом обращении.
+    Слой из чанков читает при первом обращении только заголовок, а каждый чанк - при обращении к нему.
+    История читается по сегментам: новые записи дописываются в последний сегмент, не читая остальные.
+    Запоминает хеши прочитанных секций, чтобы при сохранении записать только изменившиеся,
+    а у чанков слоев еще и отпечатки, чтобы не сериализовать заново неизменившиеся чанки.
+    Секции мира, сохраненного в старой схеме, переводятся в текущую при чтении.
+    Между чтениями секций проходит время, поэтому каждое дочитывание проверяет, что мир в хранилище не изменился
+    """
+    _read_section: Any = PrivateAttr(None)
+    _list_sections: Any = PrivateAttr(None)
+    _guard_read: Any = PrivateAttr(None)
+    _stored_state: Any = PrivateAttr(None)
+    _section_hashes: dict[str, int] = PrivateAttr({})
+    _chunk_fingerprints: dict[str, int] = PrivateAttr({})
+    _num_log_segments: int = PrivateAttr(0)
+    _log_segments: dict[int, list[LogEntry]] = PrivateAttr({})
+    _stored_schema_version: int = PrivateAttr(SCHEMA_VERSION)
+
+    @classmethod
+    def from_sections(
+            cls,
+            read_section: Callable[[str], str],
+            list_sections: Callable[[str], list[str]],
+            guard_read: Optional[Callable[[Any], ContextManager]] = None,
+            stored_state: Any = None,
+    ) -> 'LazyWorld':
+        """
+        :param read_section: содержимое секции по ее названию
+        :param list_sections: названия секций, лежащих прямо в группе, см. get_child_sections
+        :param guard_read: оборачивает каждое дочитывание, получает stored_state и падает, если мир с тех пор изменился
+        :param stored_state: состояние мира в хранилище на момент чтения, None - мир прочитан не из хранилища
+        """
+        meta = read_section(META_SECTION)
+        meta_data = json.loads(meta)
+        stored_schema_version = get_schema_version(meta_data)
+        world = cls.construct(**World.parse_obj(migrate(META, meta_data, stored_schema_version)).__dict__)
+        for field_name in (*LIST_SECTIONS, 'change_log'):
+            world.__dict__.pop(field_name, None)
+        world._read_section = read_section
+        world._list_sections = list_sections
+        world._guard_read = guard_read
+        world._stored_state = stored_state
+        world._section_hashes = {META_SECTION: hash(meta)}
+        world._stored_schema_version = stored_schema_version
+        world._num_log_segments = len(list_sections(LOG_SECTION_PREFIX))
+        layer_names = [name[len(LAYER_SECTION_PREFIX):] for name in list_sections(LAYER_SECTION_PREFIX)]
+        world.__dict__['layers'] = LazyDict(layer_names, world._load_layer)
+        return world
+
+    @property
+    def stored_schema_version(self) -> int:
+        """Версия схемы, в которой мир лежит в хранилище"""
+        return self._stored_schema_version
+
+    @property
+    def stored_state(self) -> Any:
+        """Состояние мира в хранилище на момент чтения или последнего сохранения"""
+        return self._stored_state
+
+    def _reading(self) -> ContextManager:
+        if self._guard_read is None:
+            return nullcontext()
+        return self._guard_read(self._stored_state)
+
+    def _read_json(self, section_name: str) -> Any:
+        section = self._read_section(section_name)
+        self._section_hashes[section_name] = hash(section)
+        return json.loads(section)
+
+    def _read(self, section_name: str, part: str) -> Any:
+        with self._reading():
+            data = self._read_json(section_name)
+        if part == LOG_ENTRY:
+            return [migrate(part, entry, self._stored_schema_version) for entry in data]
+        return migrate(part, data, self._stored_schema_version)
+
+    def _validate_layer(self, layer_name: str, layer_data: dict) -> LAYERS:
+        layers, errors = self.__fields__['layers'].validate(
+            {layer_name: layer_data}, {}, loc='layers', cls=World
+        )
+        if errors or layers is None:
+            raise ValueError(f'Не удалось прочитать слой {layer_name}: {errors}')
+        return layers[layer_name]
+
+    def _load_layer(self, layer_name: str) -> LAYERS:
+        """
+        Слой из чанков в текущей схеме читается без чанков, они читаются при обращении к ним.
+        Разреженный слой, слой целиком в заголовке и слой в старой схеме читаются сразу целиком
+        """
+        section_name = get_layer_section_name(layer_name)
+        with self._reading():
+            header = self._read_json(section_name)
+            chunk_section_names = self._list_sections(f'{section_name}/')
+            chunk_positions = [int(name.rsplit('/', 1)[1]) for name in chunk_section_names]
+            if (
+                    self._stored_schema_version == SCHEMA_VERSION and not is_whole_layer(header)
+                    and header['layer_type'] != 'sparse'
+            ):
+                layer = self._validate_layer(layer_name, join_layer(header, {}))
+                assert isinstance(layer, Layer)  # для mypy
+                layer.__dict__['chunks'] = LazyDict(
+                    chunk_positions, lambda chunk_position: self._load_chunk(layer_name, chunk_position)
+                )
+                return layer
+            chunks = {
+                chunk_position: self._read_json(chunk_section_name)
+                for chunk_position, chunk_section_name in zip(chunk_positions, chunk_section_names)
+            }
+        layer = self._validate_layer(
+            layer_name, migrate(LAYER, join_layer(header, chunks), self._stored_schema_version)
+        )
+        if isinstance(layer, Layer) and not is_whole_layer(header):
+            for chunk_position, chunk in layer.chunks.items():
+                self._chunk_fingerprints[get_chunk_section_name(layer_name, chunk_position)] = (
+                    get_chunk_fingerprint(chunk)
+                )
+        return layer
+
+    def _load_chunk(self, layer_name: str, chunk_position: int) -> LayerChunk:
+        chunk_section_name = get_chunk_section_name(layer_name, chunk_position)
+        with self._reading():
+            chunk = LayerChunk.parse_obj(self._read_json(chunk_section_name))
+        self._chunk_fingerprints[chunk_section_name] = get_chunk_fingerprint(chunk)
+        return chunk
+
+    def _get_layer_sections(self, layer_name: str, changed_only: bool) -> dict[str, str]:
+        """
+        Секции прочитанного слоя. При changed_only чанки с прежним отпечатком пропускаются,
+        а чанки разреженного слоя, из которых убрали все тайлы, записываются пустыми
+        """
+        layer = self.layers[layer_name]
+        section_name = get_layer_section_name(layer_name)
+        sections = {section_name: get_layer_header(layer)}
+        chunks = get_layer_chunks(layer) if isinstance(layer, SparseLayer) else get_loaded_chunks(layer)
+        for chunk_position, chunk in chunks.items():
+            chunk_section_name = get_chunk_section_name(layer_name, chunk_position)
+            if (
+                    changed_only and isinstance(chunk, LayerChunk)
+                    and self._chunk_fingerprints.get(chunk_section_name) == get_chunk_fingerprint(chunk)
+            ):
+                continue
+            sections[chunk_section_name] = dump_section(chunk)
+        if changed_only and isinstance(layer, SparseLayer):
+            for chunk_section_name in get_child_sections(self._section_hashes, f'{section_name}/'):
+                sections.setdefault(chunk_section_name, dump_section({}))
+        return sections
+
+    def _get_log_segment(self, segment: int) -> list[LogEntry]:
+        if segment not in self._log_segments:
+            entries = self._read(get_log_section_name(segment), LOG_ENTRY)
+            self._log_segments[segment] = [LogEntry.parse_obj(entry) for entry in entries]
+        return self._log_segments[segment]
+
+    @property
+    def is_log_loaded(self) -> bool:
+        return 'change_log' in self.__dict__
+
+    @property
+    def log_length(self) -> int:
+        if self.is_log_loaded or not self._num_log_segments:
+            return len(self.__dict__.get('change_log', []))
+        last_segment = self._num_log_segments - 1
+        return last_segment * LOG_SEGMENT_SIZE + len(self._get_log_segment(last_segment))
+
+    def get_log_entry(self, index: int) -> LogEntry:
+        if self.is_log_loaded:
+            return super().get_log_entry(index)
+        segment, position = divmod(index, LOG_SEGMENT_SIZE)
+        return self._get_log_segment(segment)[position]
+
+    def add_log_entry(self, entry: LogEntry):
+        if self.is_log_loaded:
+            super().add_log_entry(entry)
+            return
+        segment = self.log_length // LOG_SEGMENT_SIZE
+        if segment == self._num_log_segments:
+            self._log_segments[segment] = []
+            self._num_log_segments += 1
+        self._log_segments[segment].append(entry)
+
+    def get_loaded_log_segments(self) -> dict[int, list[LogEntry]]:
+        """Прочитанные или дописанные сегменты истории"""
+        if self.is_log_loaded:
+            return split_log(self.change_log)
+        return dict(self._log_segments)
+
+    def __getattr__(self, name: str) -> Any:
+        if name == 'change_log':
+            entries = [entry for segment in range(self._num_log_segments) for entry in self._get_log_segment(segment)]
+            self.__dict__['change_log'] = entries
+            return entries
+        if name not in LIST_SECTIONS:
+            raise AttributeError(name)
+        value, errors = self.__fields__[name].validate(self._read(name, name), {}, loc=name, cls=World)
+        if errors:
+            raise ValueError(f'Не удалось прочитать {name}: {errors}')
+        self.__dict__[name] = value
+        return value
+
+    def load_all(self) -> World:
+        """Читает все секции, после этого мир можно целиком сериализовать"""
+        for field_name in (*LIST_SECTIONS, 'change_log'):
+            getattr(self, field_name)
+        for layer in self.layers.values():
+            if isinstance(layer, Layer):
+                layer.chunks.values()
+        return self
+
+    @property
+    def loaded_layer_names(self) -> list[str]:
+        return list(self.__dict__['layers'].get_loaded())
+
+    def _get_sections(self, changed_only: bool) -> dict[str, str]:
+        sections = {META_SECTION: get_meta_section(self)}
+        for field_name in LIST_SECTIONS:
+            if field_name in self.__dict__:
+                sections[field_name] = dump_section(self.__dict__[field_name])
+        for layer_name in self.loaded_layer_names:
+            sections.update(self._get_layer_sections(layer_name, changed_only))
+        for segment, entries in self.get_loaded_log_segments().items():
+            sections[get_log_section_name(segment)] = dump_section(entries)
+        return sections
+
+    def get_loaded_sections(self) -> dict[str, str]:
+        """Секции прочитанных или созданных частей мира, остальные не могли измениться"""
+        return self._get_sections(changed_only=False)
+
+    def get_changed_sections(self) -> dict[str, str]:
+        """
+        Прочитанные или созданные секции, содержимое которых отличается от хранилища.
+        Мир в старой схеме читается целиком, чтобы в хранилище не осталось секций старой схемы
+        """
+        if self._stored_schema_version < SCHEMA_VERSION:
+            self.load_all()
+        sections = self._get_sections(changed_only=True)
+        return {
+            name: section for name, section in sections.items()
+            if self._section_hashes.get(name) != hash(section)
+        }
+
+    def mark_saved(self, sections: dict[str, str], stored_state: Any = None):
+        """:param stored_state: состояние мира в хранилище после сохранения"""
+        if stored_state is not None:
+            self._stored_state = stored_state
+        self._section_hashes.update({name: hash(section) for name, section in sections.items()})
+        for layer_name in self.loaded_layer_names:
+            layer = self.layers[layer_name]
+            if isinstance(layer, SparseLayer):
+                continue
+            for chunk_position, chunk in get_loaded_chunks(layer).items():
+                chunk_section_name = get_chunk_section_name(layer_name, chunk_position)
+                if chunk_section_name in sections:
+                    self._chunk_fingerprints[chunk_section_name] = get_chunk_fingerprint(chunk)
+        if META_SECTION in sections:
+            self._stored_schema_version = SCHEMA_VERSION
+
@@ -0,0 +1,145 @@
+"""
+Миграции сохраненных миров между версиями схемы World.schema_version.
+Миграция - функция, которая переводит сырые данные одной части мира (еще не прочитанные моделью)
+из версии version - 1 в версию version. Миграции применяются при чтении мира, поэтому мир, сохраненный
+в старой схеме, читается без подготовки, а при следующем сохранении записывается уже в новой.
+Миграции должны быть идемпотентны: мир, прерванный посреди записи, может получить ту же миграцию повторно.
+
+Чтобы поменять схему: повысить SCHEMA_VERSION в model.py и зарегистрировать здесь миграции новой версии
+"""
+from typing import Any, Callable
+
+from app.world_creator.model import CHUNK_SIZE, SCHEMA_VERSION, SPARSE_LAYER_NAMES
+from app.world_creator.utils import get_chunk_from_position, get_chunk_shape
+
+#: Части мира, у каждой свои миграции.
+#: META - общие данные, у мира одним файлом вместе со всеми остальными полями
+META = 'meta'
+LIST_PARTS = ('races', 'cities', 'events')
+LAYER = 'layer'
+LOG_ENTRY = 'log_entry'
+PARTS = (META, *LIST_PARTS, LAYER, LOG_ENTRY)
+
+#: Миграции по версиям, в которые они переводят данные, и частям мира
+MIGRATIONS: dict[int, dict[str, Callable[[Any], Any]]] = {}
+
+
+def migration(version: int, part: str):
+    """Регистрирует миграцию части мира part в версию version"""
+    def register(function: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        if part not in PARTS:
+            raise ValueError(f'Неизвестная часть мира {part}')
+        if not 0 < version <= SCHEMA_VERSION:
+            raise ValueError(f'Версия миграции {version} вне схемы 1..{SCHEMA_VERSION}')
+        if part in MIGRATIONS.get(version, {}):
+            raise ValueError(f'Миграция {part} в версию {version} уже зарегистрирована')
+        MIGRATIONS.setdefault(version, {})[part] = function
+        return function
+    return register
+
+
+def get_schema_version(meta: dict) -> int:
+    """Миры, сохраненные до появления версий, имеют версию 0"""
+    version = meta.get('schema_version', 0)
+    if version > SCHEMA_VERSION:
+        raise ValueError(f'Мир сохранен в схеме {version}, новее поддерживаемой {SCHEMA_VERSION}')
+    return version
+
+
+def migrate(part: str, data: Any, from_version: int) -> Any:
+    """Переводит данные части мира из версии from_version в текущую"""
+    for version in range(from_version + 1, SCHEMA_VERSION + 1):
+        function = MIGRATIONS.get(version, {}).get(part)
+        if function is not None:
+            data = function(data)
+    if part == META and from_version < SCHEMA_VERSION:
+        data = {**data, 'schema_version': SCHEMA_VERSION}
+    return data
+
+
+def migrate_world(data: dict) -> dict:
+    """Переводит в текущую версию мир одним словарем: мир одним файлом или собранный из снимка"""
+    version = get_schema_version(data)
+    if version == SCHEMA_VERSION:
+        return data
+
+    data = migrate(META, data, version)
+    for part in LIST_PARTS:
+        if part in data:
+            data[part] = migrate(part, data[part], version)
+    data['layers'] = {
+        layer_name: migrate(LAYER, layer, version) for layer_name, layer in data.get('layers', {}).items()
+    }
+    data['change_log'] = [migrate(LOG_ENTRY, entry, version) for entry in data.get('change_log', [])]
+    return data
+
+
+@migration(1, LOG_ENTRY)
+def convert_log_message(entry: Any) -> Any:
+    """До появления эпохи и раунда в записях история хранилась строками"""
+    if isinstance(entry, str):
+        return {'message': entry}
+    return entry
+
+
+def _is_sparse_layer(layer: dict) -> bool:
+    return layer['layer_name'] in [layer_name.value for layer_name in SPARSE_LAYER_NAMES]
+
+
+@migration(2, LAYER)
+def convert_flat_tiles(layer: dict) -> dict:
+    """
+    Миры, сохраненные до появления чанков, хранят тайлы слоя одним списком.
+    Слои-накладки сразу переводятся в разреженные миграцией версии 3
+    """
+    if 'tiles' not in layer or _is_sparse_layer(layer):
+        return layer
+
+    layer = dict(layer)
+    tiles = layer.pop('tiles')
+    width, height = layer['shape']
+    chunk_size = layer.setdefault('chunk_size', CHUNK_SIZE)
+    chunks: dict[int, dict[str, Any]] = {}
+    for position in range(width * height):
+        chunk_position, local_position = get_chunk_from_position(position, width, chunk_size)
+        chunk = chunks.setdefault(chunk_position, {
+            'shape': get_chunk_shape(chunk_position, (width, height), chunk_size),
+            'tiles': {},
+        })
+        chunk['tiles'][local_position] = {'position': position}
+    for tile in tiles:
+        chunk_position, local_position = get_chunk_from_position(tile['position'], width, chunk_size)
+        chunks[chunk_position]['tiles'][local_position] = tile
+    for chunk in chunks.values():
+        chunk['tiles'] = [chunk['tiles'][i] for i in sorted(chunk['tiles'])]
+
+    layer['chunks'] = chunks
+    return layer
+
+
+def _is_empty_tile_data(tile: dict) -> bool:
+    # поля тайла на момент миграции, а не текущей модели
+    return all(tile.get(key) is None for key in ('image_ref', 'creator', 'name'))
+
+
+@migration(3, LAYER)
+def convert_to_sparse_layer(layer: dict) -> dict:
+    """
+    Миры, сохраненные до появления разреженных слоев, не хранят тип слоя,
+    а в слоях-накладках хранят все тайлы списком или чанками
+    """
+    if 'layer_type' in layer:
+        return layer
+    if not _is_sparse_layer(layer):
+        return {**layer, 'layer_type': 'chunked'}
+
+    layer = dict(layer)
+    tiles = layer.pop('tiles', None)
+    chunks = layer.pop('chunks', None)
+    layer.pop('chunk_size', None)
+    if chunks is not None:
+        tiles = [tile for chunk in chunks.values() for tile in chunk['tiles']]
+    if tiles is not None:
+        layer['filled_tiles'] = {tile['position']: tile for tile in tiles if not _is_empty_tile_data(tile)}
+    layer['layer_type'] = 'sparse'
+    return layer
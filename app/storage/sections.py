@@ -0,0 +1,148 @@
+"""
+Разбиение мира на секции - единая схема для хранилища, снимков, архивов и проверки целостности.
+Секции: общие данные meta, списки races, cities, events, заголовок каждого слоя layers/{слой},
+чанки слоев layers/{слой}/{чанк} и сегменты истории change_log/{сегмент}.
+Одно действие в игре меняет лишь несколько секций, остальные остаются теми же строками
+"""
+import hashlib
+import json
+from typing import Any, Iterable
+
+from pydantic.json import pydantic_encoder
+
+from app.storage.migrations import migrate_world
+from app.world_creator.model import CHUNK_SIZE, LAYERS, LogEntry, SparseLayer, World
+from app.world_creator.utils import get_chunk_from_position
+
+META_SECTION = 'meta'
+#: Поля мира, которые хранятся отдельными секциями целиком
+LIST_SECTIONS = ('races', 'cities', 'events')
+LAYER_SECTION_PREFIX = 'layers/'
+LOG_SECTION_PREFIX = 'change_log/'
+#: Количество записей истории мира в одном сегменте
+LOG_SEGMENT_SIZE = 64
+
+
+def dump_section(data: Any) -> str:
+    return json.dumps(data, default=pydantic_encoder, ensure_ascii=False, sort_keys=True)
+
+
+def get_section_hash(section: str) -> str:
+    return hashlib.sha1(section.encode()).hexdigest()
+
+
+def get_section_group(key: str) -> str:
+    """Секции одной группы появляются в мире и пропадают из него вместе: слой с его чанками или вся история"""
+    if key.startswith(LAYER_SECTION_PREFIX):
+        return LAYER_SECTION_PREFIX + key[len(LAYER_SECTION_PREFIX):].split('/')[0]
+    if key.startswith(LOG_SECTION_PREFIX):
+        return LOG_SECTION_PREFIX
+    return key
+
+
+def get_child_sections(section_names: Iterable[str], prefix: str) -> list[str]:
+    """Секции, лежащие прямо в группе prefix, например слои мира или чанки одного слоя"""
+    return sorted(
+        name for name in section_names
+        if name.startswith(prefix) and '/' not in name[len(prefix):]
+    )
+
+
+def get_layer_section_name(layer_name: str) -> str:
+    return f'{LAYER_SECTION_PREFIX}{layer_name}'
+
+
+def get_chunk_section_name(layer_name: str, chunk_position: int) -> str:
+    return f'{LAYER_SECTION_PREFIX}{layer_name}/{chunk_position}'
+
+
+def get_log_section_name(segment: int) -> str:
+    return f'{LOG_SECTION_PREFIX}{segment}'
+
+
+def split_log(entries: list[LogEntry]) -> dict[int, list[LogEntry]]:
+    """Сегменты истории по номерам"""
+    return {
+        start // LOG_SEGMENT_SIZE: entries[start:start + LOG_SEGMENT_SIZE]
+        for start in range(0, len(entries), LOG_SEGMENT_SIZE)
+    }
+
+
+def get_meta_section(world: World) -> str:
+    """Общие данные мира: все, что не хранится отдельными секциями"""
+    return dump_section(world.dict(exclude={'layers', 'change_log', *LIST_SECTIONS}))
+
+
+def get_layer_chunks(layer: LAYERS) -> dict[int, Any]:
+    """Части слоя, которые хранятся отдельными секциями: чанки или заданные тайлы разреженного слоя по чанкам"""
+    if not isinstance(layer, SparseLayer):
+        return layer.chunks
+    chunks: dict[int, dict[int, Any]] = {}
+    for position, tile in layer.filled_tiles.items():
+        chunk_position, _ = get_chunk_from_position(position, layer.shape[0], CHUNK_SIZE)
+        chunks.setdefault(chunk_position, {})[position] = tile
+    return chunks
+
+
+def get_layer_header(layer: LAYERS) -> str:
+    """Слой без тайлов: название, размер и тип"""
+    return dump_section(layer.dict(exclude={'chunks', 'filled_tiles'}))
+
+
+def get_layer_sections(layer_name: str, layer: LAYERS) -> dict[str, str]:
+    """Заголовок слоя и каждый его чанк, изменение одного тайла переписывает только его чанк"""
+    sections = {get_layer_section_name(layer_name): get_layer_header(layer)}
+    for chunk_position, chunk in get_layer_chunks(layer).items():
+        sections[get_chunk_section_name(layer_name, chunk_position)] = dump_section(chunk)
+    return sections
+
+
+def is_whole_layer(header: dict) -> bool:
+    """Слой, сохраненный до разбиения на секции по чанкам, лежит в заголовке целиком"""
+    return any(key in header for key in ('tiles', 'chunks', 'filled_tiles'))
+
+
+def join_layer(header: dict, chunks: dict[int, Any]) -> dict:
+    """Данные слоя из заголовка и чанков"""
+    if is_whole_layer(header):
+        return header
+    if header['layer_type'] == 'sparse':
+        return {**header, 'filled_tiles': {
+            position: tile for tiles in chunks.values() for position, tile in tiles.items()
+        }}
+    return {**header, 'chunks': chunks}
+
+
+def split_world(world: World) -> dict[str, str]:
+    """Все секции мира: общие данные, списки, слои по чанкам и сегменты истории"""
+    sections = {META_SECTION: get_meta_section(world)}
+    for name in LIST_SECTIONS:
+        sections[name] = dump_section(getattr(world, name))
+    for layer_name, layer in world.layers.items():
+        sections.update(get_layer_sections(layer_name, layer))
+    for segment, entries in split_log(world.change_log).items():
+        sections[get_log_section_name(segment)] = dump_section(entries)
+    return sections
+
+
+def join_world(sections: dict[str, str]) -> World:
+    """Обратное преобразование к split_world, мир старой схемы переводится в текущую"""
+    world_data = json.loads(sections[META_SECTION])
+    for name in LIST_SECTIONS:
+        if name in sections:
+            world_data[name] = json.loads(sections[name])
+
+    world_data['layers'] = {}
+    for section_name in get_child_sections(sections, LAYER_SECTION_PREFIX):
+        chunks = {
+            int(chunk_section_name.rsplit('/', 1)[1]): json.loads(sections[chunk_section_name])
+            for chunk_section_name in get_child_sections(sections, f'{section_name}/')
+        }
+        layer_name = section_name[len(LAYER_SECTION_PREFIX):]
+        world_data['layers'][layer_name] = join_layer(json.loads(sections[section_name]), chunks)
+
+    segments = sorted(int(name[len(LOG_SECTION_PREFIX):]) for name in get_child_sections(sections, LOG_SECTION_PREFIX))
+    world_data['change_log'] = [
+        entry for segment in segments for entry in json.loads(sections[get_log_section_name(segment)])
+    ]
+    return World.parse_obj(migrate_world(world_data))
@@ -0,0 +1,188 @@
+import shutil
+from pathlib import Path
+from typing import Optional
+
+from pydantic import Field
+
+from app.storage.lazy_world import LazyWorld
+from app.storage.sections import (
+    LAYER_SECTION_PREFIX,
+    LOG_SECTION_PREFIX,
+    get_section_group,
+    get_section_hash,
+    join_world,
+    split_world,
+)
+from app.world_creator.base_model import BaseModel
+from app.world_creator.model import World
+
+#: Сколько последних сохранений мира хранится, снимок делается при каждом сохранении с изменениями
+MAX_SNAPSHOTS = 200
+#: Префиксы секций в снимках, сделанных, пока у снимков была своя схема секций
+LEGACY_SECTION_PREFIXES = {'layer/': LAYER_SECTION_PREFIX, 'log/': LOG_SECTION_PREFIX}
+
+
+class Snapshot(BaseModel):
+    n_era: int = Field(...)
+    n_round: int = Field(...)
+    log_length: int = Field(..., description='Количество записей истории мира на момент снимка')
+    sections: dict[str, Optional[str]] = Field(
+        {}, description='Хеши секций, которые изменились с предыдущего снимка, None - секция удалена. '
+                        'Самый старый снимок хранит хеши всех секций'
+    )
+
+
+class SnapshotHistory(BaseModel):
+    snapshots: list[Snapshot] = Field([])
+
+
+def rename_legacy_section(key: str) -> str:
+    for legacy_prefix, prefix in LEGACY_SECTION_PREFIXES.items():
+        if key.startswith(legacy_prefix):
+            return prefix + key[len(legacy_prefix):]
+    return key
+
+
+class SnapshotStore:
+    def __init__(self, directory: Path):
+        """
+        Кольцевой буфер снимков мира.
+        Секции мира хранятся один раз по хешу содержимого и переиспользуются всеми снимками,
+        а каждый снимок записывает только хеши изменившихся секций
+        """
+        self.directory = directory
+        self.blobs_dir = directory / 'blobs'
+        self.history_file = directory / 'history.json'
+
+    def load_history(self) -> SnapshotHistory:
+        if not self.history_file.exists():
+            return SnapshotHistory()
+        history = SnapshotHistory.parse_file(self.history_file)
+        for snapshot in history.snapshots:
+            snapshot.sections = {rename_legacy_section(key): value for key, value in snapshot.sections.items()}
+        return history
+
+    def _save_history(self, history: SnapshotHistory):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.history_file, 'w') as f:
+            f.write(history.json())
+
+    def _write_section(self, section_hash: str, section: str):
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        path = self.blobs_dir / f'{section_hash}.json'
+        if not path.exists():
+            path.write_text(section)
+
+    def _read_section(self, section_hash: str) -> str:
+        return (self.blobs_dir / f'{section_hash}.json').read_text()
+
+    @staticmethod
+    def get_manifest(history: SnapshotHistory, index: int) -> dict[str, str]:
+        """Хеши всех секций мира на момент снимка index"""
+        manifest: dict[str, str] = {}
+        for snapshot in history.snapshots[:index % len(history.snapshots) + 1]:
+            for key, section_hash in snapshot.sections.items():
+                if section_hash is None:
+                    manifest.pop(key, None)
+                else:
+                    manifest[key] = section_hash
+        return manifest
+
+    def record(self, world: World, saved_sections: Optional[dict[str, str]] = None) -> bool:
+        """
+        Делает снимок мира, если с прошлого снимка что-то изменилось.
+        У частично прочитанного мира сравниваются только прочитанные части, остальные не могли измениться
+        :param saved_sections: секции, которые только что записаны в хранилище, см. Storage.save_world.
+            Снимок строится из них, без повторной сериализации прочитанных частей мира
+        :return: был ли сделан снимок
+        """
+        history = self.load_history()
+        is_lazy = isinstance(world, LazyWorld)
+        # первый снимок хранит все секции, а записанные секции частично прочитанного мира - только изменившиеся
+        if saved_sections is not None and (history.snapshots or not is_lazy):
+            sections = saved_sections
+        else:
+            if isinstance(world, LazyWorld) and not history.snapshots:
+                world.load_all()
+            sections = world.get_loaded_sections() if isinstance(world, LazyWorld) else split_world(world)
+
+        manifest = self.get_manifest(history, -1) if history.snapshots else {}
+        changed_sections: dict[str, Optional[str]] = {}
+        for key, section in sections.items():
+            section_hash = get_section_hash(section)
+            if manifest.get(key) != section_hash:
+                self._write_section(section_hash, section)
+                changed_sections[key] = section_hash
+
+        # по записанным секциям частично прочитанного мира не видно удаленных, но он секции и не удаляет
+        if not (is_lazy and sections is saved_sections):
+            # у частично прочитанной истории нет старых сегментов, но они не удалены
+            is_log_loaded = 'change_log' in world.__dict__
+            split_groups = {get_section_group(key) for key in sections} - {LOG_SECTION_PREFIX}
+            if is_log_loaded:
+                split_groups.add(LOG_SECTION_PREFIX)
+            for key in manifest.keys() - sections.keys():
+                if get_section_group(key) in split_groups:
+                    changed_sections[key] = None
+        if history.snapshots and not changed_sections:
+            return False
+
+        history.snapshots.append(Snapshot(
+            n_era=world.n_era,
+            n_round=world.n_round,
+            log_length=world.log_length,
+            sections=changed_sections,
+        ))
+        if len(history.snapshots) > MAX_SNAPSHOTS:
+            history.snapshots[1].sections = dict(self.get_manifest(history, 1))
+            history.snapshots.pop(0)
+            self._remove_unused_sections(history)
+        self._save_history(history)
+        return True
+
+    def _remove_unused_sections(self, history: SnapshotHistory):
+        used_hashes = {
+            section_hash
+            for snapshot in history.snapshots
+            for section_hash in snapshot.sections.values()
+            if section_hash is not None
+        }
+        for path in self.blobs_dir.glob('*.json'):
+            if path.stem not in used_hashes:
+                path.unlink()
+
+    def get_world(self, history: SnapshotHistory, index: int) -> World:
+        manifest = self.get_manifest(history, index)
+        return join_world({key: self._read_section(section_hash) for key, section_hash in manifest.items()})
+
+    def undo(self) -> Optional[World]:
+        """
+        Удаляет снимки, сделанные после последнего записанного в историю мира действия
+        :return: мир до этого действия, None если отменять нечего
+        """
+        history = self.load_history()
+        if not history.snapshots:
+            return None
+        last_log_length = history.snapshots[-1].log_length
+        while history.snapshots and history.snapshots[-1].log_length == last_log_length:
+            history.snapshots.pop()
+        if not history.snapshots:
+            return None
+
+        self._save_history(history)
+        self._remove_unused_sections(history)
+        return self.get_world(history, -1)
+
+    def get_world_at_round(self, n_era: int, n_round: int) -> Optional[World]:
+        """Мир на конец раунда n_round эпохи n_era, None если такого снимка уже нет"""
+        history = self.load_history()
+        indexes = [
+            i for i, snapshot in enumerate(history.snapshots)
+            if (snapshot.n_era, snapshot.n_round) <= (n_era, n_round)
+        ]
+        if not indexes:
+            return None
+        return self.get_world(history, indexes[-1])
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
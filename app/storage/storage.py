@@ -1,23 +1,378 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Iterator, Optional
+import fcntl
+import json
+import os
+import re
+import shutil
 
+from app.storage.archive import WorldArchiveWriter, iter_archive_worlds
+from app.storage.lazy_world import LazyWorld
+from app.storage.migrations import get_schema_version, migrate_world
+from app.storage.sections import LAYER_SECTION_PREFIX, LOG_SECTION_PREFIX, META_SECTION, get_meta_section, split_world
+from app.storage.snapshots import SnapshotStore
 from app.world_creator.model import World
 
 STORAGE_DIR = Path(__file__).parent.parent / 'data' / 'worlds'
+#: Миры называются по id чата, у групп id отрицательные
+WORLD_ID_PATTERN = re.compile(r'-?\d+')
+#: Сколько раз перечитывать мир, который сохраняют во время чтения
+READ_ATTEMPTS = 3
+#: Состояние файла общих данных мира: inode, время изменения и размер. Файл заменяется при каждом сохранении мира
+MetaState = tuple[int, int, int]
+
+
+class WorldChangedError(RuntimeError):
+    """Мир в хранилище изменился или пропал после того, как его начали читать, действие нужно повторить"""
 
 
 class Storage:
-    def __init__(self):
-        self.storage_dir = STORAGE_DIR
+    def __init__(self, storage_dir: Optional[Path] = None):
+        """
+        Каждый мир хранится в своей папке, секции мира (общие данные, слои, расы, города, события, сегменты истории)
+        лежат в отдельных файлах, чтобы их можно было читать и записывать по отдельности.
+        Миры, сохраненные одним файлом {id}.json, читаются целиком и переписываются по секциям при сохранении.
+        Заброшенные миры замораживаются - переносятся в холодное хранилище cold/{id}.tar.gz,
+        и размораживаются при следующем обращении к ним.
+        Поврежденные миры переносятся в карантин quarantine/{id}_{время}.
+        Запись мира блокирует его для других потоков и процессов, дочитывание частично прочитанного мира
+        проверяет, что мир не сохранили заново с момента чтения
+        """
+        self.storage_dir = storage_dir or STORAGE_DIR
+
+    def get_world_dir(self, file_name) -> Path:
+        return self.storage_dir / str(file_name)
+
+    def _get_legacy_path(self, file_name) -> Path:
+        return self.storage_dir / f'{file_name}.json'
+
+    def _get_section_path(self, file_name, section_name: str) -> Path:
+        return self.get_world_dir(file_name) / f'{section_name}.json'
+
+    def _get_cold_dir(self) -> Path:
+        return self.storage_dir / 'cold'
+
+    def _get_cold_path(self, file_name) -> Path:
+        return self._get_cold_dir() / f'{file_name}.tar.gz'
+
+    def get_quarantine_dir(self) -> Path:
+        return self.storage_dir / 'quarantine'
+
+    @contextmanager
+    def lock_world(self, file_name, shared: bool = False) -> Iterator[None]:
+        """
+        Блокировка мира между потоками и процессами: запись мира исключительная, чтение общее.
+        Блокировка не повторная, внутри нее нельзя вызывать методы, которые блокируют тот же мир
+        """
+        path = self.storage_dir / 'locks' / f'{file_name}.lock'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a') as file:
+            fcntl.flock(file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+
+    def get_world_state(self, file_name) -> Optional[MetaState]:
+        """
+        Состояние файла общих данных мира или мира одним файлом, меняется при каждом сохранении.
+        None - мира нет среди обычных, например его заморозили
+        """
+        path = self._get_legacy_path(file_name)
+        if not path.exists():
+            path = self._get_section_path(file_name, META_SECTION)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _check_meta_state(self, file_name, state: MetaState):
+        if self.get_world_state(file_name) != state:
+            raise WorldChangedError(f'Мир {file_name} изменился после чтения, его нужно прочитать заново')
+
+    @contextmanager
+    def _guard_read(self, file_name, state: MetaState) -> Iterator[None]:
+        """Дочитывание мира: секции читаются, только если мир лежит в хранилище в том же виде, в каком его читали"""
+        with self.lock_world(file_name, shared=True):
+            self._check_meta_state(file_name, state)
+            yield
+
+    @staticmethod
+    def _write_file(path: Path, text: str):
+        """Файл заменяется целиком, читатель видит либо старое содержимое, либо новое"""
+        tmp_path = path.with_name(f'{path.name}.tmp')
+        tmp_path.write_text(text)
+        os.replace(tmp_path, path)
+
+    def save_world(self, file_name, world: World, touch: bool = True) -> dict[str, str]:
+        """
+        Записывает секции мира, у частично прочитанного мира только изменившиеся.
+        Общие данные переписываются при любом изменении, по ним читатели узнают, что мир сохранили заново
+        :param touch: отметить в мире время изменения, если что-то изменилось
+        :return: записанные секции по названиям
+        :raises WorldChangedError: мир прочитан из хранилища, а после этого его сохранили заново или заморозили
+        """
+        stored_state = world.stored_state if isinstance(world, LazyWorld) else None
+        # секции собираются до блокировки: мир в старой схеме при этом дочитывается целиком
+        sections = world.get_changed_sections() if isinstance(world, LazyWorld) else split_world(world)
+        if sections and touch:
+            world.set_trusted(last_mutation_at=datetime.now(timezone.utc))
+        if sections:
+            sections[META_SECTION] = get_meta_section(world)
+
+        with self.lock_world(file_name):
+            if stored_state is not None:
+                self._check_meta_state(file_name, stored_state)
+            elif self.is_world_frozen(file_name):
+                self._write_world_sections(file_name, self._read_cold_sections(file_name))
+            for path in {self._get_section_path(file_name, section_name).parent for section_name in sections}:
+                path.mkdir(parents=True, exist_ok=True)
+            # общие данные пишутся последними, по ним определяется что мир сохранен
+            for section_name in sorted(sections, key=lambda name: name == META_SECTION):
+                self._write_file(self._get_section_path(file_name, section_name), sections[section_name])
+            if isinstance(world, LazyWorld):
+                world.mark_saved(sections, self.get_world_state(file_name) if stored_state is not None else None)
+            else:
+                # после отмены действий история мира могла стать короче, а в слоях-накладках - меньше тайлов
+                world_dir = self.get_world_dir(file_name)
+                for path in world_dir.rglob('*.json'):
+                    if path.relative_to(world_dir).with_suffix('').as_posix() not in sections:
+                        path.unlink()
+            self._get_legacy_path(file_name).unlink(missing_ok=True)
+        return sections
+
+    def _load_legacy_world(self, file_name) -> World:
+        return World.parse_obj(migrate_world(json.loads(self._get_legacy_path(file_name).read_text())))
+
+    def load_world(self, file_name) -> World:
+        """Мир, секции которого читаются при первом обращении к ним"""
+        if self._get_legacy_path(file_name).exists():
+            return self._load_legacy_world(file_name)
+
+        with self.lock_world(file_name, shared=True):
+            state = self.get_world_state(file_name)
+            if state is None:
+                raise FileNotFoundError(f'Мир {file_name} не найден')
+            return LazyWorld.from_sections(
+                lambda section_name: self._get_section_path(file_name, section_name).read_text(),
+                lambda prefix: self._list_sections(file_name, prefix),
+                guard_read=lambda stored_state: self._guard_read(file_name, stored_state),
+                stored_state=state,
+            )
+
+    def _list_sections(self, file_name, prefix: str) -> list[str]:
+        """Секции мира, лежащие прямо в группе prefix, см. get_child_sections"""
+        return sorted(f'{prefix}{path.stem}' for path in (self.get_world_dir(file_name) / prefix).glob('*.json'))
+
+    def _get_files_state(self, file_name) -> dict[Path, tuple[int, int]]:
+        return {
+            path: (path.stat().st_mtime_ns, path.stat().st_size)
+            for path in self.get_world_dir(file_name).rglob('*.json')
+        }
+
+    def read_world_sections(self, file_name) -> dict[str, str]:
+        """
+        Все секции мира как они лежат в хранилище. Если мир сохраняют во время чтения, он перечитывается,
+        чтобы секции были от одного сохранения. Мир одним файлом разбивается на секции,
+        замороженный мир читается из холодного хранилища без разморозки
+        """
+        if not self.is_world_hot(file_name) and self.is_world_frozen(file_name):
+            return self._read_cold_sections(file_name)
+        if self._get_legacy_path(file_name).exists():
+            return split_world(self._load_legacy_world(file_name))
+
+        world_dir = self.get_world_dir(file_name)
+        for _ in range(READ_ATTEMPTS):
+            state = self._get_files_state(file_name)
+            if self._get_section_path(file_name, META_SECTION) not in state:
+                raise FileNotFoundError(f'Мир {file_name} не найден')
+            sections = {path.relative_to(world_dir).with_suffix('').as_posix(): path.read_text() for path in state}
+            if self._get_files_state(file_name) == state:
+                return sections
+        raise RuntimeError(f'Мир {file_name} сохраняют во время чтения, прочитать его целиком не удалось')
 
-    def save_world(self, file_name, world: World):
-        with open(self.storage_dir / f'{file_name}.json', 'w') as f:
-            f.write(world.json())
+    def write_world_sections(self, file_name, sections: dict[str, str]):
+        """
+        Заменяет мир секциями целиком, например при восстановлении из архива.
+        Секции сначала пишутся во временную папку, поэтому в хранилище не бывает наполовину записанного мира.
+        Снимки и кэш прежнего мира с этим id удаляются, замороженная копия - только после записи нового мира
+        """
+        with self.lock_world(file_name):
+            self._write_world_sections(file_name, sections)
 
-    def load_world(self, file_name):
-        return World.parse_file(self.storage_dir / f'{file_name}.json')
+    def _write_world_sections(self, file_name, sections: dict[str, str]):
+        tmp_dir = self.storage_dir / f'.tmp_{file_name}_{os.getpid()}'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        for section_name, section in sections.items():
+            path = tmp_dir / f'{section_name}.json'
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(section)
+        (tmp_dir / LAYER_SECTION_PREFIX).mkdir(parents=True, exist_ok=True)
+        (tmp_dir / LOG_SECTION_PREFIX).mkdir(parents=True, exist_ok=True)
+
+        self._remove_hot_world(file_name)
+        os.replace(tmp_dir, self.get_world_dir(file_name))
+        self._get_cold_path(file_name).unlink(missing_ok=True)
+
+    def _remove_hot_world(self, file_name):
+        self._get_legacy_path(file_name).unlink(missing_ok=True)
+        shutil.rmtree(self.get_world_dir(file_name), ignore_errors=True)
+        shutil.rmtree(self.get_cache_dir(file_name), ignore_errors=True)
+        self.get_snapshot_store(file_name).remove()
 
     def remove_world(self, file_name):
-        Path(self.storage_dir / f'{file_name}.json').unlink()
+        with self.lock_world(file_name):
+            self._remove_world(file_name)
+
+    def _remove_world(self, file_name):
+        self._remove_hot_world(file_name)
+        self._get_cold_path(file_name).unlink(missing_ok=True)
+
+    def quarantine_world(self, file_name, reason: str) -> Path:
+        """
+        Убирает поврежденный мир из хранилища в карантин, файлы мира переносятся как есть для разбора вручную,
+        рядом записывается причина. Снимки и кэш удаляются, в чате можно создать новый мир
+        :return: папка мира в карантине
+        """
+        path = self.get_quarantine_dir() / f'{file_name}_{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}'
+        path.mkdir(parents=True)
+        with self.lock_world(file_name):
+            for source in (
+                    self._get_legacy_path(file_name), self.get_world_dir(file_name), self._get_cold_path(file_name)
+            ):
+                if source.exists():
+                    shutil.move(str(source), path / source.name)
+            (path / 'reason.txt').write_text(reason)
+            self._remove_world(file_name)
+        return path
+
+    def is_world_hot(self, file_name) -> bool:
+        return (
+            self._get_section_path(file_name, META_SECTION).exists()
+            or self._get_legacy_path(file_name).exists()
+        )
+
+    def is_world_frozen(self, file_name) -> bool:
+        return self._get_cold_path(file_name).exists()
 
     def is_world_exist(self, file_name):
-        return f'{file_name}.json' in [f.name for f in self.storage_dir.glob('*.json')]
\ No newline at end of file
+        return self.is_world_hot(file_name) or self.is_world_frozen(file_name)
+
+    def freeze_world(self, file_name, expected_state: Optional[MetaState] = None) -> int:
+        """
+        Переносит мир в холодное хранилище одним сжатым архивом.
+        Архив пишется без блокировки мира, а перед удалением мира из обычного хранилища проверяется,
+        что его не сохранили заново, пока писался архив.
+        Снимки для отмены действий и кэш не сохраняются, после разморозки история отмен начинается заново
+        :param expected_state: состояние мира, при котором решили его заморозить, см. get_world_state
+        :return: размер архива в байтах
+        :raises WorldChangedError: мир сохранили после expected_state или во время заморозки, он не заморожен
+        """
+        with self.lock_world(file_name, shared=True):
+            state = self.get_world_state(file_name)
+            if state is None:
+                raise FileNotFoundError(f'Мир {file_name} не найден среди обычных')
+            if expected_state is not None and state != expected_state:
+                raise WorldChangedError(f'Мир {file_name} изменился после того, как его решили заморозить')
+            sections = self.read_world_sections(file_name)
+        cold_path = self._get_cold_path(file_name)
+        tmp_path = cold_path.with_name(f'{cold_path.name}.new')
+        self._write_archive(tmp_path, file_name, sections)
+
+        with self.lock_world(file_name):
+            if self.get_world_state(file_name) != state:
+                tmp_path.unlink()
+                raise WorldChangedError(f'Мир {file_name} сохранили во время заморозки')
+            os.replace(tmp_path, cold_path)
+            self._remove_hot_world(file_name)
+        return cold_path.stat().st_size
+
+    @staticmethod
+    def _write_archive(path: Path, file_name, sections: dict[str, str]):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'{path.name}.tmp')
+        with open(tmp_path, 'wb') as file, WorldArchiveWriter(file) as writer:
+            writer.add_world(int(file_name), sections)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_archive(path: Path) -> dict[str, str]:
+        with open(path, 'rb') as file:
+            archived, = iter_archive_worlds(file)
+        archived.manifest.verify(archived.sections)
+        return archived.sections
+
+    def _read_cold_sections(self, file_name) -> dict[str, str]:
+        return self._read_archive(self._get_cold_path(file_name))
+
+    def thaw_world(self, file_name):
+        """Возвращает замороженный мир в обычное хранилище"""
+        with self.lock_world(file_name):
+            if self.is_world_frozen(file_name):
+                self._write_world_sections(file_name, self._read_cold_sections(file_name))
+
+    def is_world_legacy(self, file_name) -> bool:
+        return self._get_legacy_path(file_name).exists()
+
+    def get_stored_schema_version(self, file_name) -> int:
+        """Версия схемы, в которой мир лежит в хранилище, без чтения мира моделью"""
+        path = self._get_legacy_path(file_name)
+        if not path.exists():
+            path = self._get_section_path(file_name, META_SECTION)
+        return get_schema_version(json.loads(path.read_text()))
+
+    def backup_world(self, file_name, backup_dir: Path) -> Path:
+        """Копия мира в том виде, в котором он лежит в хранилище: файл мира одним файлом или архив секций"""
+        if self.is_world_legacy(file_name):
+            backup_dir.mkdir(parents=True, exist_ok=True)
+            path = backup_dir / f'{file_name}.json'
+            shutil.copyfile(self._get_legacy_path(file_name), path)
+            return path
+        path = backup_dir / f'{file_name}.tar.gz'
+        self._write_archive(path, file_name, self.read_world_sections(file_name))
+        return path
+
+    def restore_world(self, file_name, backup_dir: Path):
+        """Возвращает мир из копии backup_world, снимки для отмены действий сделаны после копии и удаляются"""
+        legacy_backup = backup_dir / f'{file_name}.json'
+        if legacy_backup.exists():
+            self.remove_world(file_name)
+            shutil.copyfile(legacy_backup, self._get_legacy_path(file_name))
+        else:
+            self.write_world_sections(file_name, self._read_archive(backup_dir / f'{file_name}.tar.gz'))
+
+    @staticmethod
+    def get_backup_world_ids(backup_dir: Path) -> list[int]:
+        names = {path.name.split('.')[0] for path in backup_dir.glob('*.json')}
+        names.update(path.name.split('.')[0] for path in backup_dir.glob('*.tar.gz'))
+        return sorted(int(name) for name in names if WORLD_ID_PATTERN.fullmatch(name))
+
+    def get_world_ids(self, include_frozen: bool = False) -> list[int]:
+        """id всех сохраненных миров, и записанных по секциям, и одним файлом"""
+        if not self.storage_dir.exists():
+            return []
+        names = {path.name for path in self.storage_dir.iterdir() if (path / f'{META_SECTION}.json').exists()}
+        names.update(path.stem for path in self.storage_dir.glob('*.json'))
+        if include_frozen:
+            names.update(path.name[:-len('.tar.gz')] for path in self._get_cold_dir().glob('*.tar.gz'))
+        return sorted(int(name) for name in names if WORLD_ID_PATTERN.fullmatch(name))
+
+    def get_modified_at(self, file_name) -> datetime:
+        """Время последней записи общих данных мира"""
+        path = self._get_legacy_path(file_name)
+        if not path.exists():
+            path = self._get_section_path(file_name, META_SECTION)
+        return datetime.fromtimestamp(path.stat().st_mtime, timezone.utc)
+
+    def get_world_size(self, file_name) -> int:
+        """Сколько байт мир занимает на диске, без снимков и кэша"""
+        if self._get_legacy_path(file_name).exists():
+            return self._get_legacy_path(file_name).stat().st_size
+        return sum(path.stat().st_size for path in self.get_world_dir(file_name).rglob('*.json'))
+
+    def get_snapshot_store(self, file_name) -> SnapshotStore:
+        return SnapshotStore(self.storage_dir / 'snapshots' / str(file_name))
+
+    def get_cache_dir(self, file_name) -> Path:
+        """Папка для файлов, которые можно построить заново по миру"""
+        return self.storage_dir / 'cache' / str(file_name)
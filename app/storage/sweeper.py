@@ -0,0 +1,92 @@
+"""
+Заморозка заброшенных миров: миры, которые давно не менялись, и созданные миры, в которые перестали заходить,
+переносятся в холодное хранилище, чтобы в обычном хранилище оставались только миры, в которые играют
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from app.storage.storage import MetaState, Storage, WorldChangedError
+from app.world_creator.model import World
+
+logger = logging.getLogger(__name__)
+
+#: Сколько мир может не меняться, прежде чем его заморозят
+MAX_IDLE = timedelta(days=30)
+#: То же для миров, создание которых закончено, в них уже ничего не меняется
+FINISHED_MAX_IDLE = timedelta(days=1)
+SWEEP_INTERVAL = timedelta(hours=6)
+
+
+def get_last_mutation_at(storage: Storage, world_id: int, world: World) -> datetime:
+    """Миры, сохраненные до появления World.last_mutation_at, менялись тогда же, когда был записан файл"""
+    return world.last_mutation_at or storage.get_modified_at(world_id)
+
+
+def find_abandoned_worlds(
+        storage: Storage,
+        now: datetime,
+        max_idle: timedelta = MAX_IDLE,
+        finished_max_idle: timedelta = FINISHED_MAX_IDLE,
+) -> dict[int, MetaState]:
+    """
+    Миры, которые пора заморозить, у каждого читаются только общие данные
+    :return: id миров и их состояния в хранилище, с которыми их решили заморозить
+    """
+    abandoned = {}
+    for world_id in storage.get_world_ids():
+        try:
+            # состояние берется до чтения: если мир сохранят в промежутке, заморозка его пропустит
+            state = storage.get_world_state(world_id)
+            world = storage.load_world(world_id)
+            idle = now - get_last_mutation_at(storage, world_id, world)
+        except Exception:
+            logger.exception('Не удалось прочитать мир %s', world_id)
+            continue
+        if state is not None and idle > (finished_max_idle if world.is_creation_end else max_idle):
+            abandoned[world_id] = state
+    return abandoned
+
+
+def sweep(
+        storage: Storage,
+        now: Optional[datetime] = None,
+        max_idle: timedelta = MAX_IDLE,
+        finished_max_idle: timedelta = FINISHED_MAX_IDLE,
+) -> list[int]:
+    """
+    Замораживает заброшенные миры, мир, который не удалось заморозить, остается в обычном хранилище.
+    Мир, который сохранили после того, как его сочли заброшенным, не замораживается
+    :return: id замороженных миров
+    """
+    frozen = []
+    abandoned = find_abandoned_worlds(storage, now or datetime.now(timezone.utc), max_idle, finished_max_idle)
+    for world_id, state in abandoned.items():
+        try:
+            num_bytes = storage.freeze_world(world_id, state)
+        except WorldChangedError:
+            logger.info('В мир %s вернулись, он не заморожен', world_id)
+            continue
+        except Exception:
+            logger.exception('Не удалось заморозить мир %s', world_id)
+            continue
+        logger.info('Мир %s заморожен, %s байт', world_id, num_bytes)
+        frozen.append(world_id)
+    return frozen
+
+
+async def run_sweeper(
+        storage: Storage,
+        interval: timedelta = SWEEP_INTERVAL,
+        max_idle: timedelta = MAX_IDLE,
+        finished_max_idle: timedelta = FINISHED_MAX_IDLE,
+):
+    """Фоновая задача бота: периодически замораживает заброшенные миры, работа с диском идет вне цикла событий"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, sweep, storage, None, max_idle, finished_max_idle)
+        except Exception:
+            logger.exception('Ошибка при заморозке заброшенных миров')
+        await asyncio.sleep(interval.total_seconds())
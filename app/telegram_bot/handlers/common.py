@@ -6,6 +6,7 @@ from aiogram.dispatcher.filters import Text
 from app.telegram_bot.keyboards import get_one_button_keyboard
 from app.telegram_bot.handlers.world import CB_CREATE_WORLD
 from app.telegram_bot.utils import get_god_controller
+from app.storage.storage import WorldChangedError
 
 STATIC_DIR = Path(__file__).parent.parent.parent / 'data' / 'static'
 CMD_CANCEL = 'cancel'
@@ -22,6 +23,7 @@ def register_handlers_common(dp: Dispatcher):
     dp.register_message_handler(cmd_help, commands=CMD_HELP, state="*")
     dp.register_message_handler(cmd_cancel, commands=CMD_CANCEL, state="*")
     dp.register_message_handler(cmd_cancel, Text(equals="отмена", ignore_case=True), state="*")
+    dp.register_errors_handler(world_changed_error, exception=WorldChangedError)
 
 
 async def cmd_help(message: types.Message):
@@ -31,6 +33,10 @@ async def cmd_help(message: types.Message):
         caption='Это бот для игры в "Рассвет миров".\n'
                 'Доступные команды:\n'
                 '/world_info - Получение информации о мире (управление миром для администраторов).\n'
+                '/story [эпоха раунд] - Последние записи истории мира или записи за раунд.\n'
+                '/timelapse - Анимация того, как менялась карта мира.\n'
+                '/route [город, город] - Расстояния между городами или маршрут между двумя городами.\n'
+                '/search <слова> [бог:имя раса:название эпоха:N тайл:N] - Поиск по истории мира, событиям и расам.\n'
                 '/god_info - Получение информации о вашем боге, и возможности управлять им если сейчас ваш ход.\n'
                 '/cancel - Отмена действий.\n',
         reply=False
@@ -57,3 +63,13 @@ async def cmd_cancel(message: types.Message, state: FSMContext):
 
 async def no_state_callback(call: types.CallbackQuery):
     await call.answer('Это не ваша кнопка, поищите себе другую)')
+
+
+async def world_changed_error(update: types.Update, exception: WorldChangedError):
+    """Мир сохранили заново, пока обрабатывалось действие, изменения действия не записаны"""
+    text = 'Пока вы действовали, мир изменился. Повторите действие'
+    if update.callback_query:
+        await update.callback_query.answer(text, show_alert=True)
+    elif update.message:
+        await update.message.answer(text)
+    return True
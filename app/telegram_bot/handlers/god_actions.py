@@ -1,12 +1,16 @@
-from typing import Union
+import asyncio
+from typing import Optional, Union
 
 from aiogram import types, Dispatcher
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text
 from aiogram.dispatcher.filters.state import StatesGroup, State
 from aiogram.types import InlineKeyboardButton as Button
+from aiogram.utils.exceptions import MessageNotModified, MessageToEditNotFound
 
 from app.telegram_bot.utils import (
+    TURN_SCHEDULER,
+    TURN_TIMEOUT_HOURS,
     get_god_controller,
     get_race_controller,
     get_god_action_controller,
@@ -14,11 +18,11 @@ from app.telegram_bot.utils import (
     remove_buttons_from_current_message_with_buttons,
     is_position_incorrect
 )
-from app.world_creator.controller import GodActionController
+from app.world_creator.controller import GodActionController, GodController
 
 from app.world_creator.tiles import LandType
 from app.world_creator.tiles import ClimateType
-from app.world_creator.model import Actions, LayerName
+from app.world_creator.model import Actions, LayerName, World
 
 CB_END_ACTION = 'end_action'
 CB_SPEND_FORCE = 'spend_force'
@@ -229,7 +233,7 @@ class AddTileOrder(StatesGroup):
         self.form_tile_function(controller, land_type_str, user_data["tile_num"])
 
         await call.message.reply_photo(
-            photo=convert_image(controller.render_map(self.LAYER_NAME.value)),
+            photo=convert_image(controller.render_preview(user_data['tile_num'], self.LAYER_NAME)),
             caption=f'Тайл {user_data["tile_num"]} изменен',
             reply=False,
         )
@@ -294,6 +298,9 @@ class RaceCreationOrder(StatesGroup):
         is_incorrect = await is_position_incorrect(message, LayerName.RACE)
         if is_incorrect:
             return
+        if not get_race_controller(message).is_land(int(message.text), LayerName.RACE):
+            await message.answer('Раса не может появиться в воде, выберите тайл на суше')
+            return
 
         buttons = [
             Button(text=" +1 ", callback_data=CB_SET_START_ALIGNMENT+'_+'),
@@ -534,6 +541,9 @@ class CityCreationOrder(StatesGroup):
 
         user_data = await state.get_data()
         controller = get_race_controller(message)
+        if not controller.is_land(int(message.text), LayerName.RACE):
+            await message.answer('Город нельзя основать в воде, выберите тайл на суше')
+            return
         controller.create_city(
             race_name=user_data.get('race_name'),
             city_name=user_data.get('city_name'),
@@ -541,6 +551,11 @@ class CityCreationOrder(StatesGroup):
             fraction_name=user_data.get('fraction_name'),
         )
 
+        await message.reply_photo(
+            convert_image(controller.render_preview(int(message.text), LayerName.RACE)),
+            caption=f'Город "{user_data.get("city_name")}" основан в тайле {message.text}',
+            reply=False,
+        )
         await _finalize_god_action(message, state)
 
 
@@ -576,6 +591,17 @@ async def render_god_info(message: types.Message):
     controller.set_current_message_id(answer.message_id)
 
 
+def get_round_end_text(controller: GodController, n_era: int, n_round: int) -> Optional[str]:
+    """Что изменилось после завершения раунда, n_era и n_round - эпоха и раунд до его завершения"""
+    if controller.is_creation_end:
+        return 'Мир создан'
+    if n_round < controller.world.n_round:
+        return 'Начался новый раунд, боги получили силу, мир стал старше'
+    if n_era < controller.world.n_era:
+        return 'Началась новая эпоха, время теперь течет быстрее'
+    return None
+
+
 async def _end_round_answer(call_or_message: Union[types.Message, types.CallbackQuery]):
     controller = get_god_controller(call_or_message)
     n_round = controller.world.n_round
@@ -587,12 +613,9 @@ async def _end_round_answer(call_or_message: Union[types.Message, types.Callback
 
     state = Dispatcher.get_current().current_state()
     await state.finish()
-    if controller.is_creation_end:
-        await message.answer('Мир создан')
-    elif n_round < controller.world.n_round:
-        await message.answer('Начался новый раунд, боги получили силу, мир стал старше')
-    elif n_era < controller.world.n_era:
-        await message.answer('Началась новая эпоха, время теперь течет быстрее')
+    round_end_text = get_round_end_text(controller, n_era, n_round)
+    if round_end_text:
+        await message.answer(round_end_text)
     if isinstance(call_or_message, types.CallbackQuery):
         await call_or_message.message.edit_reply_markup(None)
         await call_or_message.answer()
@@ -614,3 +637,42 @@ async def _finalize_god_action(
     else:
         raise NotImplementedError
     await render_god_info(message)
+
+
+def skip_god_turn(world_id: int, god_id: int) -> tuple[Optional[int], str, World]:
+    """
+    Пропускает ход бога и сохраняет мир, работает долго, поэтому вызывается вне цикла событий бота
+    :return: сообщение с кнопками, которые надо убрать, текст для чата мира и сохраненный мир
+    """
+    controller = GodController(world_id=world_id, god_id=god_id)
+    god_name = controller.current_god.name
+    message_with_buttons_id = controller.world.current_message_with_buttons_id
+    n_round = controller.world.n_round
+    n_era = controller.world.n_era
+    controller.skip_turn()
+
+    text = f'{god_name} молчит дольше {TURN_TIMEOUT_HOURS:g} ч, ход пропущен'
+    redactor_god_id = controller.world.redactor_god_id
+    if controller.world.is_turn_running and redactor_god_id is not None:
+        text += f', теперь ходит {controller.world.gods[redactor_god_id].name}'
+    round_end_text = get_round_end_text(controller, n_era, n_round)
+    if round_end_text:
+        text += f'\n{round_end_text}'
+    return message_with_buttons_id, text, controller.world
+
+
+async def skip_silent_god_turn(dispatcher: Dispatcher, world_id: int, god_id: int):
+    """Пропускает ход бога, который молчит дольше TURN_TIMEOUT_HOURS, и сообщает об этом в чат мира"""
+    message_with_buttons_id, text, world = await asyncio.get_running_loop().run_in_executor(
+        None, skip_god_turn, world_id, god_id
+    )
+    # планировщик ходов не потокобезопасен, поэтому новый срок хода ставится уже в цикле событий
+    TURN_SCHEDULER.schedule(world_id, world)
+
+    await dispatcher.current_state(chat=world_id, user=god_id).finish()
+    if message_with_buttons_id is not None:
+        try:
+            await dispatcher.bot.edit_message_reply_markup(world_id, message_with_buttons_id, reply_markup=None)
+        except (MessageToEditNotFound, MessageNotModified):
+            pass
+    await dispatcher.bot.send_message(world_id, text)
@@ -1,4 +1,5 @@
-from typing import Union
+import asyncio
+from typing import Optional, Union
 
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text
@@ -6,30 +7,58 @@ from aiogram.dispatcher.filters.state import StatesGroup, State
 from aiogram import types, Dispatcher
 
 
-from app.telegram_bot.utils import convert_image, is_user_admin, is_admin_state, convert_text, get_world_controller
+from app.telegram_bot.utils import (
+    ENCODING_POLICY,
+    convert_image,
+    is_user_admin,
+    is_admin_state,
+    convert_stream,
+    get_world_controller,
+)
 from app.telegram_bot.keyboards import get_one_button_keyboard
 from app.world_creator.controller import Controller
 from app.world_creator.model import MAX_SIZE_LAYER
+from app.world_creator.terrain import NoiseTerrainGenerator
 
 
 MAX_WORLD_NAME_LEN = 30
+#: Сколько последних записей истории показывать в чате
+STORY_PAGE_SIZE = 20
+#: С какой длины история выгружается сжатой
+STORY_COMPRESS_MIN_ENTRIES = 2000
+MAX_MESSAGE_LEN = 4096
 
 CMD_WORLD_INFO = 'world_info'
+CMD_STORY = 'story'
+CMD_SEARCH = 'search'
+CMD_TIMELAPSE = 'timelapse'
+CMD_ROUTE = 'route'
+#: Фильтры поиска по истории: название в команде - параметр WorldController.search
+SEARCH_FILTERS = {'бог': 'god', 'раса': 'race', 'эпоха': 'n_era', 'тайл': 'tile'}
+SEARCH_INT_FILTERS = ('n_era', 'tile')
+SEARCH_KIND_LABELS = {'log': '', 'event': '(событие) ', 'race': '(раса) '}
 
 CB_RENDER_WORLD_MAP = 'render_world_map'
 CB_RENDER_WORLD_STORY = 'render_world_story'
 CB_CREATE_WORLD = 'create_world'
 CB_DELETE_WORLD = 'delete_world'
 CB_FILL_LANDS = 'fill_lands_'
+CB_GENERATE_LANDS = CB_FILL_LANDS + 'noise_'
 CB_START_GAME = 'start_game'
+CB_UNDO_ACTION = 'undo_action'
 
 
 def register_handlers_world_creation(dispatcher: Dispatcher):
     dispatcher.register_message_handler(cmd_get_world, commands=[CMD_WORLD_INFO], state='*')
+    dispatcher.register_message_handler(cmd_story, commands=[CMD_STORY], state='*')
+    dispatcher.register_message_handler(cmd_search, commands=[CMD_SEARCH], state='*')
+    dispatcher.register_message_handler(cmd_timelapse, commands=[CMD_TIMELAPSE], state='*')
+    dispatcher.register_message_handler(cmd_route, commands=[CMD_ROUTE], state='*')
 
     dispatcher.register_callback_query_handler(start_game_callback, text=CB_START_GAME, state='*')
     dispatcher.register_callback_query_handler(render_world_map_callback, text=CB_RENDER_WORLD_MAP, state='*')
     dispatcher.register_callback_query_handler(render_world_story_callback, text=CB_RENDER_WORLD_STORY, state='*')
+    dispatcher.register_callback_query_handler(undo_action_callback, text=CB_UNDO_ACTION, state='*')
 
     WorldDeletionOrder().register(dispatcher)
     WorldCreationOrder().register(dispatcher)
@@ -92,17 +121,31 @@ class WorldCreationOrder(StatesGroup):
         buttons = [
             types.InlineKeyboardButton(text=f"{i}%", callback_data=f"{CB_FILL_LANDS}{i}") for i in range(0, 101, 20)
         ]
+        generator_buttons = [
+            types.InlineKeyboardButton(text=f"Материки {i}%", callback_data=f"{CB_GENERATE_LANDS}{i}")
+            for i in range(20, 81, 20)
+        ]
         keyboard = types.InlineKeyboardMarkup(row_width=6)
         keyboard.add(*buttons)
-        await message.answer('Выберите процент суши в вашем мире:', reply_markup=keyboard)
+        keyboard.row(*generator_buttons[:2])
+        keyboard.row(*generator_buttons[2:])
+        await message.answer(
+            'Выберите процент суши в вашем мире.\n'
+            'Суша из кнопок с процентами разбрасывается случайно, '
+            '"Материки" создают связные континенты с лесами, горами и песчаными берегами:',
+            reply_markup=keyboard
+        )
 
     @staticmethod
     async def fill_world_callback(call: types.CallbackQuery, state: FSMContext):
         percent = int(call.data.split('_')[-1])
+        terrain = NoiseTerrainGenerator.name if call.data.startswith(CB_GENERATE_LANDS) else None
         user_data = await state.get_data()
 
         controller = get_world_controller(call)
-        controller.create_world(name=user_data['name'], layers_shape=user_data['size'], percent=percent)
+        controller.create_world(
+            name=user_data['name'], layers_shape=user_data['size'], percent=percent, terrain=terrain
+        )
         await state.finish()
         await call.message.delete()
         await WorldRenderOrder().render_world_info(call, controller)
@@ -123,7 +166,8 @@ class WorldRenderOrder(StatesGroup):
         is_admin = await is_user_admin(message_or_call)
         if is_admin:
             admin_buttons = [
-                types.InlineKeyboardButton(text="Удалить мир", callback_data=CB_DELETE_WORLD)
+                types.InlineKeyboardButton(text="Удалить мир", callback_data=CB_DELETE_WORLD),
+                types.InlineKeyboardButton(text="Отменить последнее действие", callback_data=CB_UNDO_ACTION),
             ]
             if not get_world_controller(message_or_call).world.is_start_game:
                 admin_buttons.append(types.InlineKeyboardButton(text="Начать игру", callback_data=CB_START_GAME))
@@ -139,7 +183,7 @@ class WorldRenderOrder(StatesGroup):
         await self.render.set()
         message = message_or_call if isinstance(message_or_call, types.Message) else message_or_call.message
         await message.answer(
-            controller.world.info,
+            controller.world_info,
             reply_markup=keyboard
         )
         if isinstance(message_or_call, types.CallbackQuery):
@@ -172,6 +216,125 @@ async def cmd_get_world(message: types.Message):
         await create_world(message)
 
 
+async def cmd_story(message: types.Message):
+    """/story - последние записи истории мира, /story <эпоха> <раунд> - записи за раунд"""
+    controller = get_world_controller(message)
+    if not controller.is_world_created:
+        await create_world(message)
+        return
+
+    args = message.get_args().split()
+    if not args:
+        story = controller.render_last_story(STORY_PAGE_SIZE)
+    elif len(args) == 2 and all(arg.lstrip('-').isdecimal() for arg in args):
+        story = controller.render_round_story(int(args[0]), int(args[1]))
+    else:
+        await message.answer(f'Использование: /{CMD_STORY} или /{CMD_STORY} <эпоха> <раунд>')
+        return
+
+    if len(story) > MAX_MESSAGE_LEN:
+        story = '...\n' + story[-MAX_MESSAGE_LEN + 4:]
+    await message.answer(story or 'В истории мира нет таких записей')
+
+
+async def cmd_search(message: types.Message):
+    """/search <слова> бог:<имя> раса:<название> эпоха:<номер> тайл:<номер> - поиск по истории, событиям и расам"""
+    controller = get_world_controller(message)
+    if not controller.is_world_created:
+        await create_world(message)
+        return
+
+    words = []
+    filters: dict = {}
+    for arg in message.get_args().split():
+        key, _, value = arg.partition(':')
+        filter_name = SEARCH_FILTERS.get(key.lower())
+        if not value or filter_name is None:
+            words.append(arg)
+        elif filter_name in SEARCH_INT_FILTERS and not value.isdecimal():
+            await message.answer(f'Значение фильтра {key} должно быть числом')
+            return
+        else:
+            filters[filter_name] = int(value) if filter_name in SEARCH_INT_FILTERS else value
+    if not words and not filters:
+        await message.answer(
+            f'Использование: /{CMD_SEARCH} <слова> {" ".join(f"{key}:..." for key in SEARCH_FILTERS)}'
+        )
+        return
+
+    found = '\n'.join(
+        SEARCH_KIND_LABELS[document.kind] + document.title
+        for document in controller.search(' '.join(words), limit=STORY_PAGE_SIZE, **filters)
+    )
+    if len(found) > MAX_MESSAGE_LEN:
+        found = found[:MAX_MESSAGE_LEN - 4] + '\n...'
+    await message.answer(found or 'Ничего не найдено')
+
+
+async def cmd_timelapse(message: types.Message):
+    """/timelapse - анимация того, как боги меняли карту мира"""
+    controller = get_world_controller(message)
+    if not controller.is_world_created:
+        await create_world(message)
+        return
+
+    await message.answer('Собираю анимацию истории мира...')
+    path = await asyncio.get_running_loop().run_in_executor(None, controller.get_timelapse_path)
+    await message.answer_animation(types.InputFile(path), caption=f'История мира {controller.world.name}')
+
+
+def render_city_distances(controller: Controller) -> str:
+    return '\n'.join(
+        f'{first} - {second}: {"не добраться по суше" if distance is None else f"{distance:g}"}'
+        for (first, second), distance in controller.get_city_distances().items()
+    )
+
+
+def render_city_route(
+        controller: Controller, first_city_name: str, second_city_name: str
+) -> tuple[str, Optional[types.InputFile]]:
+    """:return: подпись и карта маршрута между городами или сообщение, почему маршрута нет, без карты"""
+    try:
+        start, goal = controller.get_city_tile(first_city_name), controller.get_city_tile(second_city_name)
+    except ValueError as error:
+        return str(error), None
+    route = controller.find_route(start, goal)
+    if route is None:
+        return f'Из {first_city_name} в {second_city_name} не добраться по суше', None
+    caption = f'Маршрут {first_city_name} - {second_city_name}, стоимость {route.cost:g}'
+    return caption, convert_image(controller.render_route(start, goal))
+
+
+async def cmd_route(message: types.Message):
+    """
+    /route - расстояния между всеми городами, /route <город>, <город> - маршрут между двумя городами.
+    Поиск маршрутов долгий, он запускается вне цикла событий
+    """
+    controller = get_world_controller(message)
+    if not controller.is_world_created:
+        await create_world(message)
+        return
+
+    args = message.get_args()
+    loop = asyncio.get_running_loop()
+    if not args:
+        distances = await loop.run_in_executor(None, render_city_distances, controller)
+        if len(distances) > MAX_MESSAGE_LEN:
+            distances = distances[:MAX_MESSAGE_LEN - 4] + '\n...'
+        await message.answer(distances or 'В мире нет городов')
+        return
+
+    city_names = [name.strip() for name in args.split(',')]
+    if len(city_names) != 2 or not all(city_names):
+        await message.answer(f'Использование: /{CMD_ROUTE} или /{CMD_ROUTE} <город>, <город>')
+        return
+    text, route_map = await loop.run_in_executor(None, render_city_route, controller, *city_names)
+    if route_map is None:
+        await message.answer(text)
+        return
+    await message.answer_photo(route_map, caption=text)
+
+
 class WorldDeletionOrder(StatesGroup):
     clear = State()
 
@@ -213,13 +376,27 @@ class WorldDeletionOrder(StatesGroup):
             await message.answer('подтвердите удаление мира: да/нет')
 
 
+async def undo_action_callback(call: types.CallbackQuery):
+    is_admin = await is_user_admin(call)
+    if not is_admin:
+        await call.answer('Эта кнопка для администратора')
+        return
+
+    controller = get_world_controller(call)
+    if controller.is_world_created and controller.undo_last_action():
+        await call.message.answer(f'Последнее действие отменено, мир вернулся к записи:\n{controller.render_last_story(1)}')
+    else:
+        await call.message.answer('Нечего отменять')
+    await call.answer()
+
+
 async def render_world_map_callback(call: types.CallbackQuery):
     controller = get_world_controller(call)
     if controller.is_world_created:
-        image = controller.render_map()
+        path = controller.get_map_path(ENCODING_POLICY)
         await call.message.delete()
         await call.message.reply_photo(
-            convert_image(image),
+            types.InputFile(path),
             caption=call.message.text,
             reply=False,
             reply_markup=await WorldRenderOrder().get_render_world_keyboard(call)
@@ -233,9 +410,11 @@ async def render_world_map_callback(call: types.CallbackQuery):
 async def render_world_story_callback(call: types.CallbackQuery):
     controller = get_world_controller(call)
     if controller.is_world_created:
-        story = controller.render_story()
-        document = convert_text(story)
-        document.filename = f'История мира {controller.world.name}.txt'
+        if controller.world.log_length >= STORY_COMPRESS_MIN_ENTRIES:
+            filename = f'История мира {controller.world.name}.txt.gz'
+            document = convert_stream(controller.iter_story(compress=True), filename)
+        else:
+            document = convert_stream(controller.iter_story(), f'История мира {controller.world.name}.txt')
         await call.message.delete()
         await call.message.reply_document(
             document,
@@ -1,19 +1,27 @@
 import asyncio
 import os
+from datetime import timedelta
+from functools import partial
 
 from aiogram import Bot, Dispatcher, types, executor
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.types import BotCommand
 
 from app.telegram_bot.handlers.god_creation import register_handlers_god_creation, CMD_GOD_INFO
-from app.telegram_bot.handlers.god_actions import register_handlers_god_actions
+from app.telegram_bot.handlers.god_actions import register_handlers_god_actions, skip_silent_god_turn
 from app.telegram_bot.handlers.world import register_handlers_world_creation, CMD_WORLD_INFO
 from app.telegram_bot.handlers.common import register_handlers_common, register_last_handlers, CMD_CANCEL
+from app.telegram_bot.utils import TURN_SCHEDULER
+from app.storage.integrity import check_storage
+from app.storage.storage import Storage
+from app.storage.sweeper import MAX_IDLE, run_sweeper
 
 
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
 if not BOT_TOKEN:
     exit("Error: no token provided")
+#: Через сколько дней без изменений мир переносится в холодное хранилище
+WORLD_MAX_IDLE_DAYS = float(os.environ.get("WORLD_MAX_IDLE_DAYS") or MAX_IDLE.days)
 
 
 # Регистрация команд, отображаемых в интерфейсе Telegram
@@ -38,8 +46,17 @@ async def main():
 
     await set_commands(bot)
 
+    # поврежденные миры исправляются или убираются в карантин до того, как на них попадут игроки
+    storage = Storage()
+    await asyncio.get_running_loop().run_in_executor(None, partial(check_storage, storage, repair=True))
+
+    await asyncio.get_running_loop().run_in_executor(None, TURN_SCHEDULER.load)
+    sweeper = asyncio.create_task(run_sweeper(storage, max_idle=timedelta(days=WORLD_MAX_IDLE_DAYS)))
+    turn_scheduler = asyncio.create_task(TURN_SCHEDULER.run(partial(skip_silent_god_turn, db)))
     await db.skip_updates()
     await db.start_polling()
+    sweeper.cancel()
+    turn_scheduler.cancel()
 
 
 if __name__ == '__main__':
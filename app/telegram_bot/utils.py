@@ -1,5 +1,9 @@
-from typing import Union
+from datetime import timedelta
+from typing import Iterable, Union
 import io
+import logging
+import os
+import tempfile
 
 from PIL import Image
 
@@ -13,21 +17,36 @@ from app.world_creator.controller import (
     WorldController,
     RaceController,
 )
+from app.storage.storage import Storage
+from app.world_creator.image_encoder import EncodingPolicy, encode_image
 from app.world_creator.model import LayerName
+from app.world_creator.turn_scheduler import TURN_TIMEOUT, TurnScheduler
+
+logger = logging.getLogger(__name__)
+#: Настраивается переменными окружения из ENCODING_POLICY_ENV
+ENCODING_POLICY = EncodingPolicy.from_env()
+#: Сколько часов бог может молчать в свой ход, прежде чем ход пропустят
+TURN_TIMEOUT_HOURS = float(os.environ.get('TURN_TIMEOUT_HOURS') or TURN_TIMEOUT.total_seconds() / 3600)
+#: Сроки ходов всех миров, контроллеры сообщают ему о каждом сохранении мира
+TURN_SCHEDULER = TurnScheduler(Storage(), timedelta(hours=TURN_TIMEOUT_HOURS))
 
 
 def convert_image(image: Image) -> types.InputFile:
-    image_bytes = io.BytesIO()
-    image.save(image_bytes, format='PNG')
-    image_bytes.seek(0)
-    return types.InputFile(image_bytes)
+    encoded = encode_image(image, ENCODING_POLICY)
+    logger.info(
+        'Изображение %sx%s закодировано в %s за %.3f с, %s байт',
+        *encoded.size, encoded.image_format.value, encoded.encode_time, encoded.num_bytes,
+    )
+    return types.InputFile(io.BytesIO(encoded.data), filename=encoded.filename)
 
 
-def convert_text(text: str) -> types.InputFile:
-    text_bytes = io.BytesIO()
-    text_bytes.write(text.encode('utf-8'))
-    text_bytes.seek(0)
-    return types.InputFile(text_bytes)
+def convert_stream(chunks: Iterable[bytes], filename: str) -> types.InputFile:
+    """Файл из потока байт, данные складываются во временный файл, а не в память"""
+    file = tempfile.TemporaryFile()
+    for chunk in chunks:
+        file.write(chunk)
+    file.seek(0)
+    return types.InputFile(file, filename=filename)
 
 
 def get_chat_id(message_or_call: Union[types.CallbackQuery, types.Message]):
@@ -99,19 +118,19 @@ async def is_position_incorrect(message: types.Message, layer_name: LayerName, c
 
 def get_world_controller(message_or_call: Union[types.Message, types.CallbackQuery]) -> WorldController:
     world_id, god_id = get_world_god_ids(message_or_call=message_or_call)
-    return WorldController(world_id=world_id, god_id=god_id)
+    return WorldController(world_id=world_id, god_id=god_id, on_save=TURN_SCHEDULER.schedule)
 
 
 def get_god_controller(message_or_call: Union[types.Message, types.CallbackQuery]) -> GodController:
     world_id, god_id = get_world_god_ids(message_or_call)
-    return GodController(world_id=world_id, god_id=god_id)
+    return GodController(world_id=world_id, god_id=god_id, on_save=TURN_SCHEDULER.schedule)
 
 
 def get_god_action_controller(message_or_call: Union[types.Message, types.CallbackQuery]) -> GodActionController:
     world_id, god_id = get_world_god_ids(message_or_call)
-    return GodActionController(world_id=world_id, god_id=god_id)
+    return GodActionController(world_id=world_id, god_id=god_id, on_save=TURN_SCHEDULER.schedule)
 
 
 def get_race_controller(message_or_call: Union[types.Message, types.CallbackQuery]) -> RaceController:
     world_id, god_id = get_world_god_ids(message_or_call)
-    return RaceController(world_id=world_id, god_id=god_id)
+    return RaceController(world_id=world_id, god_id=god_id, on_save=TURN_SCHEDULER.schedule)
@@ -1,13 +1,35 @@
+import sys
+from typing import Any
+
 from pydantic import BaseModel as PydanticBaseModel
 import abc
 
 
+def intern_string(value: Any) -> Any:
+    """
+    Валидатор строковых полей, значения которых повторяются в тысячах объектов (типы тайлов, имена богов и рас).
+    Прочитанные из файла одинаковые строки заменяются одним общим объектом
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 class BaseModel(PydanticBaseModel, abc.ABC):
     """
-    Базовый класс
+    Базовый класс.
+    Данные извне (ввод пользователя, файлы) проходят проверку при создании и присвоении.
+    Менеджеры сами формируют значения правильных типов, поэтому могут создавать объекты через construct
+    и присваивать через set_trusted без повторной проверки
     """
 
     class Config:
         extra = 'forbid'
         #: Конфигурация объектов модели. Делаем всегда проверку присвоения свойств
-        validate_assignment = True
\ No newline at end of file
+        validate_assignment = True
+
+    def set_trusted(self, **values):
+        """Присвоение без проверки, только для значений, тип которых гарантирует вызывающий код"""
+        unknown_fields = values.keys() - self.__fields__.keys()
+        if unknown_fields:
+            raise ValueError(f'У {self.__class__.__name__} нет полей: {", ".join(sorted(unknown_fields))}')
+        self.__dict__.update(values)
+        self.__fields_set__.update(values)
@@ -1,16 +1,46 @@
-from typing import Optional, Union
-
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from random import randrange
+from typing import Callable, Iterable, Iterator, Optional, Union
+
+from .history import iter_story_lines
+from .image_encoder import EncodingPolicy, encode_image
+from .image_manager import MAX_MAP_IMAGE_SIZE, Viewport
+from .landmass_index import is_land_tile
+from .routing import Route, RouteCache, RoutingService
+from .search_index import SearchDocument, SearchIndex
 from .model import Actions, GodProfile, Race, World, LayerName, RaceFraction, City
+from .spatial_index import TileContents
+from .terrain import TERRAIN_GENERATORS
+from .timelapse import iter_timelapse_gif
 from .tiles import Tile, ClimateType, ImageRef
 from .world_manager import Manager, WorldManager, GodManager, RaceManager
 from app.storage.storage import Storage
 
+#: Сколько тайлов вокруг измененного показывать на превью
+PREVIEW_RADIUS = 2
+#: Файл кэша найденных маршрутов, он не зависит от версии мира, см. RoutingService.load_cache
+ROUTES_CACHE_NAME = 'routes.json'
+#: Файл кэша поискового индекса, он дополняется новыми записями мира, см. SearchIndex.update
+SEARCH_INDEX_CACHE_NAME = 'search_index.json'
+
 
 class Controller:
-    def __init__(self, world_id: int, god_id: int):
-        self.storage = Storage()
+    def __init__(
+            self,
+            world_id: int,
+            god_id: int,
+            storage: Optional[Storage] = None,
+            on_save: Optional[Callable[[int, World], None]] = None,
+    ):
+        """:param on_save: вызывается после каждого сохранения мира, например чтобы запланировать конец хода"""
+        self.storage = storage or Storage()
         self._god_id = god_id
         self._world_id = world_id
+        self._on_save = on_save
 
         self._init_manager()
 
@@ -27,6 +57,18 @@ class Controller:
         assert self.manager  # для mypy
         return self.manager.world
 
+    @property
+    def world_info(self) -> str:
+        return self.world.info + self.get_landmass_info()
+
+    def get_landmass_info(self) -> str:
+        """
+        Материки, острова и их климат. Разметка участков суши строится долго,
+        поэтому описание строится один раз для каждой версии мира
+        """
+        path = self._get_cache_path('landmass', 'txt', lambda: [self.manager.landmass_index.info.encode()])
+        return path.read_text()
+
     @property
     def is_world_created(self):
         return self.storage.is_world_exist(self._world_id)
@@ -41,19 +83,165 @@ class Controller:
             raise ValueError()
         return layer.num_tiles
 
-    def save(self):
-        self.storage.save_world(self._world_id, self.world)
+    def save(self, touch: bool = True):
+        """:param touch: отметить время изменения мира, изменения не от игроков его не отмечают"""
+        sections = self.storage.save_world(self._world_id, self.world, touch)
+        self.storage.get_snapshot_store(self._world_id).record(self.world, sections)
+        if self._on_save is not None:
+            self._on_save(self._world_id, self.world)
 
     def load(self) -> World:
+        """Замороженный мир сначала возвращается в обычное хранилище"""
+        if self.storage.is_world_frozen(self._world_id):
+            self.storage.thaw_world(self._world_id)
         return self.storage.load_world(self._world_id)
 
+    @property
+    def world_version(self) -> str:
+        """Меняется с каждым записанным в историю действием, в том числе после отмены действий"""
+        if not self.world.log_length:
+            return '0'
+        last_entry = self.world.get_log_entry(self.world.log_length - 1)
+        return f'{self.world.log_length}_{hashlib.sha1(last_entry.json().encode()).hexdigest()[:8]}'
+
+    def _get_cache_path(self, prefix: str, extension: str, build: Callable[[], Iterable[bytes]]) -> Path:
+        """
+        Файл кэша {prefix}_{версия мира}.{extension}, строится один раз для каждой версии мира,
+        файлы старых версий с тем же префиксом удаляются
+        """
+        cache_dir = self.storage.get_cache_dir(self._world_id)
+        path = cache_dir / f'{prefix}_{self.world_version}.{extension}'
+        if path.exists():
+            return path
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        for old_path in cache_dir.glob(f'{prefix}_*.{extension}'):
+            old_path.unlink()
+        self._write_cache_file(path, build())
+        return path
+
+    @staticmethod
+    def _write_cache_file(path: Path, chunks: Iterable[bytes]):
+        # файл могут записывать одновременно, каждый пишет в свой временный файл
+        file_descriptor, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=path.parent)
+        with os.fdopen(file_descriptor, 'wb') as file:
+            for chunk in chunks:
+                file.write(chunk)
+        os.replace(tmp_path, path)
+
+    @property
+    def routing(self) -> RoutingService:
+        """Сервис маршрутов, при первом обращении в него добавляются маршруты из кэша мира"""
+        routing = self.manager.routing
+        if not routing.is_cache_loaded:
+            path = self.storage.get_cache_dir(self._world_id) / ROUTES_CACHE_NAME
+            try:
+                routing.load_cache(RouteCache.parse_file(path))
+            except (FileNotFoundError, ValueError):
+                # кэша нет или он поврежден, маршруты найдутся заново
+                pass
+            routing.is_cache_loaded = True
+        return routing
+
+    def _save_routes(self):
+        """Сохраняет маршруты, найденные в этом запросе, чтобы следующие запросы не искали их заново"""
+        routing = self.manager.routing
+        if not routing.is_changed:
+            return
+        cache_dir = self.storage.get_cache_dir(self._world_id)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self._write_cache_file(cache_dir / ROUTES_CACHE_NAME, [routing.dump_cache().json().encode()])
+        routing.is_changed = False
+
     def spend_force(self, action: Actions):
         value = self.manager.calc_action_cost(action)
         self.manager.spend_force(god_id=self._god_id, value=value)
 
-    def render_map(self, layer_name: str = ''):
+    def render_map(self, layer_name: str = '', viewport: Optional[Viewport] = None, zoom: Optional[int] = None):
+        """
+        :param viewport: область карты, по умолчанию вся карта
+        :param zoom: уровень уменьшения, по умолчанию подбирается так чтобы карта влезла в MAX_MAP_IMAGE_SIZE
+        """
         layer_names = {l_name.value: l_name for l_name in LayerName}
-        return self.manager.render_map(layer_names.get(layer_name))
+        if zoom is None:
+            zoom = self.manager.calc_fit_zoom(MAX_MAP_IMAGE_SIZE, viewport)
+        return self.manager.render_map(layer_names.get(layer_name), viewport, zoom)
+
+    def get_tile_contents(self, position: int) -> TileContents:
+        """Все, что находится в тайле position слоя территорий, на всех слоях"""
+        return self.manager.spatial_index.get_tile_contents(position)
+
+    def get_fine_positions(self, position: int) -> list[int]:
+        """Позиции тайлов слоев рас и событий внутри тайла position слоя территорий"""
+        return self.manager.spatial_index.get_fine_positions(position)
+
+    def get_city_names_in_radius(self, position: int, radius: float) -> list[str]:
+        return [city.name for city in self.manager.spatial_index.get_cities_in_radius(position, radius)]
+
+    def get_race_names_in_radius(self, position: int, radius: float) -> list[str]:
+        return [race.name for race in self.manager.spatial_index.get_races_in_radius(position, radius)]
+
+    def is_land(self, position: int, layer_name: LayerName = LayerName.LANDS) -> bool:
+        """
+        Находится ли тайл position слоя layer_name на суше.
+        Проверяется только тайл слоя территорий под ним, из хранилища читается лишь его чанк
+        """
+        base_position = self.manager.get_base_position(layer_name, position)
+        return is_land_tile(self.manager.get_layer(LayerName.LANDS).get_tile(base_position))
+
+    def get_city_tile(self, city_name: str) -> int:
+        """Тайл слоя территорий, в котором стоит город"""
+        for city in self.world.cities:
+            if city.name == city_name:
+                if city.position is None:
+                    raise ValueError(f'У города {city_name} нет координат')
+                return self.manager.spatial_index.get_base_position(city.position)
+        raise ValueError(f'Нет города с названием: {city_name}')
+
+    def get_race_origin_tile(self, race_name: str) -> int:
+        """Тайл слоя территорий, в котором появилась раса"""
+        race = self.world.races.get(race_name)
+        if race is None:
+            raise ValueError(f'Нет расы с названием: {race_name}')
+        return self.manager.spatial_index.get_base_position(race.init_position)
+
+    def find_route(self, start: int, goal: int) -> Optional[Route]:
+        """Маршрут между тайлами слоя территорий, None если по суше не добраться"""
+        route = self.routing.find_route(start, goal)
+        self._save_routes()
+        return route
+
+    def get_distance_between_cities(self, first_city_name: str, second_city_name: str) -> Optional[float]:
+        route = self.find_route(self.get_city_tile(first_city_name), self.get_city_tile(second_city_name))
+        return route.cost if route else None
+
+    def get_city_distances(self) -> dict[tuple[str, str], Optional[float]]:
+        """Попарные расстояния между городами, все маршруты сохраняются в кэш мира"""
+        distances = self.routing.get_distances({
+            city.name: self.get_city_tile(city.name) for city in self.world.cities if city.position is not None
+        })
+        self._save_routes()
+        return distances
+
+    def render_route(self, start: int, goal: int, zoom: Optional[int] = None):
+        """Карта области вокруг маршрута с нарисованным маршрутом, None если маршрута нет"""
+        route = self.find_route(start, goal)
+        if route is None:
+            return None
+        viewport = Viewport.around_positions(route.positions, self.manager.get_layer(LayerName.LANDS).shape)
+        if zoom is None:
+            zoom = self.manager.calc_fit_zoom(MAX_MAP_IMAGE_SIZE, viewport)
+        return self.manager.render_route(route, viewport, zoom)
+
+    def get_viewport_around(self, position: int, radius: int, layer_name: LayerName = LayerName.LANDS) -> Viewport:
+        return self.manager.get_viewport_around(position, radius, layer_name)
+
+    def render_preview(self, position: int, layer_name: LayerName = LayerName.LANDS, radius: int = PREVIEW_RADIUS):
+        """
+        Окрестность тайла position слоя layer_name с сеткой этого слоя, чтобы подтвердить действие с тайлом
+        :param radius: сколько тайлов слоя территорий показывать с каждой стороны от тайла
+        """
+        return self.render_map(layer_name.value, self.get_viewport_around(position, radius, layer_name))
 
 
 class WorldController(Controller):
@@ -61,11 +249,26 @@ class WorldController(Controller):
         if self.is_world_created:
             self.manager = WorldManager(self.load())
 
-    def create_world(self, name: str, layers_shape: tuple[int, int], percent: int):
-        world = World(name=name, layers_shape=layers_shape)
+    def create_world(
+            self,
+            name: str,
+            layers_shape: tuple[int, int],
+            percent: int,
+            seed: Optional[int] = None,
+            terrain: Optional[str] = None,
+    ):
+        """
+        :param seed: зерно генератора случайных чисел, если не задано - выбирается случайно и сохраняется в мире
+        :param terrain: название генератора ландшафта из TERRAIN_GENERATORS,
+            если не задано - плато случайно разбрасываются по воде
+        """
+        if seed is None:
+            seed = randrange(2 ** 32)
+        world = World(name=name, layers_shape=layers_shape, seed=seed)
         self.manager = WorldManager(world)
         self.manager.add_init_layers()
-        self.manager.fill_base_lands_layer(percent)
+        generator = TERRAIN_GENERATORS[terrain](percent) if terrain else None
+        self.manager.fill_base_lands_layer(percent, generator)
         self.save()
 
     def remove_world(self):
@@ -73,10 +276,99 @@ class WorldController(Controller):
 
     def start_game(self):
         self.world.is_start_game = True
+        self.manager.start_turn(self.world.redactor_god_id)
         self.save()
 
-    def render_story(self):
-        return self.manager.render_story()
+    def undo_last_action(self) -> bool:
+        """
+        Возвращает мир к состоянию до последнего записанного в историю действия
+        :return: было ли что отменять
+        """
+        world = self.storage.get_snapshot_store(self._world_id).undo()
+        if world is None:
+            return False
+        self.manager = WorldManager(world)
+        self.save()
+        return True
+
+    def render_map_at_round(self, n_era: int, n_round: int, layer_name: str = ''):
+        """Карта мира, каким он был в конце раунда, None если снимка этого раунда уже нет"""
+        world = self.storage.get_snapshot_store(self._world_id).get_world_at_round(n_era, n_round)
+        if world is None:
+            return None
+        manager = WorldManager(world)
+        layer_names = {l_name.value: l_name for l_name in LayerName}
+        return manager.render_map(layer_names.get(layer_name), zoom=manager.calc_fit_zoom(MAX_MAP_IMAGE_SIZE))
+
+    def iter_story(self, compress: bool = False) -> Iterator[bytes]:
+        return self.manager.iter_story(compress)
+
+    def render_last_story(self, num_entries: int) -> str:
+        return ''.join(iter_story_lines(self.manager.get_last_log_entries(num_entries)))
+
+    def render_round_story(self, n_era: int, n_round: int) -> str:
+        return ''.join(iter_story_lines(self.manager.get_round_log_entries(n_era, n_round)))
+
+    def get_timelapse_path(self) -> Path:
+        """
+        GIF с историей карты мира. Строится один раз для каждой версии мира.
+        Построение долгое, его нужно запускать вне цикла событий
+        """
+        return self._get_cache_path('timelapse', 'gif', lambda: iter_timelapse_gif(self.world))
+
+    def get_map_path(self, policy: EncodingPolicy) -> Path:
+        """Закодированная карта всего мира, строится один раз для каждой версии мира и настроек кодирования"""
+        policy_key = hashlib.sha1(policy.json().encode()).hexdigest()[:8]
+        return self._get_cache_path(
+            f'map_{policy_key}',
+            policy.image_format.value.lower(),
+            lambda: [encode_image(self.render_map(), policy).data],
+        )
+
+    def search(
+            self,
+            text: str = '',
+            god: Optional[str] = None,
+            race: Optional[str] = None,
+            n_era: Optional[int] = None,
+            tile: Optional[int] = None,
+            limit: int = 20,
+    ) -> list[SearchDocument]:
+        """Поиск по истории мира, событиям и описаниям рас, сначала самые новые записи"""
+        index = self._get_search_index()
+        documents = index.search(text, limit, god=god, race=race, n_era=n_era, tile=tile)
+        self._save_search_index(index)
+        return documents
+
+    def _get_search_index(self) -> SearchIndex:
+        """
+        Индекс из кэша мира, дополненный записями, которые появились после его сохранения.
+        Заново индекс строится, только если кэша нет или мир изменился иначе, например отменили действия
+        """
+        if self.world._search_index is None:
+            path = self.storage.get_cache_dir(self._world_id) / SEARCH_INDEX_CACHE_NAME
+            try:
+                index = SearchIndex.from_dump(
+                    json.loads(path.read_text()),
+                    lambda position: self.manager.spatial_index.get_base_position(position),
+                )
+            except (FileNotFoundError, ValueError, KeyError):
+                # кэша нет или он поврежден, индекс построится заново
+                pass
+            else:
+                if index.update(self.world):
+                    self.world._search_index = index
+        return self.manager.search_index
+
+    def _save_search_index(self, index: SearchIndex):
+        """Сохраняет индекс, если в него добавились документы, чтобы следующие запросы не строили его заново"""
+        if not index.is_changed:
+            return
+        cache_dir = self.storage.get_cache_dir(self._world_id)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(index.dump(), ensure_ascii=False).encode()
+        self._write_cache_file(cache_dir / SEARCH_INDEX_CACHE_NAME, [data])
+        index.is_changed = False
 
 
 class GodController(Controller):
@@ -91,16 +383,18 @@ class GodController(Controller):
         self.manager.add_god_profile(god)
         self.manager.receive_force(self._god_id)
         if self.world.redactor_god_id is None:
-            self.world.redactor_god_id = self._god_id
+            self.manager.start_turn(self._god_id)
         self.save()
         return god
 
-    def next_redactor_god(self):
+    def _pass_turn(self):
         god_ids = [god_id for god_id, god in self.world.gods.items() if not god.confirm_end_round]
         index = god_ids.index(self._god_id)
         index = index + 1 if index < len(god_ids) - 1 else 0
+        self.manager.start_turn(god_ids[index])
 
-        self.world.redactor_god_id = god_ids[index]
+    def next_redactor_god(self):
+        self._pass_turn()
         self.save()
 
     def set_current_message_id(self, message_id):
@@ -121,22 +415,33 @@ class GodController(Controller):
     def is_allowed_to_end_era(self):
         return self.world.n_round > 4 and not self.current_god.confirm_end_era
 
-    def end_round(self):
+    def _end_round(self):
         self.current_god.confirm_end_round = True
         for other_god_id, other_god in self.manager.world.gods.items():
             if other_god_id == self._god_id:
                 continue
             if not other_god.confirm_end_round:
-                self.save()
-                return None
+                return
 
         end_era_confirmations = [g.confirm_end_era for g in self.world.gods.values()]
         if all(end_era_confirmations) or (self.world.n_round > 9 and any(end_era_confirmations)):
             self.manager.start_new_era()
 
         self.manager.start_new_round()
+
+    def end_round(self):
+        self._end_round()
         self.save()
 
+    def skip_turn(self):
+        """
+        Пропускает ход бога, который молчит слишком долго: ход переходит следующему, а бог завершает раунд,
+        чтобы раунд не ждал его. Это не действие игрока, поэтому время изменения мира не отмечается
+        """
+        self._pass_turn()
+        self._end_round()
+        self.save(touch=False)
+
     def end_era(self):
         self.current_god.confirm_end_era = True
         self.save()
@@ -172,7 +477,11 @@ class GodActionController(Controller):
         tile = self._add_tile_on_layer(position=tile_num, image_ref=tile_type, layer_name=LayerName.LANDS)
 
         self.spend_force(Actions.CREATE_LAND)
-        self.manager.log(f'{self.current_god} изменил ландшафт в координатах {tile.position} на {tile}')
+        self.manager.log(
+            f'{self.current_god} изменил ландшафт в координатах {tile.position} на {tile}',
+            god=self.current_god.name,
+            tile=tile.position,
+        )
         self.save()
 
     def form_climate(self, tile_type: str, tile_num: int):
@@ -183,17 +492,28 @@ class GodActionController(Controller):
         )
 
         self.spend_force(Actions.CREATE_CLIMATE)
-        self.manager.log(f'{self.current_god} изменил климат в координатах {tile.position} на {tile}')
+        self.manager.log(
+            f'{self.current_god} изменил климат в координатах {tile.position} на {tile}',
+            god=self.current_god.name,
+            tile=tile.position,
+        )
         self.save()
 
     def create_event(self, description: str, position: Optional[int] = None):
         add_message = ''
+        tile = None
         if position is not None:
             self._add_tile_on_layer(position=position, image_ref=ImageRef.EVENT.value, layer_name=LayerName.EVENT)
             add_message = f'в координатах {position}'
-        self.world.events.append(description)
+            tile = self.manager.spatial_index.get_base_position(position)
+        self.manager.add_event(description)
         self.spend_force(Actions.EVENT)
-        self.manager.log(f'{self.current_god} создал событие {description}' + add_message)
+        self.manager.log(
+            f'{self.current_god} создал событие {description}' + add_message,
+            god=self.current_god.name,
+            tile=tile,
+            event=description,
+        )
         self.save()
 
 
@@ -214,11 +534,16 @@ class RaceController(Controller):
             alignment=alignment,
             fractions=[RaceFraction(god_owner=self.current_god.name, name=name)]
         )
-        self.manager.world.races[race.name] = race
+        self.manager.add_race(race)
 
         self.manager.change_tile(LayerName.RACE, Tile(position=race.init_position))
         self.spend_force(Actions.CREATE_RACE)
-        self.manager.log(f'{self.current_god} создал расу {race.name} с начальной позицией {race.init_position}')
+        self.manager.log(
+            f'{self.current_god} создал расу {race.name} с начальной позицией {race.init_position}',
+            god=self.current_god.name,
+            race=race.name,
+            tile=self.manager.spatial_index.get_base_position(race.init_position),
+        )
         self.save()
 
     def change_race_alignment(self, race_name: str, alignment: int):
@@ -230,10 +555,12 @@ class RaceController(Controller):
             raise NotImplementedError
 
         race = self.manager.get_race(race_name)
-        race.alignment += alignment
+        self.manager.change_alignment(race, alignment)
         self.spend_force(action)
         text_interpretation = 'очистил' if alignment == 1 else 'совратил'
-        self.manager.log(f'{self.current_god} {text_interpretation} {race.name}')
+        self.manager.log(
+            f'{self.current_god} {text_interpretation} {race.name}', god=self.current_god.name, race=race.name
+        )
         self.save()
 
     def get_race_names_and_alignments(self) -> list[tuple[str, int]]:
@@ -241,21 +568,30 @@ class RaceController(Controller):
 
     def get_race_fraction_names(self, race_name: str):
         race = self.manager.get_race(race_name)
-        return [
-            fraction.name for fraction in race.fractions
-            if fraction.god_owner == self.current_god.name
-        ]
+        fractions = self.manager.ownership_index.get_fractions(self.current_god.name, race.name)
+        return [fraction.name for fraction in fractions]
+
+    def get_race_city_names(self, race_name: str) -> list[str]:
+        return [city.name for city in self.manager.ownership_index.get_cities(race_name)]
 
     def create_city(self, race_name: str, city_name: str, position: int, fraction_name: str):
         race = self.manager.get_race(race_name)
 
-        self.world.cities.append(City(
-            name=city_name, base_race_name=race_name, fractions=[fraction_name], alignment=race.alignment))
+        self.manager.add_city(City(
+            name=city_name,
+            base_race_name=race_name,
+            fractions=[fraction_name],
+            alignment=race.alignment,
+            position=position,
+        ))
 
         self.manager.change_tile(LayerName.RACE, Tile(position=position, image_ref=ImageRef.CITY.value))
         self.spend_force(Actions.CONTROL_RACE)
 
         self.manager.log(
-            f'{self.current_god} приказал расе {race_name} основать город {city_name} в координатах {position}'
+            f'{self.current_god} приказал расе {race_name} основать город {city_name} в координатах {position}',
+            god=self.current_god.name,
+            race=race_name,
+            tile=self.manager.spatial_index.get_base_position(position),
         )
         self.save()
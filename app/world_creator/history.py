@@ -0,0 +1,37 @@
+import zlib
+from typing import Iterable, Iterator
+
+from .model import LogEntry
+
+#: Размер кусков, которыми отдается выгрузка истории
+STORY_CHUNK_SIZE = 64 * 1024
+
+
+def iter_story_lines(entries: Iterable[LogEntry]) -> Iterator[str]:
+    for entry in entries:
+        yield entry.title + '\n'
+
+
+def iter_story_bytes(entries: Iterable[LogEntry], chunk_size: int = STORY_CHUNK_SIZE) -> Iterator[bytes]:
+    """История мира кусками байт, вся история в памяти не собирается"""
+    buffer: list[bytes] = []
+    buffer_size = 0
+    for line in iter_story_lines(entries):
+        encoded_line = line.encode('utf-8')
+        buffer.append(encoded_line)
+        buffer_size += len(encoded_line)
+        if buffer_size >= chunk_size:
+            yield b''.join(buffer)
+            buffer, buffer_size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def iter_gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Потоковое сжатие в формат gzip"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed_chunk = compressor.compress(chunk)
+        if compressed_chunk:
+            yield compressed_chunk
+    yield compressor.flush()
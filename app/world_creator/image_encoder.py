@@ -0,0 +1,94 @@
+import io
+import os
+import time
+from enum import Enum
+from typing import Mapping, Optional
+
+from PIL import Image
+from pydantic import Field
+
+from .base_model import BaseModel
+
+
+class ImageFormat(Enum):
+    PNG = 'PNG'
+    WEBP = 'WEBP'
+    JPEG = 'JPEG'
+
+
+#: Переменные окружения, которыми настраивается кодирование изображений: переменная - поле EncodingPolicy
+ENCODING_POLICY_ENV = {
+    'IMAGE_FORMAT': 'image_format',
+    'IMAGE_PNG_COMPRESS_LEVEL': 'png_compress_level',
+    'IMAGE_PALETTE_COLORS': 'palette_colors',
+    'IMAGE_QUALITY': 'quality',
+    'IMAGE_MAX_PIXELS': 'max_pixels',
+}
+
+
+class EncodingPolicy(BaseModel):
+    """Как кодировать изображения карт перед отправкой, по умолчанию - PNG как у PIL"""
+    image_format: ImageFormat = Field(ImageFormat.PNG)
+    png_compress_level: int = Field(6, ge=0, le=9, description='0 - без сжатия, 1 - быстрее всего, 9 - меньше всего')
+    palette_colors: Optional[int] = Field(
+        None, ge=2, le=256, description='Сколько цветов оставить в палитре PNG, None - не переводить в палитру'
+    )
+    quality: int = Field(80, ge=1, le=100, description='Качество WEBP и JPEG')
+    max_pixels: Optional[int] = Field(
+        None, gt=0, description='Изображение с большим числом пикселей уменьшается, None - без ограничения'
+    )
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> 'EncodingPolicy':
+        return cls.parse_obj({
+            field_name: environ[env_name].upper() if field_name == 'image_format' else environ[env_name]
+            for env_name, field_name in ENCODING_POLICY_ENV.items() if environ.get(env_name)
+        })
+
+
+class EncodedImage(BaseModel):
+    data: bytes = Field(...)
+    image_format: ImageFormat = Field(...)
+    size: tuple[int, int] = Field(..., description='Размер изображения после уменьшения')
+    encode_time: float = Field(..., description='Время кодирования в секундах')
+
+    @property
+    def num_bytes(self) -> int:
+        return len(self.data)
+
+    @property
+    def filename(self) -> str:
+        return f'map.{self.image_format.value.lower()}'
+
+
+def fit_pixel_budget(image: Image.Image, max_pixels: Optional[int]) -> Image.Image:
+    """Уменьшает изображение с сохранением пропорций так, чтобы в нем было не больше max_pixels пикселей"""
+    num_pixels = image.width * image.height
+    if max_pixels is None or num_pixels <= max_pixels:
+        return image
+    scale = (max_pixels / num_pixels) ** 0.5
+    size = (max(int(image.width * scale), 1), max(int(image.height * scale), 1))
+    return image.resize(size, Image.BOX)
+
+
+def encode_image(image: Image.Image, policy: EncodingPolicy) -> EncodedImage:
+    start_time = time.perf_counter()
+    image = fit_pixel_budget(image, policy.max_pixels)
+    options: dict = {}
+    if policy.image_format == ImageFormat.PNG:
+        if policy.palette_colors is not None:
+            image = image.quantize(policy.palette_colors, method=Image.FASTOCTREE)
+        options['compress_level'] = policy.png_compress_level
+    else:
+        options['quality'] = policy.quality
+        if policy.image_format == ImageFormat.JPEG:
+            image = image.convert('RGB')
+
+    image_bytes = io.BytesIO()
+    image.save(image_bytes, format=policy.image_format.value, **options)
+    return EncodedImage(
+        data=image_bytes.getvalue(),
+        image_format=policy.image_format,
+        size=image.size,
+        encode_time=time.perf_counter() - start_time,
+    )
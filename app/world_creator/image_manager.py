@@ -1,6 +1,11 @@
+from functools import lru_cache
+from typing import Optional
+
 from PIL import Image, ImageDraw
+from pydantic import Field
 
-from .model import Layer
+from .base_model import BaseModel
+from .model import LAYERS, Layer, LayerName, SparseLayer
 from .tiles import LandType, ClimateType, ImageRef
 from pathlib import Path
 
@@ -8,6 +13,14 @@ from .utils import get_coord_from_position
 
 
 IMAGE_DIR = Path(__file__).parent.parent / 'data' / 'static' / 'tile_pics'
+#: Максимальный уровень уменьшения карты, на каждом следующем уровне карта уменьшена в 2 раза
+MAX_ZOOM_LEVEL = 6
+#: Ограничение на сторону изображения карты, которое отправляется игрокам
+MAX_MAP_IMAGE_SIZE = 2048
+#: Сколько изображений чанков и уменьшенных тайлов (всех размеров) держать в памяти
+CHUNK_IMAGE_CACHE_SIZE = 2048
+#: Сколько изображений сетки держать в памяти, каждое размером с карту
+GRID_IMAGE_CACHE_SIZE = 4
 
 
 class ImageCollection:
@@ -30,46 +43,250 @@ class ImageCollection:
 
 
 def paste_scaled_image_with_alpha(base_image: Image, add_image: Image):
-    add_image = add_image.resize(base_image.size)
+    if add_image.size != base_image.size:
+        add_image = add_image.resize(base_image.size)
     base_image.paste(add_image, mask=add_image)
     return base_image
 
 
-def draw_grid(size: tuple[int, int], shape: tuple[int, int]) -> Image:
+class Viewport(BaseModel):
+    """Прямоугольная область карты в тайлах слоя"""
+    x: int = Field(0)
+    y: int = Field(0)
+    width: int = Field(...)
+    height: int = Field(...)
+
+    @classmethod
+    def from_center(cls, position: int, radius: int, shape: tuple[int, int]) -> 'Viewport':
+        y, x = get_coord_from_position(position, shape[0])
+        return cls(x=x - radius, y=y - radius, width=2 * radius + 1, height=2 * radius + 1).clip(shape)
+
+    @classmethod
+    def around_positions(cls, positions: list[int], shape: tuple[int, int], margin: int = 1) -> 'Viewport':
+        """Наименьшая область, которая вмещает все тайлы positions и отступ margin вокруг них"""
+        coords = [get_coord_from_position(position, shape[0]) for position in positions]
+        xs, ys = [x for _, x in coords], [y for y, _ in coords]
+        return cls(
+            x=min(xs) - margin,
+            y=min(ys) - margin,
+            width=max(xs) - min(xs) + 2 * margin + 1,
+            height=max(ys) - min(ys) + 2 * margin + 1,
+        ).clip(shape)
+
+    def clip(self, shape: tuple[int, int]) -> 'Viewport':
+        x_start, y_start = max(self.x, 0), max(self.y, 0)
+        x_end, y_end = min(self.x + self.width, shape[0]), min(self.y + self.height, shape[1])
+        if x_end <= x_start or y_end <= y_start:
+            raise ValueError('Область просмотра находится за пределами карты')
+        return Viewport(x=x_start, y=y_start, width=x_end - x_start, height=y_end - y_start)
+
+    def scaled(self, coefficient: int) -> 'Viewport':
+        return Viewport(
+            x=self.x * coefficient,
+            y=self.y * coefficient,
+            width=self.width * coefficient,
+            height=self.height * coefficient,
+        )
+
+    def intersects(self, x: int, y: int, width: int, height: int) -> bool:
+        return x < self.x + self.width and self.x < x + width and y < self.y + self.height and self.y < y + height
+
+
+@lru_cache(maxsize=GRID_IMAGE_CACHE_SIZE)
+def draw_grid(
+        size: tuple[int, int],
+        shape: tuple[int, int],
+        offset: tuple[int, int] = (0, 0),
+        len_row: Optional[int] = None,
+) -> Image:
+    """
+    Сетка с номерами тайлов
+    :param shape: количество тайлов сетки по горизонтали и вертикали
+    :param offset: координаты левого верхнего тайла сетки в слое
+    :param len_row: длина строки слоя, нужна для нумерации тайлов если сетка покрывает часть слоя
+    :return: изображение общее для всех вызовов с теми же параметрами, его нельзя изменять
+    """
+    len_row = len_row or shape[0]
     image = Image.new('RGBA', size)
     draw = ImageDraw.Draw(image)
-    y_coeff = size[0] / shape[0]
-    x_coeff = size[1] / shape[1]
+    x_coeff = size[0] / shape[0]
+    y_coeff = size[1] / shape[1]
+    for x in range(shape[0] + 1):
+        draw.line(((x * x_coeff, 0), (x * x_coeff, size[1])), fill='black', width=2)
+    for y in range(shape[1] + 1):
+        draw.line(((0, y * y_coeff), (size[0], y * y_coeff)), fill='black', width=2)
+
     for x in range(shape[0]):
         for y in range(shape[1]):
-            draw.line(((x * x_coeff, 0), (x * x_coeff, size[1])), fill='black', width=2)
-            draw.line(((0, y * y_coeff), (size[0], y * y_coeff)), fill='black', width=2)
-
-            text = f'{x + shape[0] * y}'
+            text = f'{x + offset[0] + len_row * (y + offset[1])}'
             text_width, text_height = draw.textsize(text)
             draw.text(((x + 0.5) * x_coeff - 0.5 * text_width, (y + 0.5) * y_coeff - 0.5 * text_height), text)
 
-    draw.line(((shape[0] * x_coeff, 0), (shape[0] * x_coeff, size[1])), fill='black', width=2)
-    draw.line(((0, shape[1] * y_coeff), (size[1], shape[1] * y_coeff)), fill='black', width=2)
+    return image
+
+
+def draw_route(
+        size: tuple[int, int],
+        shape: tuple[int, int],
+        route: list[tuple[int, int]],
+        offset: tuple[int, int] = (0, 0),
+) -> Image:
+    """
+    Линия маршрута через центры тайлов
+    :param shape: количество тайлов по горизонтали и вертикали на изображении
+    :param route: координаты (x, y) тайлов маршрута в слое
+    :param offset: координаты левого верхнего тайла изображения в слое
+    """
+    image = Image.new('RGBA', size)
+    draw = ImageDraw.Draw(image)
+    x_coeff = size[0] / shape[0]
+    y_coeff = size[1] / shape[1]
+    points = [((x - offset[0] + 0.5) * x_coeff, (y - offset[1] + 0.5) * y_coeff) for x, y in route]
+    line_width = max(round(min(x_coeff, y_coeff) / 8), 1)
+    if len(points) > 1:
+        draw.line(points, fill='red', width=line_width, joint='curve')
+    for point in (points[0], points[-1]) if points else ():
+        radius = line_width * 2
+        draw.ellipse((point[0] - radius, point[1] - radius, point[0] + radius, point[1] + radius), fill='red')
+    return image
+
+
+def get_tile_boxes(num_tiles: int, tile_size: float) -> list[tuple[int, int]]:
+    """Начало и размер в пикселях каждого из num_tiles тайлов дробного размера tile_size, уложенных подряд"""
+    return [(round(i * tile_size), round((i + 1) * tile_size) - round(i * tile_size)) for i in range(num_tiles)]
 
+
+@lru_cache(maxsize=CHUNK_IMAGE_CACHE_SIZE)
+def get_chunk_image(
+        images: ImageCollection,
+        image_refs: tuple[Optional[str], ...],
+        chunk_shape: tuple[int, int],
+        size: Optional[tuple[int, int]] = None,
+) -> Image:
+    """
+    Изображение чанка нужного размера, собранное из заранее уменьшенных изображений тайлов.
+    Кэш адресуется содержимым чанка, поэтому не требует инвалидации при изменении тайлов.
+    Возвращаемое изображение общее для всех вызовов, его нельзя изменять
+    :param size: размер изображения в пикселях, по умолчанию тайлы в исходном размере
+    """
+    full_size = (images.image_size[0] * chunk_shape[0], images.image_size[1] * chunk_shape[1])
+    if size == full_size:
+        return get_chunk_image(images, image_refs, chunk_shape)
+    if size is not None:
+        chunk_image = Image.new('RGBA', size)
+        x_boxes = get_tile_boxes(chunk_shape[0], size[0] / chunk_shape[0])
+        y_boxes = get_tile_boxes(chunk_shape[1], size[1] / chunk_shape[1])
+        for local_position, image_ref in enumerate(image_refs):
+            y_pos, x_pos = get_coord_from_position(local_position, chunk_shape[0])
+            (x, width), (y, height) = x_boxes[x_pos], y_boxes[y_pos]
+            # при сильном уменьшении тайл может не занять ни одного пикселя
+            if image_ref is not None and width > 0 and height > 0:
+                chunk_image.paste(get_scaled_tile_image(images, image_ref, (width, height)), (x, y))
+        return chunk_image
+
+    chunk_image = Image.new('RGBA', full_size)
+    for local_position, image_ref in enumerate(image_refs):
+        if image_ref is not None:
+            y_pos, x_pos = get_coord_from_position(local_position, chunk_shape[0])
+            chunk_image.paste(
+                images.get_image(image_ref),
+                (x_pos * images.image_size[0], y_pos * images.image_size[1]),
+            )
+    return chunk_image
+
+
+@lru_cache(maxsize=CHUNK_IMAGE_CACHE_SIZE)
+def get_scaled_tile_image(images: ImageCollection, image_ref: str, size: tuple[int, int]) -> Image:
+    """Изображение тайла нужного размера, возвращаемое изображение нельзя изменять"""
+    image = images.get_image(image_ref)
+    if image.size != size:
+        image = image.resize(size)
     return image
 
 
-def render_layer(layer: Layer, images: ImageCollection):
+def render_layer(layer: LAYERS, images: ImageCollection):
     world_map_image = Image.new(
         'RGBA',
         (images.image_size[0] * layer.shape[0], images.image_size[1] * layer.shape[1])
     )
-    for tile in layer.tiles:
-        if tile.image_ref is not None:
+    if isinstance(layer, SparseLayer):
+        for tile in layer.iter_filled_tiles():
             y_pos, x_pos = get_coord_from_position(tile.position, layer.shape[0])
             world_map_image.paste(
                 images.get_image(tile.image_ref),
                 (x_pos * images.image_size[0], y_pos * images.image_size[1]),
             )
+        return world_map_image
+
+    for chunk_position, chunk in layer.chunks.items():
+        if chunk.is_empty:
+            continue
+        x_pos, y_pos = layer.get_chunk_origin(chunk_position)
+        world_map_image.paste(
+            get_chunk_image(images, chunk.image_refs, chunk.shape),
+            (x_pos * images.image_size[0], y_pos * images.image_size[1]),
+        )
     return world_map_image
 
 
+def paste_layer_viewport(
+        base_image: Image,
+        layer: LAYERS,
+        images: ImageCollection,
+        viewport: Viewport,
+        with_alpha: bool = True,
+):
+    """
+    Рисует часть слоя, попавшую в область просмотра, поверх base_image.
+    Чанки собираются сразу в итоговом размере из уменьшенных до него тайлов, без масштабирования при каждой отрисовке
+    :param viewport: область просмотра в тайлах слоя, она целиком растягивается на base_image
+    """
+    if isinstance(layer, SparseLayer):
+        return paste_sparse_layer_viewport(base_image, layer, images, viewport, with_alpha)
+
+    tile_width = base_image.size[0] / viewport.width
+    tile_height = base_image.size[1] / viewport.height
+    for chunk_position, chunk in layer.chunks.items():
+        x_pos, y_pos = layer.get_chunk_origin(chunk_position)
+        if not viewport.intersects(x_pos, y_pos, *chunk.shape) or chunk.is_empty:
+            continue
+
+        box = (round((x_pos - viewport.x) * tile_width), round((y_pos - viewport.y) * tile_height))
+        size = (
+            round((x_pos + chunk.shape[0] - viewport.x) * tile_width) - box[0],
+            round((y_pos + chunk.shape[1] - viewport.y) * tile_height) - box[1],
+        )
+        chunk_image = get_chunk_image(images, chunk.image_refs, chunk.shape, size)
+        base_image.paste(chunk_image, box, mask=chunk_image if with_alpha else None)
+    return base_image
+
+
+def paste_sparse_layer_viewport(
+        base_image: Image,
+        layer: SparseLayer,
+        images: ImageCollection,
+        viewport: Viewport,
+        with_alpha: bool = True,
+):
+    """Аналог paste_layer_viewport для разреженного слоя, перебирает только заданные тайлы"""
+    tile_width = base_image.size[0] / viewport.width
+    tile_height = base_image.size[1] / viewport.height
+    for tile in layer.iter_filled_tiles():
+        y_pos, x_pos = get_coord_from_position(tile.position, layer.shape[0])
+        if not viewport.intersects(x_pos, y_pos, 1, 1):
+            continue
+
+        box = (round((x_pos - viewport.x) * tile_width), round((y_pos - viewport.y) * tile_height))
+        size = (
+            round((x_pos + 1 - viewport.x) * tile_width) - box[0],
+            round((y_pos + 1 - viewport.y) * tile_height) - box[1],
+        )
+        tile_image = get_scaled_tile_image(images, tile.image_ref, size)
+        base_image.paste(tile_image, box, mask=tile_image if with_alpha else None)
+    return base_image
+
+
+@lru_cache(maxsize=None)
 def load_land_tiles():
     images = {
         LandType.FOREST.value: Image.open(IMAGE_DIR / 'forest.png'),
@@ -81,6 +298,7 @@ def load_land_tiles():
     return ImageCollection(images=images, image_size=images[LandType.WATER.value].size)
 
 
+@lru_cache(maxsize=None)
 def load_race_init_tiles():
     images = {
         ImageRef.RACE_INIT_POSITION.value: Image.open(IMAGE_DIR / 'race_init_tile.png'),
@@ -89,11 +307,13 @@ def load_race_init_tiles():
     return ImageCollection(images, image_size=images[ImageRef.RACE_INIT_POSITION.value].size)
 
 
+@lru_cache(maxsize=None)
 def load_event_tiles():
     tile = Image.open(IMAGE_DIR / 'event_tile.png')
     return ImageCollection({ImageRef.EVENT.value: tile}, image_size=tile.size)
 
 
+@lru_cache(maxsize=None)
 def load_climate_tiles():
     images = {
         ClimateType.CLOUD.value: Image.open(IMAGE_DIR / 'cloud.png'),
@@ -101,3 +321,11 @@ def load_climate_tiles():
         ClimateType.SNOW.value: Image.open(IMAGE_DIR / 'snow.png')
     }
     return ImageCollection(images=images, image_size=images[ClimateType.CLOUD.value].size)
+
+
+IMAGE_COLLECTION_LOADERS = {
+    LayerName.LANDS: load_land_tiles,
+    LayerName.CLIMATE: load_climate_tiles,
+    LayerName.RACE: load_race_init_tiles,
+    LayerName.EVENT: load_event_tiles,
+}
@@ -0,0 +1,206 @@
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+
+from .model import LAYERS, World, LayerName
+from .tiles import TILES, LandType
+from .utils import get_coord_from_position, get_position_from_coord
+
+#: Участок суши считается материком, если занимает не меньше этой доли карты, иначе - островом
+CONTINENT_MIN_SHARE = 0.1
+
+
+def is_land_tile(tile: TILES) -> bool:
+    return tile.image_ref is not None and tile.image_ref != LandType.WATER.value
+
+
+def format_climate(climate: Counter) -> str:
+    return ', '.join(f'{climate_type}: {count}' for climate_type, count in climate.most_common())
+
+
+def label_landmasses(land: np.ndarray) -> np.ndarray:
+    """
+    Разметка связных (по сторонам) участков суши.
+    Каждый тайл суши получает номер наименьшей позиции своего участка, тайлы воды -1.
+    Метки распространяются между соседями векторно, а прыжки по указателям сокращают число итераций
+    :param land: массив (высота, ширина) признаков суши
+    """
+    positions = np.arange(land.size).reshape(land.shape)
+    labels = np.where(land, positions, land.size)
+    while True:
+        new_labels = labels.copy()
+        np.minimum(new_labels[1:, :], labels[:-1, :], out=new_labels[1:, :])
+        np.minimum(new_labels[:-1, :], labels[1:, :], out=new_labels[:-1, :])
+        np.minimum(new_labels[:, 1:], labels[:, :-1], out=new_labels[:, 1:])
+        np.minimum(new_labels[:, :-1], labels[:, 1:], out=new_labels[:, :-1])
+        new_labels = np.where(land, new_labels, land.size)
+
+        flat_labels = np.append(new_labels.ravel(), land.size)
+        jumped = flat_labels[flat_labels]
+        while not np.array_equal(jumped, flat_labels):
+            flat_labels = jumped
+            jumped = flat_labels[flat_labels]
+        new_labels = flat_labels[:-1].reshape(land.shape)
+
+        if np.array_equal(new_labels, labels):
+            return np.where(land, labels, -1)
+        labels = new_labels
+
+
+class LandmassIndex:
+    def __init__(self, world: World):
+        """
+        Аналитика слоя территорий: материки и острова, береговая линия, климат по участкам суши.
+        Участки хранятся системой непересекающихся множеств, которая обновляется при изменении тайла
+        """
+        self.world = world
+        lands_layer = self._get_layer(LayerName.LANDS)
+        self.shape = lands_layer.shape
+        self.num_tiles = lands_layer.num_tiles
+
+        land = np.array([is_land_tile(lands_layer.get_tile(p)) for p in range(self.num_tiles)], dtype=bool)
+        self.land = land
+        labels = label_landmasses(land.reshape(self.shape[1], self.shape[0])).ravel()
+        self.parent: list[int] = labels.tolist()
+        self.members: dict[int, set[int]] = {}
+        for position in np.flatnonzero(land).tolist():
+            self.members.setdefault(int(labels[position]), set()).add(position)
+
+        grid = land.reshape(self.shape[1], self.shape[0])
+        near_water = np.zeros_like(grid)
+        near_water[1:, :] |= ~grid[:-1, :]
+        near_water[:-1, :] |= ~grid[1:, :]
+        near_water[:, 1:] |= ~grid[:, :-1]
+        near_water[:, :-1] |= ~grid[:, 1:]
+        self.coast = (grid & near_water).ravel()
+
+    def _get_layer(self, layer_name: LayerName) -> LAYERS:
+        return self.world.layers[layer_name.value]
+
+    def get_neighbours(self, position: int) -> list[int]:
+        y, x = get_coord_from_position(position, self.shape[0])
+        return [
+            get_position_from_coord(x + dx, y + dy, self.shape[0])
+            for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1))
+            if 0 <= x + dx < self.shape[0] and 0 <= y + dy < self.shape[1]
+        ]
+
+    def find(self, position: int) -> int:
+        root = position
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[position] != root:
+            self.parent[position], position = root, self.parent[position]
+        return root
+
+    def _union(self, first: int, second: int):
+        first_root, second_root = self.find(first), self.find(second)
+        if first_root == second_root:
+            return
+        if len(self.members[first_root]) < len(self.members[second_root]):
+            first_root, second_root = second_root, first_root
+        self.parent[second_root] = first_root
+        self.members[first_root] |= self.members.pop(second_root)
+
+    def _update_coast(self, position: int):
+        self.coast[position] = self.land[position] and any(
+            not self.land[neighbour] for neighbour in self.get_neighbours(position)
+        )
+
+    def _split(self, root: int, removed_position: int):
+        """Перестраивает участок суши, из которого ушел тайл, только по его собственным тайлам"""
+        remaining = self.members.pop(root)
+        remaining.discard(removed_position)
+        while remaining:
+            start = remaining.pop()
+            component = {start}
+            stack = [start]
+            while stack:
+                current = stack.pop()
+                for neighbour in self.get_neighbours(current):
+                    if neighbour in remaining:
+                        remaining.remove(neighbour)
+                        component.add(neighbour)
+                        stack.append(neighbour)
+            for member in component:
+                self.parent[member] = start
+            self.members[start] = component
+
+    def update_tile(self, tile: TILES):
+        """Нужно вызывать при каждом изменении тайла слоя территорий"""
+        position = tile.position
+        was_land, is_land = bool(self.land[position]), is_land_tile(tile)
+        if was_land == is_land:
+            return
+
+        self.land[position] = is_land
+        if is_land:
+            self.parent[position] = position
+            self.members[position] = {position}
+            for neighbour in self.get_neighbours(position):
+                if self.land[neighbour]:
+                    self._union(position, neighbour)
+        else:
+            root = self.find(position)
+            self.parent[position] = -1
+            self._split(root, position)
+
+        for changed_position in [position, *self.get_neighbours(position)]:
+            self._update_coast(changed_position)
+
+    def is_land(self, position: int) -> bool:
+        return bool(self.land[position])
+
+    def is_coast(self, position: int) -> bool:
+        return bool(self.coast[position])
+
+    def get_landmass_id(self, position: int) -> Optional[int]:
+        return self.find(position) if self.land[position] else None
+
+    def get_landmass_sizes(self) -> dict[int, int]:
+        return {root: len(members) for root, members in self.members.items()}
+
+    def is_continent(self, landmass_id: int) -> bool:
+        return len(self.members[landmass_id]) >= CONTINENT_MIN_SHARE * self.num_tiles
+
+    @property
+    def num_continents(self) -> int:
+        return sum(self.is_continent(root) for root in self.members)
+
+    @property
+    def num_islands(self) -> int:
+        return len(self.members) - self.num_continents
+
+    @property
+    def num_coast_tiles(self) -> int:
+        return int(self.coast.sum())
+
+    def get_climate_summary(self) -> dict[int, Counter]:
+        """Количество тайлов каждого климата на каждом участке суши"""
+        climate_layer = self._get_layer(LayerName.CLIMATE)
+        summary: dict[int, Counter] = {}
+        for root, members in self.members.items():
+            summary[root] = Counter(
+                climate_layer.get_tile(position).image_ref or 'CLEAR' for position in members
+            )
+        return summary
+
+    @property
+    def info(self) -> str:
+        """Материки и острова, береговая линия и климат материков, у островов климат общий"""
+        lines = [
+            f'Материки: {self.num_continents}, острова: {self.num_islands}',
+            f'Береговых тайлов: {self.num_coast_tiles}',
+        ]
+        if LayerName.CLIMATE.value in self.world.layers:
+            islands_climate: Counter = Counter()
+            summary = self.get_climate_summary()
+            for root in sorted(summary, key=lambda root: -len(self.members[root])):
+                if self.is_continent(root):
+                    lines.append(f'Материк из {len(self.members[root])} тайлов: {format_climate(summary[root])}')
+                else:
+                    islands_climate += summary[root]
+            if islands_climate:
+                lines.append(f'Острова: {format_climate(islands_climate)}')
+        return ''.join(f'{line}\n' for line in lines)
@@ -1,16 +1,31 @@
+import abc
 import enum
+from datetime import datetime
 from enum import Enum
 
-from typing import Any, Optional
+from typing import Annotated, Any, Iterator, Literal, Optional, Union
 
-from pydantic import Field
+import numpy as np
+from pydantic import Field, PrivateAttr, validator
 
-from .base_model import BaseModel
-from .tiles import TILES
-from .utils import get_position_from_coord
+from .base_model import BaseModel, intern_string
+from .tiles import TILES, EmptyTile
+from .utils import (
+    get_chunk_from_position,
+    get_chunk_shape,
+    get_chunks_from_positions,
+    get_coord_from_position,
+    get_num_chunks,
+    get_position_from_chunk,
+    get_position_from_coord,
+)
 
-MAX_SIZE_LAYER = 10
+MAX_SIZE_LAYER = 200
 DEFAULT_LAYER_SHAPE = (3, 3)
+#: Размер стороны чанка слоя в тайлах
+CHUNK_SIZE = 16
+#: Версия схемы сохраненного мира, повышается вместе с добавлением миграции в app/storage/migrations.py
+SCHEMA_VERSION = 3
 
 
 class Action(BaseModel):
@@ -49,6 +64,8 @@ class GodProfile(BaseModel):
     confirm_end_round: bool = Field(False)
     confirm_end_era: bool = Field(False)
 
+    _intern_strings = validator('name', allow_reuse=True)(intern_string)
+
     def __str__(self):
         return self.name
 
@@ -67,11 +84,15 @@ class Avatar(BaseModel):
     god_owner: str = Field(...)
     name: str = Field(...)
 
+    _intern_strings = validator('god_owner', allow_reuse=True)(intern_string)
+
 
 class RaceFraction(BaseModel):
     god_owner: str = Field(...)
     name: str = Field(...)
 
+    _intern_strings = validator('god_owner', 'name', allow_reuse=True)(intern_string)
+
 
 class Race(BaseModel):
     name: str = Field(...)
@@ -84,6 +105,8 @@ class Race(BaseModel):
     parent_name: Optional[str] = Field(None)
     technologies: list[str] = Field([])
 
+    _intern_strings = validator('name', 'god_creator', 'parent_name', allow_reuse=True)(intern_string)
+
 
 class City(BaseModel):
     name: str = Field(...)
@@ -91,26 +114,180 @@ class City(BaseModel):
     fractions: list[str] = Field(...)
     alignment: int = Field(..., description='Изначально берется от базовой расы')
     technologies: list[str] = Field([])
+    position: Optional[int] = Field(None, description='Позиция на слое рас')
+
+    _intern_strings = validator('base_race_name', 'fractions', each_item=True, allow_reuse=True)(intern_string)
+
+
+class TileChange(BaseModel):
+    """Изменение тайла, по таким записям история карты восстанавливается без снимков мира"""
+    layer_name: str = Field(...)
+    position: int = Field(...)
+    image_ref: Optional[str] = Field(None)
+    previous_image_ref: Optional[str] = Field(None)
+
+    _intern_strings = validator('layer_name', 'image_ref', 'previous_image_ref', allow_reuse=True)(intern_string)
+
+
+class LogEntry(BaseModel):
+    """Запись истории мира"""
+    n_era: Optional[int] = Field(None, description='Эпоха, в которую произошло изменение, у старых записей неизвестна')
+    n_round: Optional[int] = Field(None)
+    message: str = Field(...)
+    god: Optional[str] = Field(None, description='Бог, совершивший действие')
+    race: Optional[str] = Field(None, description='Раса, которой касается действие')
+    tile: Optional[int] = Field(None, description='Тайл слоя территорий, в котором произошло изменение')
+    event: Optional[str] = Field(None, description='Описание события, которое создано действием')
+    tile_changes: list[TileChange] = Field([], description='Тайлы, измененные действием')
+
+    _intern_strings = validator('god', 'race', allow_reuse=True)(intern_string)
+
+    def __str__(self):
+        return self.message
+
+    @property
+    def title(self) -> str:
+        if self.n_era is None:
+            return self.message
+        return f'[эпоха {self.n_era}, раунд {self.n_round}] {self.message}'
+
+
+class LayerChunk(BaseModel):
+    shape: tuple[int, int] = Field(..., description='Размер чанка в тайлах')
+    tiles: list[TILES] = Field([], description='Тайлы чанка, позиция в списке - позиция внутри чанка')
+
+    @property
+    def is_empty(self) -> bool:
+        return all(tile.image_ref is None for tile in self.tiles)
+
+    @property
+    def image_refs(self) -> tuple[Optional[str], ...]:
+        return tuple(tile.image_ref for tile in self.tiles)
 
 
-class Layer(BaseModel):
+class BaseLayer(BaseModel):
     layer_name: str = Field(...)
     shape: tuple[int, int] = Field(...)
-    tiles: list[TILES] = Field([])
 
     @property
     def num_tiles(self):
         return self.shape[0] * self.shape[1]
 
+    @abc.abstractmethod
+    def get_tile(self, position: int) -> TILES:
+        pass
+
+    @abc.abstractmethod
+    def set_tile(self, tile: TILES):
+        pass
+
+    @abc.abstractmethod
+    def iter_filled_tiles(self) -> Iterator[TILES]:
+        """Тайлы, у которых есть изображение"""
+        pass
+
+    def fill_positions(self, positions: np.ndarray, filling_tile: TILES):
+        """Записывает копии filling_tile во все позиции из positions"""
+        for position in positions.tolist():
+            self.set_tile(filling_tile.copy(update={'position': position}))
+
     def __str__(self):
         out_str = ''
         for i in range(self.shape[0]):
             for j in range(self.shape[1]):
-                out_str += str(self.tiles[get_position_from_coord(i, j, self.shape[0])]) + ' '
+                out_str += str(self.get_tile(get_position_from_coord(i, j, self.shape[0]))) + ' '
             out_str += '\n'
         return out_str
 
 
+class Layer(BaseLayer):
+    """
+    Слой хранится чанками фиксированного размера,
+    чтобы большие карты можно было рендерить и сохранять по частям
+    """
+    layer_type: Literal['chunked'] = Field('chunked')
+    chunk_size: int = Field(CHUNK_SIZE)
+    chunks: dict[int, LayerChunk] = Field({}, description='Чанки по их номерам')
+
+    @property
+    def num_chunks(self):
+        return get_num_chunks(self.shape[0], self.chunk_size) * get_num_chunks(self.shape[1], self.chunk_size)
+
+    @property
+    def tiles(self) -> list[TILES]:
+        """Тайлы слоя по порядку позиций, тайлы чанков, которых еще нет, пропускаются"""
+        tiles = []
+        for position in range(self.shape[0] * self.shape[1]):
+            chunk_position, local_position = get_chunk_from_position(position, self.shape[0], self.chunk_size)
+            chunk = self.chunks.get(chunk_position)
+            if chunk is not None:
+                tiles.append(chunk.tiles[local_position])
+        return tiles
+
+    def get_tile(self, position: int) -> TILES:
+        chunk_position, local_position = get_chunk_from_position(position, self.shape[0], self.chunk_size)
+        return self.chunks[chunk_position].tiles[local_position]
+
+    def set_tile(self, tile: TILES):
+        chunk_position, local_position = get_chunk_from_position(tile.position, self.shape[0], self.chunk_size)
+        self.chunks[chunk_position].tiles[local_position] = tile
+
+    def iter_filled_tiles(self) -> Iterator[TILES]:
+        for chunk in self.chunks.values():
+            for tile in chunk.tiles:
+                if tile.image_ref is not None:
+                    yield tile
+
+    def fill_positions(self, positions: np.ndarray, filling_tile: TILES):
+        chunk_positions, local_positions = get_chunks_from_positions(positions, self.shape[0], self.chunk_size)
+        for position, chunk_position, local_position in zip(
+                positions.tolist(), chunk_positions.tolist(), local_positions.tolist()
+        ):
+            self.chunks[chunk_position].tiles[local_position] = filling_tile.copy(update={'position': position})
+
+    def get_chunk_shape(self, chunk_position: int) -> tuple[int, int]:
+        return get_chunk_shape(chunk_position, self.shape, self.chunk_size)
+
+    def get_chunk_origin(self, chunk_position: int) -> tuple[int, int]:
+        """Координаты (x, y) левого верхнего тайла чанка"""
+        chunk_y, chunk_x = get_coord_from_position(chunk_position, get_num_chunks(self.shape[0], self.chunk_size))
+        return chunk_x * self.chunk_size, chunk_y * self.chunk_size
+
+    def get_position_from_chunk(self, chunk_position: int, local_position: int) -> int:
+        return get_position_from_chunk(chunk_position, local_position, self.shape[0], self.chunk_size)
+
+
+class SparseLayer(BaseLayer):
+    """
+    Слой, в котором хранятся только заданные тайлы, все остальные считаются пустыми.
+    Подходит для слоев-накладок (расы, события), где заполнена малая часть тайлов
+    """
+    layer_type: Literal['sparse'] = Field('sparse')
+    filled_tiles: dict[int, TILES] = Field({}, description='Заданные тайлы по их позициям')
+
+    def get_tile(self, position: int) -> TILES:
+        tile = self.filled_tiles.get(position)
+        if tile is None:
+            return EmptyTile.construct(position=position)
+        return tile
+
+    def set_tile(self, tile: TILES):
+        if not 0 <= tile.position < self.num_tiles:
+            raise IndexError(f'Позиция {tile.position} за пределами слоя {self.layer_name} размером {self.shape}')
+        if isinstance(tile, EmptyTile):
+            self.filled_tiles.pop(tile.position, None)
+        else:
+            self.filled_tiles[tile.position] = tile
+
+    def iter_filled_tiles(self) -> Iterator[TILES]:
+        for tile in self.filled_tiles.values():
+            if tile.image_ref is not None:
+                yield tile
+
+
+LAYERS = Union[Layer, SparseLayer]
+
+
 class LayerName(Enum):
     LANDS = 'lands'
     CLIMATE = 'climate'
@@ -118,11 +295,18 @@ class LayerName(Enum):
     EVENT = 'event'
 
 
+#: Слои-накладки, которые хранятся разреженно
+SPARSE_LAYER_NAMES = (LayerName.RACE, LayerName.EVENT)
+
+
 class World(BaseModel):
+    schema_version: int = Field(SCHEMA_VERSION, description='Версия схемы, в которой мир сохранен')
     name: str = Field(...)
-    layers: dict[str, Layer] = Field({}, description='Слои по названиям')
+    layers: dict[str, Annotated[LAYERS, Field(discriminator='layer_type')]] = Field(
+        {}, description='Слои по названиям')
     layers_shape: tuple[int, int] = Field(...)
-    change_log: list[str] = Field([])
+    seed: Optional[int] = Field(None, description='Зерно генератора случайных чисел, делает создание мира воспроизводимым')
+    change_log: list[LogEntry] = Field([])
 
     gods: dict[int, GodProfile] = Field({}, description='Профайлы богов по id их владельцев')
     races: dict[str, Race] = Field({}, description='Расы по названиям')
@@ -130,6 +314,7 @@ class World(BaseModel):
     events: list[str] = Field([])
 
     redactor_god_id: Optional[int] = Field(None, description='id бога которому разрешено сейчас действовать')
+    turn_started_at: Optional[datetime] = Field(None, description='Когда бог redactor_god_id получил ход')
     current_message_with_buttons_id: Optional[int] = Field(
         None, description='id сообщения в котором есть кнопки с "божественными действиями", '
                           'нужно чтобы было только одно сообщение с такими кнопками')
@@ -138,6 +323,43 @@ class World(BaseModel):
     n_round: int = Field(0)
 
     is_start_game: bool = Field(False)
+    is_creation_end: bool = Field(False, description='Все эпохи пройдены, мир создан')
+    last_mutation_at: Optional[datetime] = Field(
+        None, description='Когда мир последний раз сохраняли, None - мир сохранен до появления этого поля')
+
+    _spatial_index: Any = PrivateAttr(None)
+    _ownership_index: Any = PrivateAttr(None)
+    _landmass_index: Any = PrivateAttr(None)
+    _routing: Any = PrivateAttr(None)
+    _search_index: Any = PrivateAttr(None)
+
+    @property
+    def is_turn_running(self) -> bool:
+        """Идет ход одного из богов: игра начата и не закончена, ход кому-то передан"""
+        return (
+            self.is_start_game and not self.is_creation_end
+            and self.redactor_god_id is not None and self.turn_started_at is not None
+        )
+
+    @property
+    def log_length(self) -> int:
+        return len(self.change_log)
+
+    def add_log_entry(self, entry: LogEntry):
+        self.change_log.append(entry)
+
+    def get_log_entry(self, index: int) -> LogEntry:
+        return self.change_log[index]
+
+    def iter_log_entries(self, start: int = 0) -> Iterator[LogEntry]:
+        """Записи истории, начиная с номера start"""
+        for index in range(max(start, 0), self.log_length):
+            yield self.get_log_entry(index)
+
+    def iter_log_entries_backward(self) -> Iterator[LogEntry]:
+        """Записи истории от последней к первой"""
+        for index in range(self.log_length - 1, -1, -1):
+            yield self.get_log_entry(index)
 
     @property
     def god_names(self) -> str:
@@ -0,0 +1,40 @@
+from collections import defaultdict
+
+from .model import City, Race, RaceFraction, World
+
+
+class OwnershipIndex:
+    def __init__(self, world: World):
+        """Обратные индексы: какие расы и ордена принадлежат богам и какие города основали расы"""
+        self.races_by_god: dict[str, dict[str, Race]] = defaultdict(dict)
+        self.fractions_by_god: dict[str, dict[str, list[RaceFraction]]] = defaultdict(lambda: defaultdict(list))
+        self.cities_by_race: dict[str, list[City]] = defaultdict(list)
+
+        for race in world.races.values():
+            self.add_race(race)
+        for city in world.cities:
+            self.add_city(city)
+
+    def add_race(self, race: Race):
+        self.races_by_god[race.god_creator][race.name] = race
+        for fraction in race.fractions:
+            self.add_fraction(race.name, fraction)
+
+    def add_fraction(self, race_name: str, fraction: RaceFraction):
+        self.fractions_by_god[fraction.god_owner][race_name].append(fraction)
+
+    def add_city(self, city: City):
+        self.cities_by_race[city.base_race_name].append(city)
+
+    def get_created_race_names(self, god_name: str) -> list[str]:
+        return list(self.races_by_god.get(god_name, {}))
+
+    def get_controlled_race_names(self, god_name: str) -> list[str]:
+        """Расы, в которых у бога есть хотя бы один орден"""
+        return list(self.fractions_by_god.get(god_name, {}))
+
+    def get_fractions(self, god_name: str, race_name: str) -> list[RaceFraction]:
+        return self.fractions_by_god.get(god_name, {}).get(race_name, [])
+
+    def get_cities(self, race_name: str) -> list[City]:
+        return self.cities_by_race.get(race_name, [])
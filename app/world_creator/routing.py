@@ -0,0 +1,177 @@
+import hashlib
+import heapq
+import json
+from typing import Optional
+
+from pydantic import Field
+
+from .base_model import BaseModel
+from .model import CHUNK_SIZE, Layer, LayerName, World
+from .tiles import LandType
+from .utils import get_chunk_shape, get_coord_from_position, get_position_from_chunk, get_position_from_coord
+
+#: Стоимость входа в тайл каждого типа территорий, None - тайл непроходим
+TERRAIN_COSTS: dict[str, Optional[float]] = {
+    LandType.PLATEAU.value: 1,
+    LandType.SAND.value: 1.5,
+    LandType.FOREST.value: 2,
+    LandType.ROCK.value: 4,
+    LandType.WATER.value: None,
+}
+
+
+class Route(BaseModel):
+    positions: list[int] = Field(..., description='Тайлы слоя территорий от начала до конца маршрута')
+    cost: float = Field(...)
+
+
+class CachedRoute(BaseModel):
+    route: Optional[Route] = Field(None, description='None, если маршрута нет')
+    bounds: tuple[int, int, int, int] = Field(
+        ..., description='Прямоугольник (x0, y0, x1, y1) тайлов, которые просмотрел поиск'
+    )
+
+
+class RouteCache(BaseModel):
+    """Найденные маршруты вместе с хешами чанков слоя территорий, на которых их искали"""
+    shape: tuple[int, int] = Field(...)
+    chunk_hashes: dict[int, str] = Field(...)
+    routes: list[tuple[int, int, CachedRoute]] = Field([], description='Начало, конец и найденный маршрут')
+
+
+def _is_near(bounds: tuple[int, int, int, int], x0: int, y0: int, x1: int, y1: int) -> bool:
+    """Пересекает ли прямоугольник (x0, y0, x1, y1) область поиска вместе с одним шагом вокруг нее"""
+    return bounds[0] - 1 <= x1 and x0 <= bounds[2] + 1 and bounds[1] - 1 <= y1 and y0 <= bounds[3] + 1
+
+
+class RoutingService:
+    def __init__(self, world: World):
+        """
+        Поиск маршрутов по слою территорий алгоритмом A*.
+        Найденные маршруты кешируются и сбрасываются только если изменился тайл рядом с областью поиска
+        """
+        self.world = world
+        self.shape = world.layers[LayerName.LANDS.value].shape
+        self.min_cost = min(cost for cost in TERRAIN_COSTS.values() if cost is not None)
+        self.routes: dict[tuple[int, int], CachedRoute] = {}
+        #: Найдены ли маршруты, которых нет в сохраненном кэше
+        self.is_changed = False
+        self.is_cache_loaded = False
+
+    def get_cost(self, position: int) -> Optional[float]:
+        image_ref = self.world.layers[LayerName.LANDS.value].get_tile(position).image_ref
+        return TERRAIN_COSTS.get(image_ref) if image_ref is not None else None
+
+    def get_neighbours(self, position: int) -> list[int]:
+        y, x = get_coord_from_position(position, self.shape[0])
+        return [
+            get_position_from_coord(x + dx, y + dy, self.shape[0])
+            for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1))
+            if 0 <= x + dx < self.shape[0] and 0 <= y + dy < self.shape[1]
+        ]
+
+    def _heuristic(self, position: int, goal: int) -> float:
+        y, x = get_coord_from_position(position, self.shape[0])
+        goal_y, goal_x = get_coord_from_position(goal, self.shape[0])
+        return (abs(x - goal_x) + abs(y - goal_y)) * self.min_cost
+
+    def _search(self, start: int, goal: int) -> CachedRoute:
+        start_y, start_x = get_coord_from_position(start, self.shape[0])
+        bounds = [start_x, start_y, start_x, start_y]
+        costs = {start: 0.0}
+        previous: dict[int, int] = {}
+        queue = [(self._heuristic(start, goal), start)]
+        closed = set()
+        while queue:
+            _, position = heapq.heappop(queue)
+            if position in closed:
+                continue
+            closed.add(position)
+            y, x = get_coord_from_position(position, self.shape[0])
+            bounds = [min(bounds[0], x), min(bounds[1], y), max(bounds[2], x), max(bounds[3], y)]
+            if position == goal:
+                break
+
+            for neighbour in self.get_neighbours(position):
+                step_cost = self.get_cost(neighbour)
+                if step_cost is None or neighbour in closed:
+                    continue
+                cost = costs[position] + step_cost
+                if cost < costs.get(neighbour, float('inf')):
+                    costs[neighbour] = cost
+                    previous[neighbour] = position
+                    heapq.heappush(queue, (cost + self._heuristic(neighbour, goal), neighbour))
+
+        if goal not in closed:
+            return CachedRoute(route=None, bounds=tuple(bounds))
+
+        positions = [goal]
+        while positions[-1] != start:
+            positions.append(previous[positions[-1]])
+        return CachedRoute(route=Route(positions=positions[::-1], cost=costs[goal]), bounds=tuple(bounds))
+
+    def find_route(self, start: int, goal: int) -> Optional[Route]:
+        """Самый дешевый маршрут между тайлами слоя территорий"""
+        if self.get_cost(start) is None or self.get_cost(goal) is None:
+            return None
+        key = (start, goal)
+        if key not in self.routes:
+            self.routes[key] = self._search(start, goal)
+            self.is_changed = True
+        return self.routes[key].route
+
+    def get_distance(self, start: int, goal: int) -> Optional[float]:
+        route = self.find_route(start, goal)
+        return route.cost if route else None
+
+    def update_tile(self, position: int):
+        """
+        Нужно вызывать при каждом изменении тайла слоя территорий.
+        Тайл дальше одного шага от области поиска не может сделать найденный маршрут дешевле или дороже
+        """
+        y, x = get_coord_from_position(position, self.shape[0])
+        self.routes = {key: cached for key, cached in self.routes.items() if not _is_near(cached.bounds, x, y, x, y)}
+
+    def get_chunk_hashes(self) -> dict[int, str]:
+        """Хеши типов территорий каждого чанка, по ним видно, в каких чанках карта изменилась"""
+        layer = self.world.layers[LayerName.LANDS.value]
+        assert isinstance(layer, Layer)  # для mypy
+        return {
+            chunk_position: hashlib.sha1(json.dumps(chunk.image_refs).encode()).hexdigest()
+            for chunk_position, chunk in layer.chunks.items()
+        }
+
+    def dump_cache(self) -> RouteCache:
+        return RouteCache(
+            shape=self.shape,
+            chunk_hashes=self.get_chunk_hashes(),
+            routes=[(start, goal, cached) for (start, goal), cached in self.routes.items()],
+        )
+
+    def load_cache(self, cache: RouteCache):
+        """
+        Добавляет маршруты, найденные раньше, например в прошлых запросах к миру.
+        Маршруты рядом с чанками, которые изменились с тех пор, отбрасываются, как в update_tile
+        """
+        if cache.shape != self.shape:
+            return
+        changed_chunks = []
+        for chunk_position, chunk_hash in self.get_chunk_hashes().items():
+            if cache.chunk_hashes.get(chunk_position) != chunk_hash:
+                y0, x0 = get_coord_from_position(
+                    get_position_from_chunk(chunk_position, 0, self.shape[0], CHUNK_SIZE), self.shape[0]
+                )
+                width, height = get_chunk_shape(chunk_position, self.shape, CHUNK_SIZE)
+                changed_chunks.append((x0, y0, x0 + width - 1, y0 + height - 1))
+        for start, goal, cached in cache.routes:
+            if not any(_is_near(cached.bounds, *chunk) for chunk in changed_chunks):
+                self.routes.setdefault((start, goal), cached)
+
+    def get_distances(self, positions: dict[str, int]) -> dict[tuple[str, str], Optional[float]]:
+        """Попарные расстояния между именованными тайлами (города, места появления рас)"""
+        names = sorted(positions)
+        return {
+            (first, second): self.get_distance(positions[first], positions[second])
+            for i, first in enumerate(names)
+            for second in names[i + 1:]
+        }
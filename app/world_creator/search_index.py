@@ -0,0 +1,188 @@
+import hashlib
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Any, Callable, Optional
+
+from pydantic import Field
+
+from .base_model import BaseModel
+from .model import LogEntry, Race, World
+
+TOKEN_PATTERN = re.compile(r'\w+')
+#: Поля документа, по которым можно фильтровать поиск
+FACETS = ('kind', 'god', 'race', 'n_era', 'tile')
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower().replace('ё', 'е'))
+
+
+class SearchDocument(BaseModel):
+    kind: str = Field(..., description='log - запись истории, event - событие, race - описание расы')
+    text: str = Field(...)
+    god: Optional[str] = Field(None)
+    race: Optional[str] = Field(None)
+    n_era: Optional[int] = Field(None)
+    n_round: Optional[int] = Field(None)
+    tile: Optional[int] = Field(None, description='Тайл слоя территорий')
+
+    @property
+    def title(self) -> str:
+        if self.n_era is None:
+            return self.text
+        return f'[эпоха {self.n_era}, раунд {self.n_round}] {self.text}'
+
+
+def get_entry_hash(entry: LogEntry) -> str:
+    return hashlib.sha1(entry.json().encode()).hexdigest()
+
+
+class SearchIndex:
+    def __init__(self, world: World, get_base_position: Callable[[int], int]):
+        """
+        Инвертированный индекс по истории мира, событиям и описаниям рас.
+        Строится при первом поиске и дальше пополняется по мере появления записей,
+        поэтому поиск не перебирает всю историю. Индекс можно сохранить, см. dump и from_dump
+        :param get_base_position: тайл территорий по позиции на слое рас
+        """
+        self.get_base_position = get_base_position
+        self.documents: list[SearchDocument] = []
+        self.postings: dict[str, list[int]] = defaultdict(list)
+        self.vocabulary: list[str] = []
+        self.facets: dict[str, dict[str, list[int]]] = defaultdict(lambda: defaultdict(list))
+        #: Что из мира уже попало в индекс, по этому update находит новые записи
+        self.num_log_entries = 0
+        self.last_log_hash: Optional[str] = None
+        self.race_descriptions: dict[str, str] = {}
+        #: Добавлены ли документы после сохранения индекса
+        self.is_changed = False
+
+        self.update(world)
+
+    def update(self, world: World) -> bool:
+        """
+        Добавляет записи истории и расы, которых еще нет в индексе, события индексируются по записям истории.
+        :return: False - мир изменился не только добавлением записей, например отменили действия,
+            индекс нужно построить заново
+        """
+        if world.log_length < self.num_log_entries:
+            return False
+        if self.num_log_entries and get_entry_hash(world.get_log_entry(self.num_log_entries - 1)) != self.last_log_hash:
+            return False
+        if any(
+            world.races.get(name) is None or world.races[name].description != description
+            for name, description in self.race_descriptions.items()
+        ):
+            return False
+
+        for entry in world.iter_log_entries(self.num_log_entries):
+            self.add_log_entry(entry)
+        for race in world.races.values():
+            if race.name not in self.race_descriptions:
+                self.add_race(race)
+        return True
+
+    def dump(self) -> dict[str, Any]:
+        return {
+            'documents': [document.dict(exclude_none=True) for document in self.documents],
+            'postings': self.postings,
+            'vocabulary': self.vocabulary,
+            'facets': self.facets,
+            'num_log_entries': self.num_log_entries,
+            'last_log_hash': self.last_log_hash,
+            'race_descriptions': self.race_descriptions,
+        }
+
+    @classmethod
+    def from_dump(cls, data: dict[str, Any], get_base_position: Callable[[int], int]) -> 'SearchIndex':
+        """Индекс из dump, документы создаются без проверки, чтобы чтение было быстрее построения"""
+        index = cls.__new__(cls)
+        index.get_base_position = get_base_position
+        index.documents = [SearchDocument.construct(**document) for document in data['documents']]
+        index.postings = defaultdict(list, data['postings'])
+        index.vocabulary = data['vocabulary']
+        index.facets = defaultdict(lambda: defaultdict(list))
+        for facet, values in data['facets'].items():
+            index.facets[facet].update(values)
+        index.num_log_entries = data['num_log_entries']
+        index.last_log_hash = data['last_log_hash']
+        index.race_descriptions = data['race_descriptions']
+        index.is_changed = False
+        return index
+
+    def _add(self, document: SearchDocument):
+        self.is_changed = True
+        document_id = len(self.documents)
+        self.documents.append(document)
+        for token in set(tokenize(document.text)):
+            if token not in self.postings:
+                insort(self.vocabulary, token)
+            self.postings[token].append(document_id)
+        for facet in FACETS:
+            value = getattr(document, facet)
+            if value is not None:
+                self.facets[facet][str(value)].append(document_id)
+
+    def add_log_entry(self, entry: LogEntry):
+        """Событие, созданное записью, попадает в индекс с ее полями, поэтому его можно найти по богу, эпохе и тайлу"""
+        self.num_log_entries += 1
+        self.last_log_hash = get_entry_hash(entry)
+        if entry.event is not None:
+            self._add(SearchDocument(
+                kind='event',
+                text=entry.event,
+                god=entry.god,
+                race=entry.race,
+                n_era=entry.n_era,
+                n_round=entry.n_round,
+                tile=entry.tile,
+            ))
+        self._add(SearchDocument(
+            kind='log',
+            text=entry.message,
+            god=entry.god,
+            race=entry.race,
+            n_era=entry.n_era,
+            n_round=entry.n_round,
+            tile=entry.tile,
+        ))
+
+    def add_race(self, race: Race):
+        self.race_descriptions[race.name] = race.description
+        self._add(SearchDocument(
+            kind='race',
+            text=f'{race.name} {race.description}',
+            god=race.god_creator,
+            race=race.name,
+            tile=self.get_base_position(race.init_position),
+        ))
+
+    def _find_prefix(self, prefix: str) -> set[int]:
+        """Документы со словами, которые начинаются с prefix"""
+        document_ids: set[int] = set()
+        for i in range(bisect_left(self.vocabulary, prefix), len(self.vocabulary)):
+            if not self.vocabulary[i].startswith(prefix):
+                break
+            document_ids.update(self.postings[self.vocabulary[i]])
+        return document_ids
+
+    def search(self, text: str = '', limit: int = 20, **facets) -> list[SearchDocument]:
+        """
+        Документы, в которых есть все слова из text (по началу слова) и совпадают все заданные поля
+        :param facets: значения полей из FACETS, None - поле не учитывается
+        :return: не больше limit документов, сначала самые новые
+        """
+        unknown_facets = set(facets) - set(FACETS)
+        if unknown_facets:
+            raise ValueError(f'Нельзя искать по полям: {", ".join(sorted(unknown_facets))}')
+
+        document_sets = [
+            set(self.facets[facet].get(str(value), [])) for facet, value in facets.items() if value is not None
+        ]
+        document_sets.extend(self._find_prefix(token) for token in tokenize(text))
+        if document_sets:
+            document_ids = set.intersection(*document_sets)
+        else:
+            document_ids = set(range(len(self.documents)))
+        return [self.documents[document_id] for document_id in sorted(document_ids, reverse=True)[:limit]]
@@ -0,0 +1,116 @@
+from collections import defaultdict
+from typing import Iterator
+
+from pydantic import Field
+
+from .base_model import BaseModel
+from .model import City, LayerName, Race, SparseLayer, World
+from .tiles import TILES, EmptyTile
+from .utils import get_base_position, get_coord_from_position, get_position_from_coord
+
+
+class TileContents(BaseModel):
+    """Все, что находится в тайле слоя территорий"""
+    position: int = Field(...)
+    tiles: dict[str, TILES] = Field({}, description='Тайлы слоев с тем же размером, что и слой территорий')
+    fine_tiles: dict[str, list[TILES]] = Field({}, description='Заданные тайлы более мелких слоев внутри тайла')
+    cities: list[City] = Field([])
+    races: list[Race] = Field([], description='Расы, которые появились в этом тайле')
+
+
+class SpatialIndex:
+    def __init__(self, world: World):
+        """
+        Индекс объектов мира по тайлам слоя территорий.
+        Мелкие слои (расы, события) делят каждый тайл территорий на блок coefficient x coefficient тайлов
+        """
+        self.world = world
+        base_layer = world.layers.get(LayerName.LANDS.value)
+        self.base_shape = base_layer.shape if base_layer else world.layers_shape
+        fine_layer = world.layers.get(LayerName.RACE.value)
+        self.coefficient = fine_layer.shape[0] // self.base_shape[0] if fine_layer else 1
+
+        self.cities_by_tile: dict[int, list[City]] = defaultdict(list)
+        self.races_by_tile: dict[int, list[Race]] = defaultdict(list)
+        self.fine_tiles_by_tile: dict[int, dict[str, dict[int, TILES]]] = defaultdict(lambda: defaultdict(dict))
+
+        for city in world.cities:
+            self.add_city(city)
+        for race in world.races.values():
+            self.add_race(race)
+        for layer in world.layers.values():
+            if layer.shape == self.base_shape:
+                continue
+            tiles = layer.filled_tiles.values() if isinstance(layer, SparseLayer) else layer.iter_filled_tiles()
+            for tile in tiles:
+                self.update_tile(layer.layer_name, tile)
+
+    def get_base_position(self, fine_position: int) -> int:
+        """Тайл территорий, в котором находится тайл мелкого слоя"""
+        return get_base_position(fine_position, self.base_shape[0] * self.coefficient, self.base_shape[0])
+
+    def get_fine_positions(self, position: int) -> list[int]:
+        """Позиции тайлов мелкого слоя внутри тайла территорий"""
+        y, x = get_coord_from_position(position, self.base_shape[0])
+        fine_len_row = self.base_shape[0] * self.coefficient
+        return [
+            get_position_from_coord(x * self.coefficient + dx, y * self.coefficient + dy, fine_len_row)
+            for dy in range(self.coefficient)
+            for dx in range(self.coefficient)
+        ]
+
+    def add_city(self, city: City):
+        if city.position is not None:
+            self.cities_by_tile[self.get_base_position(city.position)].append(city)
+
+    def add_race(self, race: Race):
+        self.races_by_tile[self.get_base_position(race.init_position)].append(race)
+
+    def update_tile(self, layer_name: str, tile: TILES):
+        """Нужно вызывать при каждом изменении тайла мелкого слоя"""
+        layer = self.world.layers[layer_name]
+        if layer.shape == self.base_shape:
+            return
+
+        layer_tiles = self.fine_tiles_by_tile[self.get_base_position(tile.position)][layer_name]
+        if isinstance(tile, EmptyTile):
+            layer_tiles.pop(tile.position, None)
+        else:
+            layer_tiles[tile.position] = tile
+
+    def get_tile_contents(self, position: int) -> TileContents:
+        fine_tiles = self.fine_tiles_by_tile.get(position, {})
+        return TileContents(
+            position=position,
+            tiles={
+                name: layer.get_tile(position)
+                for name, layer in self.world.layers.items() if layer.shape == self.base_shape
+            },
+            fine_tiles={name: list(tiles.values()) for name, tiles in fine_tiles.items() if tiles},
+            cities=self.cities_by_tile.get(position, []),
+            races=self.races_by_tile.get(position, []),
+        )
+
+    def iter_positions_in_radius(self, position: int, radius: float) -> Iterator[int]:
+        """Тайлы территорий, центры которых не дальше radius тайлов от центра тайла position"""
+        center_y, center_x = get_coord_from_position(position, self.base_shape[0])
+        int_radius = int(radius)
+        for y in range(max(center_y - int_radius, 0), min(center_y + int_radius, self.base_shape[1] - 1) + 1):
+            for x in range(max(center_x - int_radius, 0), min(center_x + int_radius, self.base_shape[0] - 1) + 1):
+                if (x - center_x) ** 2 + (y - center_y) ** 2 <= radius ** 2:
+                    yield get_position_from_coord(x, y, self.base_shape[0])
+
+    def get_cities_in_radius(self, position: int, radius: float) -> list[City]:
+        return [
+            city
+            for tile_position in self.iter_positions_in_radius(position, radius)
+            for city in self.cities_by_tile.get(tile_position, [])
+        ]
+
+    def get_races_in_radius(self, position: int, radius: float) -> list[Race]:
+        return [
+            race
+            for tile_position in self.iter_positions_in_radius(position, radius)
+            for race in self.races_by_tile.get(tile_position, [])
+        ]
+
@@ -0,0 +1,136 @@
+import abc
+
+import numpy as np
+
+from .tiles import LandType
+
+#: Порядок типов территорий, номер в этом списке - код территории в массивах генераторов
+LAND_TYPES = list(LandType)
+
+
+class TerrainGenerator(abc.ABC):
+    """Генератор слоя территорий"""
+    name: str = ''
+
+    def __init__(self, percent_of_land: int = 40):
+        if not 0 <= percent_of_land <= 100:
+            raise ValueError('Количество процентов суши должно быть от 0 до 100')
+        self.percent_of_land = percent_of_land
+
+    @abc.abstractmethod
+    def generate(self, shape: tuple[int, int], rng: np.random.Generator) -> np.ndarray:
+        """
+        :return: коды территорий (номера в LAND_TYPES) для всех позиций слоя размера shape
+        """
+        pass
+
+    def __str__(self):
+        return self.name
+
+
+def land_code(land_type: LandType) -> int:
+    return LAND_TYPES.index(land_type)
+
+
+def value_noise(shape: tuple[int, int], period: float, rng: np.random.Generator) -> np.ndarray:
+    """
+    Шум значений: случайные значения в узлах решетки с шагом period
+    и сглаженная интерполяция между ними
+    :return: массив (высота, ширина) значений от 0 до 1
+    """
+    width, height = shape
+    grid = rng.random((int(height / period) + 2, int(width / period) + 2))
+    ys = np.arange(height) / period
+    xs = np.arange(width) / period
+    y0 = ys.astype(int)[:, None]
+    x0 = xs.astype(int)[None, :]
+    ty = _smoothstep(ys[:, None] - y0)
+    tx = _smoothstep(xs[None, :] - x0)
+
+    top = grid[y0, x0] + (grid[y0, x0 + 1] - grid[y0, x0]) * tx
+    bottom = grid[y0 + 1, x0] + (grid[y0 + 1, x0 + 1] - grid[y0 + 1, x0]) * tx
+    return top + (bottom - top) * ty
+
+
+def fractal_noise(
+        shape: tuple[int, int],
+        rng: np.random.Generator,
+        base_period: float,
+        octaves: int = 4,
+        persistence: float = 0.5,
+) -> np.ndarray:
+    """Сумма нескольких октав шума значений, каждая следующая мельче и слабее"""
+    noise = np.zeros((shape[1], shape[0]))
+    amplitude = 1.0
+    for octave in range(octaves):
+        period = max(base_period / 2 ** octave, 1)
+        noise += amplitude * value_noise(shape, period, rng)
+        amplitude *= persistence
+    return (noise - noise.min()) / max(noise.max() - noise.min(), 1e-9)
+
+
+def smooth_mask(mask: np.ndarray, steps: int) -> np.ndarray:
+    """Клеточный автомат: клетка становится сушей, если в ее окрестности 3x3 суши больше половины"""
+    height, width = mask.shape
+    for _ in range(steps):
+        padded = np.pad(mask, 1, mode='edge').astype(np.int8)
+        neighbours = np.zeros((height, width), dtype=np.int8)
+        for dy in range(3):
+            for dx in range(3):
+                neighbours += padded[dy:dy + height, dx:dx + width]
+        mask = neighbours >= 5
+    return mask
+
+
+def _smoothstep(t: np.ndarray) -> np.ndarray:
+    return t * t * (3 - 2 * t)
+
+
+class NoiseTerrainGenerator(TerrainGenerator):
+    """
+    Материки и острова по карте высот из фрактального шума.
+    Береговая линия сглаживается клеточным автоматом,
+    у воды появляется песок, на возвышенностях горы, а леса растут по карте влажности
+    """
+    name = 'noise'
+
+    def __init__(
+            self,
+            percent_of_land: int = 40,
+            smoothing_steps: int = 2,
+            sand_fraction: float = 0.15,
+            rock_fraction: float = 0.12,
+            forest_fraction: float = 0.35,
+    ):
+        super().__init__(percent_of_land)
+        self.smoothing_steps = smoothing_steps
+        self.sand_fraction = sand_fraction
+        self.rock_fraction = rock_fraction
+        self.forest_fraction = forest_fraction
+
+    def generate(self, shape: tuple[int, int], rng: np.random.Generator) -> np.ndarray:
+        base_period = max(shape) / 3
+        height_map = fractal_noise(shape, rng, base_period)
+        moisture_map = fractal_noise(shape, rng, base_period / 2)
+
+        water_level = np.quantile(height_map, 1 - self.percent_of_land / 100)
+        land = height_map > water_level if self.percent_of_land < 100 else np.ones_like(height_map, dtype=bool)
+        land = smooth_mask(land, self.smoothing_steps)
+
+        codes = np.full(height_map.shape, land_code(LandType.WATER))
+        if land.any():
+            land_heights = height_map[land]
+            sand_level = np.quantile(land_heights, self.sand_fraction)
+            rock_level = np.quantile(land_heights, 1 - self.rock_fraction)
+            forest_level = np.quantile(moisture_map[land], 1 - self.forest_fraction)
+
+            codes[land] = land_code(LandType.PLATEAU)
+            codes[land & (moisture_map >= forest_level)] = land_code(LandType.FOREST)
+            codes[land & (height_map <= sand_level)] = land_code(LandType.SAND)
+            codes[land & (height_map >= rock_level)] = land_code(LandType.ROCK)
+        return codes.ravel()
+
+
+TERRAIN_GENERATORS: dict[str, type[TerrainGenerator]] = {
+    NoiseTerrainGenerator.name: NoiseTerrainGenerator,
+}
@@ -1,8 +1,8 @@
 from enum import Enum
 from typing import Any, Union, Optional
 
-from .base_model import BaseModel
-from pydantic import Field
+from .base_model import BaseModel, intern_string
+from pydantic import Field, validator
 
 
 class Tile(BaseModel):
@@ -11,6 +11,8 @@ class Tile(BaseModel):
     creator: str = Field(None)
     name: str = Field(None)
 
+    _intern_strings = validator('image_ref', 'creator', 'name', allow_reuse=True)(intern_string)
+
     def __str__(self):
         return str(self.position)
 
@@ -0,0 +1,98 @@
+from typing import Iterator, Optional
+
+from PIL import GifImagePlugin, Image
+
+from .image_manager import IMAGE_COLLECTION_LOADERS, Viewport
+from .model import LayerName, World
+from .tiles import TILES, EmptyTile, Tile
+from .world_manager import WorldManager
+
+#: Ограничение на сторону анимации
+TIMELAPSE_MAX_IMAGE_SIZE = 1024
+#: Длительность кадров в миллисекундах, последний кадр показывается дольше
+FRAME_DURATION = 200
+LAST_FRAME_DURATION = 3000
+
+
+def make_tile(position: int, image_ref: Optional[str]) -> TILES:
+    if image_ref is None:
+        return EmptyTile.construct(position=position)
+    return Tile.construct(position=position, image_ref=image_ref)
+
+
+def get_initial_world(world: World) -> World:
+    """Копия слоев мира, в которой отменены все записанные в историю изменения тайлов"""
+    initial_world = World.construct(
+        name=world.name,
+        layers_shape=world.layers_shape,
+        layers={layer_name: layer.copy(deep=True) for layer_name, layer in world.layers.items()},
+    )
+    manager = WorldManager(initial_world)
+    for entry in world.iter_log_entries_backward():
+        for change in reversed(entry.tile_changes):
+            manager.change_tile(LayerName(change.layer_name), make_tile(change.position, change.previous_image_ref))
+    return initial_world
+
+
+def get_palette_image(first_frame: Image.Image) -> Image.Image:
+    """
+    Общая палитра всех кадров: цвета первого кадра и всех изображений тайлов,
+    чтобы в палитре были и те тайлы, которые появятся позже
+    """
+    tile_images = [
+        image.convert('RGB')
+        for loader in IMAGE_COLLECTION_LOADERS.values()
+        for image in loader().images.values()
+    ]
+    height = max(first_frame.height, *(image.height for image in tile_images))
+    sample = Image.new('RGB', (first_frame.width + sum(image.width for image in tile_images), height))
+    sample.paste(first_frame, (0, 0))
+    x = first_frame.width
+    for image in tile_images:
+        sample.paste(image, (x, 0))
+        x += image.width
+    return sample.quantize(256)
+
+
+def iter_timelapse_gif(world: World, max_image_size: int = TIMELAPSE_MAX_IMAGE_SIZE) -> Iterator[bytes]:
+    """
+    Анимация GIF того, как менялась карта мира, по кускам.
+    Первый кадр - карта до всех записанных в историю действий, каждый следующий кадр - только область,
+    которую изменило одно действие, она рисуется поверх предыдущего кадра.
+    Кадры кодируются по мере отрисовки и не накапливаются в памяти
+    """
+    manager = WorldManager(get_initial_world(world))
+    zoom = manager.calc_fit_zoom(max_image_size)
+    base_shape = manager.get_layer(LayerName.LANDS).shape
+    first_frame = manager.render_map(zoom=zoom).convert('RGB')
+    tile_width, tile_height = first_frame.width / base_shape[0], first_frame.height / base_shape[1]
+    palette_image = get_palette_image(first_frame)
+
+    def quantize(image: Image.Image) -> Image.Image:
+        return image.convert('RGB').quantize(palette=palette_image, dither=Image.NONE)
+
+    frame = quantize(first_frame)
+    header, _ = GifImagePlugin.getheader(frame, info={'loop': 0})
+    yield b''.join(header)
+
+    offset = (0, 0)
+    for entry in world.iter_log_entries():
+        if not entry.tile_changes:
+            continue
+        positions = []
+        for change in entry.tile_changes:
+            layer_name = LayerName(change.layer_name)
+            manager.change_tile(layer_name, make_tile(change.position, change.image_ref))
+            positions.append(manager.get_base_position(layer_name, change.position))
+
+        yield b''.join(GifImagePlugin.getdata(frame, offset=offset, duration=FRAME_DURATION))
+        viewport = Viewport.around_positions(positions, base_shape, margin=0)
+        offset = (round(viewport.x * tile_width), round(viewport.y * tile_height))
+        region = manager.render_map(viewport=viewport, zoom=zoom)
+        # из-за округления область может выйти за край карты на пиксель
+        frame = quantize(region.crop((
+            0, 0, min(region.width, first_frame.width - offset[0]), min(region.height, first_frame.height - offset[1])
+        )))
+
+    yield b''.join(GifImagePlugin.getdata(frame, offset=offset, duration=LAST_FRAME_DURATION))
+    yield b';'
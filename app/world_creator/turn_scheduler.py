@@ -0,0 +1,140 @@
+"""
+Пропуск хода богов, которые молчат слишком долго.
+Сроки ходов всех миров лежат в одной куче и обслуживаются одной задачей asyncio, которая спит до ближайшего срока,
+поэтому десятки тысяч ожидающих ходов не тратят процессор. Сроки не хранятся отдельно: они вычисляются
+по времени начала хода и последнего изменения мира, которые сохраняются в самом мире, и при запуске бота
+собираются заново по хранилищу
+"""
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from app.storage.storage import Storage
+from app.storage.sweeper import get_last_mutation_at
+from .model import World
+
+logger = logging.getLogger(__name__)
+
+#: Сколько бог может молчать в свой ход, прежде чем ход пропустят
+TURN_TIMEOUT = timedelta(hours=24)
+#: Во сколько раз куча может вырасти относительно числа ожидающих ходов, прежде чем из нее уберут устаревшие сроки
+MAX_HEAP_GROWTH = 2
+
+
+class TurnScheduler:
+    def __init__(self, storage: Storage, timeout: timedelta = TURN_TIMEOUT):
+        """
+        Срок хода - timeout с начала хода или с последнего изменения мира, если оно было позже.
+        Когда срок проходит, ход пропускается, если в мире хоть кто-то что-то делал за последний круг ходов,
+        иначе мир считается заброшенным и ходы в нем больше не пропускаются, пока игроки не вернутся
+        """
+        self.storage = storage
+        self.timeout = timeout
+        #: Сроки и id миров, срок мира меняется без удаления из кучи, поэтому в ней бывают устаревшие сроки
+        self._heap: list[tuple[datetime, int]] = []
+        #: Действующий срок хода каждого мира
+        self._deadlines: dict[int, datetime] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def get_deadline(self, world: World) -> Optional[datetime]:
+        if not world.is_turn_running:
+            return None
+        assert world.turn_started_at  # для mypy
+        return max(world.turn_started_at, world.last_mutation_at or world.turn_started_at) + self.timeout
+
+    def schedule(self, world_id: int, world: World):
+        """Обновляет срок хода мира, вызывается после каждого сохранения мира"""
+        deadline = self.get_deadline(world)
+        if deadline == self._deadlines.get(world_id):
+            return
+        if deadline is None:
+            self._deadlines.pop(world_id, None)
+            return
+
+        is_earliest = not self._heap or deadline < self._heap[0][0]
+        self._deadlines[world_id] = deadline
+        heapq.heappush(self._heap, (deadline, world_id))
+        if len(self._heap) > MAX_HEAP_GROWTH * len(self._deadlines):
+            self._heap = [(world_deadline, world) for world, world_deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+        if is_earliest and self._wakeup is not None:
+            self._wakeup.set()
+
+    def load(self) -> int:
+        """
+        Собирает сроки ходов по сохраненным мирам, у каждого мира читаются только общие данные.
+        Замороженные миры заброшены, их ходы не пропускаются
+        :return: количество ожидающих ходов
+        """
+        for world_id in self.storage.get_world_ids():
+            try:
+                self.schedule(world_id, self.storage.load_world(world_id))
+            except Exception:
+                logger.exception('Не удалось прочитать мир %s', world_id)
+        return len(self)
+
+    def get_next_deadline(self) -> Optional[datetime]:
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_expired(self, now: datetime) -> list[int]:
+        """id миров, срок хода в которых прошел, их сроки снимаются"""
+        expired: list[int] = []
+        while True:
+            deadline = self.get_next_deadline()
+            if deadline is None or deadline > now:
+                return expired
+            _, world_id = heapq.heappop(self._heap)
+            del self._deadlines[world_id]
+            expired.append(world_id)
+
+    def get_silent_god_id(self, world_id: int, now: datetime) -> Optional[int]:
+        """
+        Бог, ход которого пора пропустить, по миру из хранилища.
+        None - мир удален или заморожен, ход уже сменился или мир заброшен
+        """
+        if not self.storage.is_world_hot(world_id):
+            return None
+        world = self.storage.load_world(world_id)
+        deadline = self.get_deadline(world)
+        if deadline is None:
+            return None
+        if deadline > now:
+            self.schedule(world_id, world)
+            return None
+        if now - get_last_mutation_at(self.storage, world_id, world) >= self.timeout * max(len(world.gods), 1):
+            logger.info('В мире %s давно никто не ходит, ходы больше не пропускаются', world_id)
+            return None
+        return world.redactor_god_id
+
+    async def run(self, skip_turn: Callable[[int, int], Awaitable[None]]):
+        """
+        Фоновая задача бота: спит до ближайшего срока хода или до появления более раннего срока
+        :param skip_turn: пропускает ход бога в мире, принимает id мира и id бога
+        """
+        self._wakeup = asyncio.Event()
+        while True:
+            deadline = self.get_next_deadline()
+            timeout = None if deadline is None else (deadline - datetime.now(timezone.utc)).total_seconds()
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            now = datetime.now(timezone.utc)
+            for world_id in self.pop_expired(now):
+                try:
+                    god_id = self.get_silent_god_id(world_id, now)
+                    if god_id is not None:
+                        await skip_turn(world_id, god_id)
+                except Exception:
+                    logger.exception('Не удалось пропустить ход в мире %s', world_id)
@@ -1,3 +1,5 @@
+import numpy as np
+
 
 def get_position_from_coord(x: int, y: int, len_row: int):
     return x + y * len_row
@@ -5,3 +7,60 @@ def get_position_from_coord(x: int, y: int, len_row: int):
 
 def get_coord_from_position(position: int, len_row: int):
     return divmod(position, len_row)
+
+
+def get_base_position(position: int, len_row: int, base_len_row: int) -> int:
+    """
+    Тайл слоя территорий, в котором находится тайл более мелкого слоя, например слоя рас
+    :param len_row: длина строки слоя, которому принадлежит position
+    :param base_len_row: длина строки слоя территорий
+    """
+    coefficient = len_row // base_len_row
+    y, x = get_coord_from_position(position, len_row)
+    return get_position_from_coord(x // coefficient, y // coefficient, base_len_row)
+
+
+def get_num_chunks(len_row: int, chunk_size: int) -> int:
+    """Количество чанков, которое нужно чтобы покрыть len_row тайлов"""
+    return -(-len_row // chunk_size)
+
+
+def get_chunk_shape(chunk_position: int, shape: tuple[int, int], chunk_size: int) -> tuple[int, int]:
+    """Размер чанка в тайлах, краевые чанки слоя могут быть меньше chunk_size"""
+    chunk_y, chunk_x = get_coord_from_position(chunk_position, get_num_chunks(shape[0], chunk_size))
+    return (
+        min(chunk_size, shape[0] - chunk_x * chunk_size),
+        min(chunk_size, shape[1] - chunk_y * chunk_size),
+    )
+
+
+def get_chunk_from_position(position: int, len_row: int, chunk_size: int) -> tuple[int, int]:
+    """
+    Адрес тайла в слое, разбитом на чанки
+    :return: номер чанка и позиция тайла внутри чанка
+    """
+    y, x = get_coord_from_position(position, len_row)
+    chunk_y, local_y = divmod(y, chunk_size)
+    chunk_x, local_x = divmod(x, chunk_size)
+    chunk_width = min(chunk_size, len_row - chunk_x * chunk_size)
+    return (
+        get_position_from_coord(chunk_x, chunk_y, get_num_chunks(len_row, chunk_size)),
+        get_position_from_coord(local_x, local_y, chunk_width),
+    )
+
+
+def get_position_from_chunk(chunk_position: int, local_position: int, len_row: int, chunk_size: int) -> int:
+    """Обратное преобразование к get_chunk_from_position"""
+    chunk_y, chunk_x = get_coord_from_position(chunk_position, get_num_chunks(len_row, chunk_size))
+    chunk_width = min(chunk_size, len_row - chunk_x * chunk_size)
+    local_y, local_x = get_coord_from_position(local_position, chunk_width)
+    return get_position_from_coord(chunk_x * chunk_size + local_x, chunk_y * chunk_size + local_y, len_row)
+
+
+def get_chunks_from_positions(positions: np.ndarray, len_row: int, chunk_size: int) -> tuple[np.ndarray, np.ndarray]:
+    """Векторизованный вариант get_chunk_from_position для массива позиций"""
+    y, x = np.divmod(positions, len_row)
+    chunk_y, local_y = np.divmod(y, chunk_size)
+    chunk_x, local_x = np.divmod(x, chunk_size)
+    chunk_width = np.minimum(chunk_size, len_row - chunk_x * chunk_size)
+    return chunk_x + chunk_y * get_num_chunks(len_row, chunk_size), local_x + local_y * chunk_width
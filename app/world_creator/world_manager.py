@@ -1,24 +1,33 @@
-from copy import deepcopy
-from random import randint, choice
-from typing import Optional
+from datetime import datetime, timezone
+from random import randint
+from typing import Iterator, Optional
 
+import numpy as np
 from PIL import Image
 
 from .image_manager import (
-    load_climate_tiles,
-    load_event_tiles,
-    load_land_tiles,
-    load_race_init_tiles,
-    render_layer,
+    IMAGE_COLLECTION_LOADERS,
+    MAX_ZOOM_LEVEL,
+    Viewport,
     draw_grid,
-    paste_scaled_image_with_alpha
+    draw_route,
+    paste_layer_viewport,
+    paste_scaled_image_with_alpha,
 )
 from .model import World, Actions
-from .model import Layer, LayerName
+from .model import LAYERS, SPARSE_LAYER_NAMES, Layer, LayerChunk, LayerName, SparseLayer
 from .tiles import Tile, EmptyTile
+from .terrain import LAND_TYPES, TerrainGenerator
 from .tiles import LandType
+from .utils import get_base_position, get_coord_from_position, get_position_from_coord
 from .model import GodProfile
-from .model import Race
+from .model import City, LogEntry, Race, TileChange
+from .history import iter_gzip, iter_story_bytes
+from .landmass_index import LandmassIndex
+from .ownership_index import OwnershipIndex
+from .routing import Route, RoutingService
+from .search_index import SearchIndex
+from .spatial_index import SpatialIndex
 
 LAYER_SHAPE_SCALE_COEFFICIENT = 3
 
@@ -29,76 +38,256 @@ class Manager:
         Класс для управления объектом "мир"
         """
         self.world = world
-
-        self.is_creation_end = False
+        #: Изменения тайлов с последней записи в историю, попадут в следующую запись
+        self.tile_changes: list[TileChange] = []
+
+    @property
+    def is_creation_end(self) -> bool:
+        return self.world.is_creation_end
+
+    def start_turn(self, god_id: Optional[int]):
+        """Передает ход богу god_id, время начала хода нужно, чтобы пропустить ход бога, который молчит"""
+        self.world.set_trusted(redactor_god_id=god_id, turn_started_at=datetime.now(timezone.utc))
+
+    @property
+    def spatial_index(self) -> SpatialIndex:
+        """Индекс строится при первом обращении и дальше обновляется вместе с миром"""
+        if self.world._spatial_index is None:
+            self.world._spatial_index = SpatialIndex(self.world)
+        return self.world._spatial_index
+
+    @property
+    def ownership_index(self) -> OwnershipIndex:
+        """Индекс строится при первом обращении и дальше обновляется вместе с миром"""
+        if self.world._ownership_index is None:
+            self.world._ownership_index = OwnershipIndex(self.world)
+        return self.world._ownership_index
+
+    @property
+    def landmass_index(self) -> LandmassIndex:
+        """Индекс строится при первом обращении и дальше обновляется вместе с миром"""
+        if self.world._landmass_index is None:
+            self.world._landmass_index = LandmassIndex(self.world)
+        return self.world._landmass_index
+
+    @property
+    def routing(self) -> RoutingService:
+        """Сервис создается при первом обращении и хранит найденные маршруты, пока мир загружен"""
+        if self.world._routing is None:
+            self.world._routing = RoutingService(self.world)
+        return self.world._routing
+
+    @property
+    def search_index(self) -> SearchIndex:
+        """Индекс строится при первом поиске и дальше пополняется записями истории, событиями и расами"""
+        if self.world._search_index is None:
+            self.world._search_index = SearchIndex(self.world, self.spatial_index.get_base_position)
+        return self.world._search_index
+
+    def reset_layer_indexes(self):
+        """Массовое заполнение слоев не обновляет индексы тайлов, они перестроятся при следующем обращении"""
+        self.world._spatial_index = None
+        self.world._landmass_index = None
+        self.world._routing = None
 
     def change_tile(self, layer_name: LayerName, tile: Tile):
         layer = self.get_layer(layer_name)
-        layer.tiles[tile.position] = tile
-
-    def log(self, message: str):
-        self.world.change_log.append(message)
+        self.tile_changes.append(TileChange.construct(
+            layer_name=layer_name.value,
+            position=tile.position,
+            image_ref=tile.image_ref,
+            previous_image_ref=layer.get_tile(tile.position).image_ref,
+        ))
+        layer.set_tile(tile)
+        if self.world._spatial_index is not None:
+            self.world._spatial_index.update_tile(layer_name.value, tile)
+        if layer_name == LayerName.LANDS:
+            if self.world._landmass_index is not None:
+                self.world._landmass_index.update_tile(tile)
+            if self.world._routing is not None:
+                self.world._routing.update_tile(tile.position)
+
+    def get_random_generator(self) -> np.random.Generator:
+        """Генератор случайных чисел от зерна мира, чтобы создание мира можно было повторить"""
+        return np.random.default_rng(self.world.seed)
+
+    def log(
+        self,
+        message: str,
+        god: Optional[str] = None,
+        race: Optional[str] = None,
+        tile: Optional[int] = None,
+        event: Optional[str] = None,
+    ):
+        """
+        :param god, race, tile: бог, раса и тайл слоя территорий, по которым запись можно будет найти
+        :param event: описание события, созданного действием, событие ищется по полям этой записи
+        """
+        entry = LogEntry.construct(
+            n_era=self.world.n_era,
+            n_round=self.world.n_round,
+            message=message,
+            god=god,
+            race=race,
+            tile=tile,
+            event=event,
+            tile_changes=self.tile_changes,
+        )
+        self.tile_changes = []
+        self.world.add_log_entry(entry)
+        if self.world._search_index is not None:
+            self.world._search_index.add_log_entry(entry)
+
+    def add_event(self, description: str):
+        self.world.events.append(description)
+
+    def get_last_log_entries(self, num_entries: int) -> list[LogEntry]:
+        return list(self.world.iter_log_entries(self.world.log_length - num_entries))
+
+    def get_round_log_entries(self, n_era: int, n_round: int) -> list[LogEntry]:
+        """Записи истории за раунд, история читается с конца до начала этого раунда"""
+        entries = []
+        for entry in self.world.iter_log_entries_backward():
+            if entry.n_era is None or (entry.n_era, entry.n_round) < (n_era, n_round):
+                break
+            if (entry.n_era, entry.n_round) == (n_era, n_round):
+                entries.append(entry)
+        return entries[::-1]
 
     def fill_layer(self, layer_name: LayerName, filling_tile: Tile):
         layer = self.get_layer(layer_name)
-        layer.tiles = []
-        for i in range(layer.num_tiles):
-            filling_tile.position = i
-            layer.tiles.append(deepcopy(filling_tile))
+        self.reset_layer_indexes()
+        if isinstance(layer, SparseLayer):
+            layer.filled_tiles.clear()
+            if isinstance(filling_tile, EmptyTile):
+                return
+            layer.fill_positions(np.arange(layer.num_tiles), filling_tile)
+            return
+
+        layer.chunks.clear()
+        for chunk_position in range(layer.num_chunks):
+            chunk_shape = layer.get_chunk_shape(chunk_position)
+            tiles = []
+            for local_position in range(chunk_shape[0] * chunk_shape[1]):
+                position = layer.get_position_from_chunk(chunk_position, local_position)
+                tiles.append(filling_tile.copy(update={'position': position}))
+            layer.chunks[chunk_position] = LayerChunk.construct(shape=chunk_shape, tiles=tiles)
 
     def random_partial_fill_layer(self, layer_name: LayerName, percent_filling: int, filling_tile: Tile):
         if 0 > percent_filling > 100:
             raise ValueError('Количество процентов заполненности слоя должно быть от 0 до 100')
 
         layer = self.get_layer(layer_name)
+        self.reset_layer_indexes()
 
-        not_changed_tile_positions = list(range(layer.num_tiles))
-        while round(layer.num_tiles * (1 - percent_filling / 100)) < len(not_changed_tile_positions):
-            pos = choice(not_changed_tile_positions)
-            not_changed_tile_positions.remove(pos)
-            filling_tile.position = pos
-            layer.tiles[pos] = deepcopy(filling_tile)
+        num_filling_tiles = layer.num_tiles - round(layer.num_tiles * (1 - percent_filling / 100))
+        positions = self.get_random_generator().permutation(layer.num_tiles)[:num_filling_tiles]
+        layer.fill_positions(positions, filling_tile)
 
     def create_layer(self, layer_name: LayerName, shape: tuple[int, int] = None):
-        self.world.layers[layer_name.value] = Layer(layer_name=layer_name.value, shape=shape or self.world.layers_shape)
-        self.fill_layer(layer_name, EmptyTile(position=0))
+        shape = shape or self.world.layers_shape
+        layer: LAYERS
+        if layer_name in SPARSE_LAYER_NAMES:
+            layer = SparseLayer(layer_name=layer_name.value, shape=shape)
+        else:
+            layer = Layer(layer_name=layer_name.value, shape=shape)
+        self.world.layers[layer_name.value] = layer
+        self.fill_layer(layer_name, EmptyTile.construct(position=0))
 
-    def get_layer(self, layer_name: LayerName) -> Layer:
+    def get_layer(self, layer_name: LayerName) -> LAYERS:
         layer = self.world.layers.get(layer_name.value)
         if layer is None:
             raise ValueError(f'Нет слоя с названием: {layer_name}')
         return layer
 
-    def render_map(self, add_grid_for_layer: Optional[LayerName] = None) -> Image:
-        world_map_image = None
-        image_collection_loaders = [
-            load_land_tiles,
-            load_climate_tiles,
-            load_race_init_tiles,
-            load_event_tiles,
-        ]
-        for layer_name, image_collection_loader in zip(LayerName, image_collection_loaders):
+    def get_base_position(self, layer_name: LayerName, position: int) -> int:
+        """Тайл слоя территорий, в котором находится тайл position слоя layer_name"""
+        return get_base_position(
+            position, self.get_layer(layer_name).shape[0], self.get_layer(LayerName.LANDS).shape[0]
+        )
+
+    def get_full_viewport(self) -> Viewport:
+        shape = self.get_layer(LayerName.LANDS).shape
+        return Viewport(width=shape[0], height=shape[1])
+
+    def get_viewport_around(self, position: int, radius: int, layer_name: LayerName = LayerName.LANDS) -> Viewport:
+        """Квадратная область карты с центром в тайле position слоя layer_name"""
+        base_shape = self.get_layer(LayerName.LANDS).shape
+        layer = self.get_layer(layer_name)
+        coefficient = layer.shape[0] // base_shape[0]
+        y, x = get_coord_from_position(position, layer.shape[0])
+        center = get_position_from_coord(x // coefficient, y // coefficient, base_shape[0])
+        return Viewport.from_center(center, radius, base_shape)
+
+    def calc_fit_zoom(self, max_image_size: int, viewport: Optional[Viewport] = None) -> int:
+        """Наименьшее уменьшение, при котором карта в области просмотра не больше max_image_size пикселей"""
+        viewport = viewport or self.get_full_viewport()
+        tile_size = max(IMAGE_COLLECTION_LOADERS[LayerName.LANDS]().image_size)
+        zoom = 0
+        while zoom < MAX_ZOOM_LEVEL and max(viewport.width, viewport.height) * tile_size / 2 ** zoom > max_image_size:
+            zoom += 1
+        return zoom
+
+    def render_map(
+            self,
+            add_grid_for_layer: Optional[LayerName] = None,
+            viewport: Optional[Viewport] = None,
+            zoom: int = 0,
+    ) -> Image:
+        """
+        :param viewport: область карты в тайлах слоя территорий, по умолчанию вся карта
+        :param zoom: уровень уменьшения, каждый следующий уровень уменьшает карту в 2 раза
+        """
+        base_shape = self.get_layer(LayerName.LANDS).shape
+        viewport = (viewport or self.get_full_viewport()).clip(base_shape)
+        tile_size = IMAGE_COLLECTION_LOADERS[LayerName.LANDS]().image_size
+        world_map_image = Image.new('RGBA', (
+            max(round(viewport.width * tile_size[0] / 2 ** zoom), 1),
+            max(round(viewport.height * tile_size[1] / 2 ** zoom), 1),
+        ))
+        for layer_name, image_collection_loader in IMAGE_COLLECTION_LOADERS.items():
             layer = self.get_layer(layer_name)
-            layer_image = render_layer(layer, image_collection_loader())
-            if world_map_image:
-                paste_scaled_image_with_alpha(world_map_image, layer_image)
-            else:
-                world_map_image = layer_image
+            paste_layer_viewport(
+                world_map_image,
+                layer,
+                image_collection_loader(),
+                viewport.scaled(layer.shape[0] // base_shape[0]),
+                with_alpha=layer_name != LayerName.LANDS,
+            )
 
-        assert world_map_image  # для mypy, точно знаем что не None
         if add_grid_for_layer:
             gird_layer = self.get_layer(add_grid_for_layer)
-            grid_image = draw_grid(world_map_image.size, gird_layer.shape)
+            grid_viewport = viewport.scaled(gird_layer.shape[0] // base_shape[0])
+            grid_image = draw_grid(
+                world_map_image.size,
+                (grid_viewport.width, grid_viewport.height),
+                offset=(grid_viewport.x, grid_viewport.y),
+                len_row=gird_layer.shape[0],
+            )
             paste_scaled_image_with_alpha(world_map_image, grid_image)
 
         return world_map_image
 
+    def render_route(self, route: Route, viewport: Optional[Viewport] = None, zoom: int = 0) -> Image:
+        """Карта с нарисованным поверх маршрутом"""
+        base_shape = self.get_layer(LayerName.LANDS).shape
+        viewport = (viewport or self.get_full_viewport()).clip(base_shape)
+        world_map_image = self.render_map(viewport=viewport, zoom=zoom)
+        route_image = draw_route(
+            world_map_image.size,
+            (viewport.width, viewport.height),
+            [get_coord_from_position(position, base_shape[0])[::-1] for position in route.positions],
+            offset=(viewport.x, viewport.y),
+        )
+        paste_scaled_image_with_alpha(world_map_image, route_image)
+        return world_map_image
+
     def calc_action_cost(self, action: Actions) -> int:
         return action.value.costs[self.world.n_era]
 
     def spend_force(self, god_id: int, value: int):
         god = self.world.gods[god_id]
-        god.value_force -= value
+        god.set_trusted(value_force=god.value_force - value)
 
 
 class WorldManager(Manager):
@@ -116,31 +305,51 @@ class WorldManager(Manager):
         self.create_layer(LayerName.RACE, shape=scaled_shape)
         self.create_layer(LayerName.EVENT, shape=scaled_shape)
 
-    def fill_base_lands_layer(self, percent_of_plateau: int = 40):
+    def fill_base_lands_layer(self, percent_of_plateau: int = 40, generator: Optional[TerrainGenerator] = None):
         """
         Создает слой Территории и случайно заполняет его тайлами "вода" и "плато"
         :param percent_of_plateau: процентное соотношение "плато" к площади всего слоя
+        :param generator: генератор ландшафта, который заполнит слой вместо случайного разбрасывания плато
         """
+        if generator is not None:
+            self.generate_lands_layer(generator)
+            return
+
         self.fill_layer(
             layer_name=LayerName.LANDS,
-            filling_tile=Tile(position=0, image_ref=LandType.WATER.value)
+            filling_tile=Tile.construct(position=0, image_ref=LandType.WATER.value)
         )
         self.random_partial_fill_layer(
             layer_name=LayerName.LANDS,
             percent_filling=percent_of_plateau,
-            filling_tile=Tile(position=0, image_ref=LandType.PLATEAU.value)
+            filling_tile=Tile.construct(position=0, image_ref=LandType.PLATEAU.value)
         )
 
         self.log(
             f'Мир был создан с {percent_of_plateau} процентным соотношением земля/(земля + вода)'
         )
 
-    def render_story(self) -> str:
-        out_str = ''
-        for change in self.world.change_log:
-            out_str += str(change) + '\n'
+    def generate_lands_layer(self, generator: TerrainGenerator):
+        layer = self.get_layer(LayerName.LANDS)
+        self.reset_layer_indexes()
+        land_codes = generator.generate(layer.shape, self.get_random_generator())
+        for code, land_type in enumerate(LAND_TYPES):
+            layer.fill_positions(
+                np.flatnonzero(land_codes == code),
+                Tile.construct(position=0, image_ref=land_type.value)
+            )
 
-        return out_str
+        self.log(
+            f'Мир был создан генератором ландшафта {generator} с {generator.percent_of_land} процентами суши'
+        )
+
+    def iter_story(self, compress: bool = False) -> Iterator[bytes]:
+        """
+        Вся история мира текстом по кускам
+        :param compress: сжимать ли историю в gzip
+        """
+        chunks = iter_story_bytes(self.world.iter_log_entries())
+        return iter_gzip(chunks) if compress else chunks
 
 
 class GodManager(Manager):
@@ -149,23 +358,21 @@ class GodManager(Manager):
         self._god_id = god_id
 
     def start_new_round(self):
-        self.world.redactor_god_id = list(self.world.gods.keys())[0]
-        self.world.n_round += 1
+        self.world.set_trusted(n_round=self.world.n_round + 1)
+        self.start_turn(list(self.world.gods.keys())[0])
         for god_id, god in self.world.gods.items():
-            god.confirm_end_round = False
+            god.set_trusted(confirm_end_round=False)
             self.receive_force(god_id)
 
     def start_new_era(self):
         if self.world.n_era > 3:
             self.log('Мир создан')
-            self.is_creation_end = True
+            self.world.set_trusted(is_creation_end=True)
             return
 
-        self.world.n_era += 1
-        self.world.n_round = -1
+        self.world.set_trusted(n_era=self.world.n_era + 1, n_round=-1)
         for god in self.world.gods.values():
-            god.confirm_end_round = False
-            god.confirm_end_era = False
+            god.set_trusted(confirm_end_round=False, confirm_end_era=False)
 
     def add_god_profile(self, god: GodProfile):
         if getattr(self.world.gods.get(self._god_id), 'name', None) == god.name:
@@ -178,22 +385,17 @@ class GodManager(Manager):
         bonus = god.bonus_force
         if god.value_force < 5:
             if god.bonus_force < 3:
-                god.bonus_force += 1
+                god.set_trusted(bonus_force=god.bonus_force + 1)
         else:
-            god.bonus_force = 0
+            god.set_trusted(bonus_force=0)
 
-        god.value_force += randint(1, 6) + randint(1, 6) + bonus
+        god.set_trusted(value_force=god.value_force + randint(1, 6) + randint(1, 6) + bonus)
 
     def get_controlled_race_names(self) -> list[str]:
         god = self.world.gods.get(self._god_id)
         if not god:
             raise ValueError(f'Нет бога с id {self._god_id}')
-        race_names = []
-        for race in self.world.races.values():
-            for fraction in race.fractions:
-                if fraction.god_owner == god.name:
-                    race_names.append(race.name)
-        return race_names
+        return self.ownership_index.get_controlled_race_names(god.name)
 
 
 class RaceManager(Manager):
@@ -205,3 +407,22 @@ class RaceManager(Manager):
 
     def is_exist_race(self, name: str):
         return self.world.races.get(name) is not None
+
+    def add_race(self, race: Race):
+        self.world.races[race.name] = race
+        if self.world._spatial_index is not None:
+            self.world._spatial_index.add_race(race)
+        if self.world._ownership_index is not None:
+            self.world._ownership_index.add_race(race)
+        if self.world._search_index is not None:
+            self.world._search_index.add_race(race)
+
+    def change_alignment(self, race: Race, alignment: int):
+        race.set_trusted(alignment=race.alignment + alignment)
+
+    def add_city(self, city: City):
+        self.world.cities.append(city)
+        if self.world._spatial_index is not None:
+            self.world._spatial_index.add_city(city)
+        if self.world._ownership_index is not None:
+            self.world._ownership_index.add_city(city)
@@ -0,0 +1,73 @@
+"""
+Сколько памяти занимает прочитанный из файла мир с общими строками (типы тайлов, имена богов и рас) и без них.
+Запуск: make memory_report
+"""
+import gc
+import tracemalloc
+from unittest import mock
+
+from app.world_creator.model import LayerName, Race, RaceFraction, World
+from app.world_creator.tiles import ImageRef, LandType, Tile
+from app.world_creator.world_manager import RaceManager, WorldManager
+
+LAYERS_SHAPE = (60, 60)
+GOD_NAMES = ('Один', 'Локи', 'Тор', 'Фрейя')
+
+
+def create_world_data() -> str:
+    """Мир, в котором боги изменили каждый четвертый тайл и создали расы"""
+    world = World(name='memory', layers_shape=LAYERS_SHAPE, seed=1)
+    manager = WorldManager(world)
+    manager.add_init_layers()
+    manager.fill_base_lands_layer(50)
+    lands_layer = manager.get_layer(LayerName.LANDS)
+    for position in range(0, lands_layer.num_tiles, 4):
+        god_name = GOD_NAMES[position % len(GOD_NAMES)]
+        manager.change_tile(
+            LayerName.LANDS, Tile(position=position, image_ref=LandType.FOREST.value, creator=god_name)
+        )
+        manager.change_tile(
+            LayerName.EVENT, Tile(position=position * 3, image_ref=ImageRef.EVENT.value, creator=god_name)
+        )
+    race_manager = RaceManager(world)
+    for i in range(100):
+        god_name = GOD_NAMES[i % len(GOD_NAMES)]
+        race_manager.add_race(Race(
+            name=f'раса {i}',
+            description='',
+            init_position=i,
+            god_creator=god_name,
+            fractions=[RaceFraction(god_owner=god_name, name=f'раса {i}')],
+        ))
+    return world.json()
+
+
+def measure_world(world_data: str) -> int:
+    """Байты, которые занимает мир после чтения"""
+    gc.collect()
+    tracemalloc.start()
+    world = World.parse_raw(world_data)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del world
+    return size
+
+
+def main():
+    world_data = create_world_data()
+    # первое чтение заполняет таблицу общих строк, она не относится к миру
+    measure_world(world_data)
+    interned_size = measure_world(world_data)
+    with mock.patch('sys.intern', lambda value: value):
+        plain_size = measure_world(world_data)
+
+    num_tiles = sum(World.parse_raw(world_data).layers[layer_name.value].num_tiles for layer_name in LayerName)
+    print(f'Мир {LAYERS_SHAPE[0]}x{LAYERS_SHAPE[1]}, тайлов на всех слоях: {num_tiles}')
+    print(f'{"":25} {"байт на мир":>12} {"байт на тайл":>13}')
+    print(f'{"без общих строк":25} {plain_size:12} {plain_size / num_tiles:13.1f}')
+    print(f'{"с общими строками":25} {interned_size:12} {interned_size / num_tiles:13.1f}')
+    print(f'Экономия: {(plain_size - interned_size) / plain_size:.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Сравнение создания и изменения объектов модели с проверкой и без нее на частых операциях менеджеров.
+Запуск: make benchmark
+"""
+import timeit
+
+from app.world_creator.model import CHUNK_SIZE, GodProfile, LayerChunk, LogEntry
+from app.world_creator.tiles import EmptyTile, Tile
+
+NUMBER = 20000
+#: Чанков меньше, каждый из них создается дольше
+CHUNK_NUMBER = 50
+
+
+def _assign_validated(god: GodProfile):
+    god.value_force -= 1
+
+
+def _assign_trusted(god: GodProfile):
+    god.set_trusted(value_force=god.value_force - 1)
+
+
+CASES = {
+    'Tile': (
+        lambda: Tile(position=1, image_ref='WATER'),
+        lambda: Tile.construct(position=1, image_ref='WATER'),
+    ),
+    'EmptyTile (пустой тайл разреженного слоя)': (
+        lambda: EmptyTile(position=1),
+        lambda: EmptyTile.construct(position=1),
+    ),
+    'LogEntry': (
+        lambda: LogEntry(n_era=1, n_round=2, message='бог изменил ландшафт', god='бог', tile=3),
+        lambda: LogEntry.construct(n_era=1, n_round=2, message='бог изменил ландшафт', god='бог', tile=3),
+    ),
+}
+
+
+def main():
+    god = GodProfile(name='god')
+    cases = {
+        **CASES,
+        'присвоение силы бога': (lambda: _assign_validated(god), lambda: _assign_trusted(god)),
+    }
+    print(f'{"операция":45} {"с проверкой, мкс":>18} {"без проверки, мкс":>18} {"ускорение":>10}')
+    for name, (validated, trusted) in cases.items():
+        validated_time = timeit.timeit(validated, number=NUMBER) / NUMBER * 1e6
+        trusted_time = timeit.timeit(trusted, number=NUMBER) / NUMBER * 1e6
+        print(f'{name:45} {validated_time:18.2f} {trusted_time:18.2f} {validated_time / trusted_time:9.1f}x')
+
+    tiles = [Tile.construct(position=position) for position in range(CHUNK_SIZE * CHUNK_SIZE)]
+    shape = (CHUNK_SIZE, CHUNK_SIZE)
+    validated_time = timeit.timeit(lambda: LayerChunk(shape=shape, tiles=tiles), number=CHUNK_NUMBER)
+    trusted_time = timeit.timeit(lambda: LayerChunk.construct(shape=shape, tiles=tiles), number=CHUNK_NUMBER)
+    name = f'LayerChunk {CHUNK_SIZE}x{CHUNK_SIZE} (заполнение слоя)'
+    print(f'{name:45} {validated_time / CHUNK_NUMBER * 1e6:18.2f} {trusted_time / CHUNK_NUMBER * 1e6:18.2f} '
+          f'{validated_time / trusted_time:9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
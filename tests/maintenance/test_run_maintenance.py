@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+from app.maintenance.run_maintenance import main
+from app.maintenance.world_tasks import render_world, resave_world, validate_world
+from app.storage.archive import ImportJournal
+from app.storage.storage import Storage
+from app.world_creator.image_encoder import EncodingPolicy
+from app.world_creator.model import SCHEMA_VERSION
+from app.world_creator.world_manager import WorldManager
+
+
+@pytest.fixture
+def storage(tmp_path, world) -> Storage:
+    storage = Storage(tmp_path)
+    manager = WorldManager(world)
+    manager.add_init_layers()
+    manager.fill_base_lands_layer(50)
+    manager.log('Мир создан')
+    storage.save_world(1, world)
+    storage._get_legacy_path(2).write_text(world.json())
+    storage.get_world_dir(3).mkdir()
+    storage._get_section_path(3, 'meta').write_text('{"name": ')
+    return storage
+
+
+def test_validate_world(storage, world):
+    assert validate_world(storage.storage_dir, 1).is_ok
+    assert validate_world(storage.storage_dir, 2).log_length == world.log_length
+
+    report = validate_world(storage.storage_dir, 3)
+
+    assert not report.is_ok
+    assert report.num_bytes == len('{"name": ')
+
+
+def test_resave_legacy_world(storage):
+    report = resave_world(storage.storage_dir, 2)
+
+    assert report.is_ok
+    assert not storage._get_legacy_path(2).exists()
+    assert storage.load_world(2).load_all() == storage.load_world(1).load_all()
+    assert resave_world(storage.storage_dir, 2).details == 'переписано секций: 0'
+
+
+def test_render_world_is_cached(storage):
+    report = render_world(storage.storage_dir, 1, EncodingPolicy())
+
+    assert report.is_ok
+    assert [path.name for path in storage.get_cache_dir(1).iterdir()] == [report.details.split(',')[0]]
+
+
+def test_main(storage, capsys):
+    exit_code = main(['--storage-dir', str(storage.storage_dir), '--workers', '2', 'report'])
+
+    output = capsys.readouterr().out
+    assert exit_code == 1
+    assert 'report: обработано миров 3' in output
+    assert 'ошибок 1' in output
+    assert 'одним файлом' in output
+
+    assert main(['--storage-dir', str(storage.storage_dir), '--world', '1', '--world', '2', 'validate']) == 0
+
+
+def test_export_and_resume_import(storage, tmp_path, capsys):
+    archive_path = tmp_path / 'worlds.tar.gz'
+    target = Storage(tmp_path / 'restored')
+    journal = ImportJournal(tmp_path / 'worlds.tar.gz.journal')
+    journal.record(2)
+
+    assert main(['--storage-dir', str(storage.storage_dir), 'export', str(archive_path)]) == 0
+    assert main(['--storage-dir', str(target.storage_dir), '--workers', '2', 'import', str(archive_path)]) == 1
+
+    assert target.get_world_ids() == [1]
+    assert target.load_world(1).load_all() == storage.load_world(1).load_all()
+    assert journal.load() == {1, 2}
+
+    capsys.readouterr()
+    assert main(['--storage-dir', str(target.storage_dir), 'import', str(archive_path)]) == 1
+    assert 'import: обработано миров 1' in capsys.readouterr().out
+
+    journal.path.unlink()
+    assert main(['--storage-dir', str(target.storage_dir), '--world', '2', 'import', str(archive_path)]) == 0
+    assert target.get_world_ids() == [1, 2]
+    assert not journal.path.exists()
+
+
+def test_migrate_and_rollback(storage, capsys):
+    meta_path = storage._get_section_path(1, 'meta')
+    old_meta = json.loads(meta_path.read_text())
+    old_meta.pop('schema_version')
+    meta_path.write_text(json.dumps(old_meta))
+    old_sections = storage.read_world_sections(1)
+    legacy_data = storage._get_legacy_path(2).read_text()
+    storage_dir = str(storage.storage_dir)
+
+    assert main(['--storage-dir', storage_dir, '--world', '1', '--world', '2', 'migrate', '--dry-run']) == 0
+    assert 'схема 0 -> ' in capsys.readouterr().out
+    assert storage.read_world_sections(1) == old_sections
+
+    assert main(['--storage-dir', storage_dir, '--world', '1', '--world', '2', 'migrate']) == 0
+    assert storage.get_stored_schema_version(1) == SCHEMA_VERSION
+    assert not storage.is_world_legacy(2)
+    capsys.readouterr()
+    assert main(['--storage-dir', storage_dir, '--world', '1', 'migrate']) == 0
+    assert 'уже в текущей схеме' in capsys.readouterr().out
+
+    assert main(['--storage-dir', storage_dir, 'rollback']) == 0
+    assert storage.read_world_sections(1) == old_sections
+    assert storage._get_legacy_path(2).read_text() == legacy_data
+    assert not storage.get_world_dir(2).exists()
+
+
+def test_check_and_repair(storage):
+    args = ['--storage-dir', str(storage.storage_dir), '--workers', '2', 'check']
+
+    assert main(args) == 1
+    assert storage.is_world_exist(3)
+
+    assert main([*args, '--repair']) == 1
+    assert storage.get_world_ids() == [1, 2]
+    assert len(list(storage.get_quarantine_dir().iterdir())) == 1
+
+    assert main(args) == 0
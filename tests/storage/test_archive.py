@@ -0,0 +1,97 @@
+import io
+
+import pytest
+
+from app.storage.archive import ImportJournal, WorldArchiveWriter, iter_archive_worlds, parse_world_sections
+from app.storage.storage import Storage
+from app.world_creator.model import LayerName
+from app.world_creator.tiles import LandType, Tile
+from app.world_creator.world_manager import WorldManager
+
+
+@pytest.fixture
+def storage(tmp_path) -> Storage:
+    return Storage(tmp_path / 'worlds')
+
+
+@pytest.fixture
+def manager(world) -> WorldManager:
+    manager = WorldManager(world)
+    manager.add_init_layers()
+    manager.fill_base_lands_layer(50)
+    manager.log('Мир создан')
+    return manager
+
+
+def _write_archive(worlds: dict[int, dict[str, str]]) -> io.BytesIO:
+    file = io.BytesIO()
+    with WorldArchiveWriter(file) as writer:
+        for world_id, sections in worlds.items():
+            writer.add_world(world_id, sections)
+    file.seek(0)
+    return file
+
+
+def test_archive_roundtrip(storage, manager):
+    storage.save_world(1, manager.world)
+    sections = storage.read_world_sections(1)
+
+    archived_worlds = list(iter_archive_worlds(_write_archive({1: sections, -5: sections})))
+
+    assert [archived.manifest.world_id for archived in archived_worlds] == [1, -5]
+    archived_worlds[0].manifest.verify(archived_worlds[0].sections)
+    assert archived_worlds[0].sections == sections
+    assert parse_world_sections(sections) == manager.world
+
+
+def test_verify_checksums(storage, manager):
+    storage.save_world(1, manager.world)
+    archived = next(iter_archive_worlds(_write_archive({1: storage.read_world_sections(1)})))
+
+    archived.sections['meta'] = archived.sections['meta'].replace('test', 'тест')
+    with pytest.raises(ValueError, match='Контрольная сумма секции meta мира 1 не совпадает'):
+        archived.manifest.verify(archived.sections)
+    archived.sections.pop('meta')
+    with pytest.raises(ValueError, match='Секции мира 1 не совпадают с манифестом'):
+        archived.manifest.verify(archived.sections)
+
+
+def test_truncated_archive(storage, manager):
+    storage.save_world(1, manager.world)
+    data = _write_archive({1: storage.read_world_sections(1), 2: {'meta': '{}'}}).getvalue()
+
+    with pytest.raises(Exception):
+        list(iter_archive_worlds(io.BytesIO(data[:len(data) // 2])))
+
+
+def test_read_legacy_world_sections(storage, manager):
+    storage.storage_dir.mkdir()
+    storage._get_legacy_path(1).write_text(manager.world.json())
+
+    assert parse_world_sections(storage.read_world_sections(1)) == manager.world
+
+
+def test_write_world_sections(storage, manager):
+    storage.save_world(1, manager.world)
+    storage.get_snapshot_store(1).record(manager.world)
+    sections = storage.read_world_sections(1)
+    manager.change_tile(LayerName.LANDS, Tile(position=0, image_ref=LandType.ROCK.value))
+    storage.save_world(2, manager.world)
+
+    storage.write_world_sections(2, sections)
+    storage.write_world_sections(1, sections)
+
+    assert storage.read_world_sections(2) == sections
+    assert storage.load_world(2).load_all() == storage.load_world(1).load_all()
+    assert storage.get_snapshot_store(1).load_history().snapshots == []
+    assert storage.get_world_ids() == [1, 2]
+
+
+def test_import_journal(tmp_path):
+    journal = ImportJournal(tmp_path / 'import.journal')
+    assert journal.load() == set()
+
+    journal.record(1)
+    journal.record(-7)
+
+    assert ImportJournal(journal.path).load() == {1, -7}
@@ -0,0 +1,145 @@
+import json
+import logging
+
+import pytest
+
+from app.storage.integrity import check_storage, check_world
+from app.storage.storage import Storage
+from app.world_creator.model import City, LayerName
+from app.world_creator.world_manager import WorldManager
+
+
+@pytest.fixture
+def storage(tmp_path, world) -> Storage:
+    storage = Storage(tmp_path)
+    manager = WorldManager(world)
+    manager.add_init_layers()
+    manager.fill_base_lands_layer(50)
+    manager.log('Мир создан')
+    storage.save_world(1, world)
+    return storage
+
+
+def update_section(storage: Storage, section_name: str, update):
+    path = storage._get_section_path(1, section_name)
+    path.write_text(json.dumps(update(json.loads(path.read_text()))))
+
+
+def test_check_healthy_world(storage):
+    sections = storage.read_world_sections(1)
+
+    report = check_world(storage, 1, repair=True)
+
+    assert report.is_ok and not report.is_repaired
+    assert storage.read_world_sections(1) == sections
+
+
+def test_truncated_section_is_quarantined(storage):
+    storage.get_snapshot_store(1).record(storage.load_world(1).load_all())
+    path = storage._get_section_path(1, 'layers/lands/0')
+    truncated = path.read_text()[:100]
+    path.write_text(truncated)
+
+    report = check_world(storage, 1)
+
+    assert [problem.section for problem in report.problems] == ['layers/lands/0']
+    assert report.is_fatal and storage.is_world_exist(1)
+
+    report = check_world(storage, 1, repair=True)
+
+    assert not storage.is_world_exist(1)
+    assert storage.get_world_ids() == []
+    assert storage.get_snapshot_store(1).load_history().snapshots == []
+    assert report.quarantine_path.parent == storage.get_quarantine_dir()
+    assert (report.quarantine_path / '1' / 'layers' / 'lands' / '0.json').read_text() == truncated
+    assert 'layers/lands/0' in (report.quarantine_path / 'reason.txt').read_text()
+
+
+def test_truncated_legacy_world_is_quarantined(storage, world):
+    storage._get_legacy_path(2).write_text(world.json()[:-10])
+
+    report = check_world(storage, 2, repair=True)
+
+    assert report.problems[0].section is None
+    assert (report.quarantine_path / '2.json').exists()
+    assert not storage.is_world_exist(2)
+
+
+def test_short_chunks_are_repaired(storage):
+    update_section(storage, 'layers/lands/0', lambda chunk: {**chunk, 'tiles': chunk['tiles'][:5]})
+    storage._get_section_path(1, 'layers/climate/0').unlink()
+
+    report = check_world(storage, 1, repair=True)
+
+    assert report.is_resolved and not report.is_fatal
+    assert [problem.section for problem in report.problems] == ['layers/climate', 'layers/lands']
+    world = storage.load_world(1)
+    for layer_name in (LayerName.LANDS, LayerName.CLIMATE):
+        layer = world.layers[layer_name.value]
+        assert [tile.position for tile in layer.tiles] == list(range(layer.num_tiles))
+    assert check_world(storage, 1).is_ok
+
+
+def test_misplaced_tiles_are_reported(storage):
+    def shift_tiles(chunk: dict) -> dict:
+        return {**chunk, 'tiles': chunk['tiles'][1:] + chunk['tiles'][:1]}
+
+    update_section(storage, 'layers/lands/0', shift_tiles)
+
+    report = check_world(storage, 1, repair=True)
+
+    assert not report.is_fatal and not report.is_repaired
+    assert report.problems[0].section == 'layers/lands'
+    assert storage.is_world_hot(1)
+
+
+def test_sparse_tiles_outside_layer_are_dropped(storage, world):
+    num_tiles = world.layers[LayerName.RACE.value].num_tiles
+    path = storage._get_section_path(1, 'layers/race/0')
+    path.parent.mkdir()
+    path.write_text(json.dumps({
+        num_tiles + 5: {'position': num_tiles + 5, 'image_ref': 'city'},
+    }))
+
+    report = check_world(storage, 1, repair=True)
+
+    assert report.is_repaired
+    assert storage.load_world(1).layers[LayerName.RACE.value].filled_tiles == {}
+
+
+def test_missing_redactor_god_is_repaired(storage):
+    update_section(storage, 'meta', lambda meta: {
+        **meta, 'gods': {'7': {'name': 'Локи'}, '8': {'name': 'Тор', 'confirm_end_round': True}},
+        'redactor_god_id': 5,
+    })
+
+    report = check_world(storage, 1, repair=True)
+
+    assert report.is_repaired
+    assert report.problems[0].section == 'meta'
+    assert storage.load_world(1).redactor_god_id == 7
+
+
+def test_city_of_missing_race_is_reported(storage):
+    city = City(name='Город', base_race_name='Эльфы', fractions=[], alignment=0)
+    update_section(storage, 'cities', lambda cities: [*cities, json.loads(city.json())])
+
+    report = check_world(storage, 1, repair=True)
+
+    assert report.problems[0].section == 'cities'
+    assert not report.is_fatal and not report.is_resolved
+    assert report.quarantine_path is None and storage.is_world_hot(1)
+    assert storage.load_world(1).cities[-1].base_race_name == 'Эльфы'
+
+
+def test_check_storage(storage, world, caplog):
+    storage._get_legacy_path(2).write_text(world.json())
+    storage.get_world_dir(3).mkdir()
+    storage._get_section_path(3, 'meta').write_text('{"name": ')
+
+    with caplog.at_level(logging.INFO):
+        reports = check_storage(storage, repair=True, workers=2)
+
+    assert [(report.world_id, report.is_ok) for report in reports] == [(1, True), (2, True), (3, False)]
+    assert storage.get_world_ids() == [1, 2]
+    assert 'Мир 3 перенесен в карантин' in caplog.text
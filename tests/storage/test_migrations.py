@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from app.storage import migrations
+from app.storage.migrations import LAYER, MIGRATIONS, get_schema_version, migrate, migrate_world, migration
+from app.storage.storage import Storage
+from app.world_creator.model import SCHEMA_VERSION, Layer, LayerName, SparseLayer, World
+from app.world_creator.world_manager import WorldManager
+
+
+@pytest.fixture
+def storage(tmp_path) -> Storage:
+    return Storage(tmp_path)
+
+
+@pytest.fixture
+def manager(world) -> WorldManager:
+    manager = WorldManager(world)
+    manager.add_init_layers()
+    manager.fill_base_lands_layer(50)
+    manager.log('Мир создан')
+    return manager
+
+
+def test_registry_covers_schema():
+    assert set(MIGRATIONS) <= set(range(1, SCHEMA_VERSION + 1))
+    with pytest.raises(ValueError, match='уже зарегистрирована'):
+        migration(3, LAYER)(lambda layer: layer)
+    with pytest.raises(ValueError, match='Неизвестная часть мира'):
+        migration(3, 'tiles')(lambda layer: layer)
+    with pytest.raises(ValueError, match='новее поддерживаемой'):
+        get_schema_version({'schema_version': SCHEMA_VERSION + 1})
+
+
+def test_layer_from_flat_tiles():
+    shape = (20, 3)
+    layer = Layer.parse_obj(migrate(LAYER, {
+        'layer_name': LayerName.LANDS.value,
+        'shape': shape,
+        'tiles': [{'position': i, 'image_ref': str(i)} for i in range(shape[0] * shape[1])],
+    }, 0))
+
+    assert layer.num_chunks == 2
+    for position in range(layer.num_tiles):
+        assert layer.get_tile(position).position == position
+        assert layer.get_tile(position).image_ref == str(position)
+
+
+@pytest.mark.parametrize('layer_data', [
+    {'tiles': [{'position': i, 'image_ref': 'aaa' if i == 5 else None} for i in range(9)]},
+    {'chunks': {0: {'shape': (3, 3), 'tiles': [{'position': i, 'image_ref': 'aaa' if i == 5 else None} for i in range(9)]}}},
+    {'layer_type': 'sparse', 'filled_tiles': {5: {'position': 5, 'image_ref': 'aaa'}}},
+])
+def test_load_sparse_layer(world, layer_data):
+    layer_name = LayerName.RACE.value
+    world_data = world.dict(exclude={'schema_version'})
+    world_data['layers'] = {layer_name: {'layer_name': layer_name, 'shape': (3, 3), **layer_data}}
+
+    migrated_world = World.parse_obj(migrate_world(world_data))
+    layer = migrated_world.layers[layer_name]
+
+    assert migrated_world.schema_version == SCHEMA_VERSION
+    assert isinstance(layer, SparseLayer)
+    assert list(layer.filled_tiles) == [5]
+    assert World.parse_raw(migrated_world.json()).layers[layer_name] == layer
+
+
+def test_load_legacy_file_with_old_schema(storage, manager):
+    world_data = json.loads(manager.world.json(exclude={'schema_version'}))
+    world_data['change_log'] = ['Мир создан']
+    storage.storage_dir.mkdir(exist_ok=True)
+    storage._get_legacy_path(1).write_text(json.dumps(world_data))
+
+    world = storage.load_world(1)
+
+    assert world.change_log[0].message == 'Мир создан'
+    assert world.schema_version == SCHEMA_VERSION
+
+
+def test_lazy_world_migrated_on_load_and_saved(storage, manager, monkeypatch):
+    storage.save_world(1, manager.world)
+    meta_path = storage._get_section_path(1, 'meta')
+    meta = json.loads(meta_path.read_text())
+    meta['schema_version'] = SCHEMA_VERSION - 1
+    meta['old_name'] = meta.pop('name')
+    meta_path.write_text(json.dumps(meta))
+    renamed_events = []
+    monkeypatch.setitem(MIGRATIONS, SCHEMA_VERSION, {
+        **MIGRATIONS.get(SCHEMA_VERSION, {}),
+        migrations.META: lambda data: {**{k: v for k, v in data.items() if k != 'old_name'}, 'name': data['old_name']},
+        'events': lambda events: renamed_events.append(events) or [*events, 'перенесено'],
+    })
+
+    world = storage.load_world(1)
+    assert world.stored_schema_version == SCHEMA_VERSION - 1
+    assert world.name == manager.world.name
+    assert renamed_events == []
+
+    assert 'events' in storage.save_world(1, world, touch=False)
+    assert world.stored_schema_version == SCHEMA_VERSION
+
+    reloaded_world = storage.load_world(1)
+    assert reloaded_world.stored_schema_version == SCHEMA_VERSION
+    assert reloaded_world.events == ['перенесено']
+    assert len(renamed_events) == 1
@@ -0,0 +1,147 @@
+import pytest
+
+from app.storage import snapshots
+from app.storage.lazy_world import LazyWorld
+from app.storage.sections import join_world, split_world
+from app.storage.snapshots import SnapshotStore
+from app.storage.storage import Storage
+from app.world_creator.model import City, GodProfile, LayerName
+from app.world_creator.tiles import ImageRef, LandType, Tile
+from app.world_creator.world_manager import WorldManager
+
+
+@pytest.fixture
+def manager(world) -> WorldManager:
+    world.layers_shape = (20, 20)
+    manager = WorldManager(world)
+    manager.add_init_layers()
+    manager.fill_base_lands_layer(50)
+    return manager
+
+
+@pytest.fixture
+def store(tmp_path) -> SnapshotStore:
+    return SnapshotStore(tmp_path / 'snapshots')
+
+
+def _act(manager: WorldManager, position: int, n_round: int = 0):
+    manager.world.n_round = n_round
+    manager.change_tile(LayerName.LANDS, Tile(position=position, image_ref=LandType.ROCK.value))
+    manager.change_tile(LayerName.EVENT, Tile(position=position, image_ref=ImageRef.EVENT.value))
+    manager.log(f'горы в {position}')
+
+
+def test_split_join_world(manager):
+    manager.world.cities.append(City(name='city', base_race_name='race', fractions=[], alignment=0, position=5))
+    _act(manager, 3)
+
+    assert join_world(split_world(manager.world)) == manager.world
+
+
+def test_snapshot_stores_only_changes(manager, store):
+    assert store.record(manager.world)
+    assert not store.record(manager.world)
+
+    _act(manager, 3)
+    assert store.record(manager.world)
+
+    changed_sections = store.load_history().snapshots[-1].sections
+    assert set(changed_sections) == {'layers/lands/0', 'layers/event/0', 'change_log/0'}
+
+
+def test_legacy_section_names(manager, store):
+    store.record(manager.world)
+    world_before = manager.world.copy(deep=True)
+    history = store.load_history()
+    for snapshot in history.snapshots:
+        snapshot.sections = {
+            key.replace('layers/', 'layer/').replace('change_log/', 'log/'): value
+            for key, value in snapshot.sections.items()
+        }
+    store._save_history(history)
+
+    _act(manager, 3)
+    assert store.record(manager.world)
+    assert set(store.load_history().snapshots[-1].sections) == {'layers/lands/0', 'layers/event/0', 'change_log/0'}
+    assert store.undo() == world_before
+
+
+def test_undo(manager, store):
+    store.record(manager.world)
+    world_before = manager.world.copy(deep=True)
+    _act(manager, 3)
+    store.record(manager.world)
+
+    assert store.undo() == world_before
+    assert store.undo() is None
+
+
+def test_get_world_at_round(manager, store):
+    store.record(manager.world)
+    for n_round in range(1, 4):
+        _act(manager, n_round, n_round)
+        store.record(manager.world)
+
+    world = store.get_world_at_round(0, 2)
+
+    assert world.n_round == 2
+    assert world.layers[LayerName.LANDS.value].get_tile(2).image_ref == LandType.ROCK.value
+    assert world.layers[LayerName.LANDS.value].get_tile(3).image_ref != LandType.ROCK.value
+    assert store.get_world_at_round(-1, 0) is None
+
+
+def test_ring_buffer(manager, store, monkeypatch):
+    monkeypatch.setattr(snapshots, 'MAX_SNAPSHOTS', 3)
+    store.record(manager.world)
+    for n_round in range(1, 6):
+        _act(manager, n_round, n_round)
+        store.record(manager.world)
+
+    history = store.load_history()
+    assert [snapshot.n_round for snapshot in history.snapshots] == [3, 4, 5]
+    assert store.get_world(history, 0).n_round == 3
+    assert store.get_world(history, -1) == manager.world
+    assert len(list(store.blobs_dir.glob('*.json'))) < len(split_world(manager.world)) + 10
+
+
+def test_undo_keeps_changes_before_action(manager, store):
+    store.record(manager.world)
+    manager.world.gods[1] = GodProfile(name='god')
+    store.record(manager.world)
+    world_before = manager.world.copy(deep=True)
+    _act(manager, 3)
+    store.record(manager.world)
+
+    assert store.undo() == world_before
+
+
+def test_record_lazy_world(manager, store, tmp_path):
+    storage = Storage()
+    storage.storage_dir = tmp_path
+    storage.save_world(1, manager.world)
+    store.record(manager.world)
+
+    world = storage.load_world(1)
+    world.gods[1] = GodProfile(name='god')
+    assert store.record(world)
+
+    history = store.load_history()
+    assert set(history.snapshots[-1].sections) == {'meta'}
+    assert store.get_world(history, -1) == world.load_all()
+
+
+def test_record_saved_sections(manager, store, tmp_path, monkeypatch):
+    storage = Storage()
+    storage.storage_dir = tmp_path
+    store.record(manager.world, storage.save_world(1, manager.world))
+    world_before = manager.world.copy(deep=True)
+
+    world = storage.load_world(1)
+    _act(WorldManager(world), 3)
+    monkeypatch.setattr(LazyWorld, 'get_loaded_sections', None)
+    assert store.record(world, storage.save_world(1, world))
+
+    history = store.load_history()
+    assert set(history.snapshots[-1].sections) == {'meta', 'layers/lands/0', 'layers/event/0', 'change_log/0'}
+    assert store.get_world(history, -1) == storage.load_world(1).load_all()
+    assert store.undo().layers == world_before.layers
@@ -0,0 +1,186 @@
+import shutil
+
+import pytest
+
+from app.storage import lazy_world, sections
+from app.storage.lazy_world import LazyWorld
+from app.storage.storage import Storage, WorldChangedError
+from app.world_creator.model import GodProfile, LayerName, LogEntry, Race, World
+from app.world_creator.tiles import EmptyTile, ImageRef, LandType, Tile
+from app.world_creator.world_manager import WorldManager
+
+
+@pytest.fixture
+def storage(tmp_path) -> Storage:
+    storage = Storage()
+    storage.storage_dir = tmp_path
+    return storage
+
+
+@pytest.fixture
+def manager(world) -> WorldManager:
+    manager = WorldManager(world)
+    manager.add_init_layers()
+    manager.fill_base_lands_layer(50)
+    world.gods[1] = GodProfile(name='god')
+    manager.log('Мир создан')
+    return manager
+
+
+def test_save_and_load_world(storage, manager):
+    assert set(storage.save_world(1, manager.world)) == {
+        'meta', 'races', 'cities', 'events', 'change_log/0',
+        'layers/lands', 'layers/lands/0', 'layers/climate', 'layers/climate/0', 'layers/race', 'layers/event',
+    }
+
+    world = storage.load_world(1)
+
+    assert isinstance(world, LazyWorld)
+    assert world.load_all() == manager.world
+
+
+def test_lazy_loading(storage, manager):
+    storage.save_world(1, manager.world)
+    read_sections = []
+    world = storage.load_world(1)
+    read_section = world._read_section
+    world._read_section = lambda name: read_sections.append(name) or read_section(name)
+
+    assert world.gods[1].name == 'god'
+    assert LayerName.LANDS.value in world.layers
+    assert read_sections == []
+
+    world.layers[LayerName.LANDS.value].set_tile(Tile(position=0, image_ref=LandType.ROCK.value))
+    world.races['race'] = Race(name='race', description='', init_position=0, god_creator='god')
+    assert read_sections == ['layers/lands', 'layers/lands/0', 'races']
+    assert set(storage.save_world(1, world)) == {'layers/lands/0', 'races', 'meta'}
+    assert storage.save_world(1, world) == {}
+
+    reloaded_world = storage.load_world(1)
+    assert reloaded_world.layers[LayerName.LANDS.value].get_tile(0).image_ref == LandType.ROCK.value
+    assert list(reloaded_world.races) == ['race']
+
+
+def test_load_legacy_world(storage, manager):
+    (storage.storage_dir / '1.json').write_text(manager.world.json())
+    assert storage.is_world_exist(1)
+
+    world = storage.load_world(1)
+    storage.save_world(1, world)
+
+    assert not (storage.storage_dir / '1.json').exists()
+    assert world.last_mutation_at is not None
+    assert storage.load_world(1).load_all() == manager.world.copy(update={'last_mutation_at': world.last_mutation_at})
+
+
+def test_remove_world(storage, manager):
+    storage.save_world(1, manager.world)
+
+    storage.remove_world(1)
+
+    assert not storage.is_world_exist(1)
+
+
+def test_lazy_log_segments(storage, manager, monkeypatch):
+    monkeypatch.setattr(lazy_world, 'LOG_SEGMENT_SIZE', 4)
+    monkeypatch.setattr(sections, 'LOG_SEGMENT_SIZE', 4)
+    for i in range(9):
+        manager.log(f'запись {i}')
+    storage.save_world(1, manager.world)
+
+    world = storage.load_world(1)
+    assert world.log_length == 11
+    assert world.get_log_entry(10).message == 'запись 8'
+    world.add_log_entry(LogEntry(message='новая запись'))
+    world.add_log_entry(LogEntry(message='еще одна запись'))
+
+    assert set(storage.save_world(1, world)) == {'change_log/2', 'change_log/3', 'meta'}
+    assert 'change_log' not in world.__dict__
+
+    reloaded_world = storage.load_world(1)
+    assert [entry.message for entry in reloaded_world.change_log] == [
+        entry.message for entry in manager.world.change_log
+    ] + ['новая запись', 'еще одна запись']
+
+
+def test_get_world_ids(storage, manager):
+    storage.save_world(1, manager.world)
+    storage.save_world(-100, manager.world)
+    storage._get_legacy_path(7).write_text(manager.world.json())
+    storage.get_snapshot_store(1).record(manager.world)
+    storage.get_cache_dir(1).mkdir(parents=True)
+
+    assert storage.get_world_ids() == [-100, 1, 7]
+    assert storage.get_world_size(7) == len(manager.world.json().encode())
+    assert storage.get_world_size(1) == storage.get_world_size(-100) > 0
+
+
+def test_layer_chunk_sections(storage):
+    manager = WorldManager(World(name='test_world', layers_shape=(40, 40)))
+    manager.add_init_layers()
+    storage.save_world(1, manager.world)
+
+    world = storage.load_world(1)
+    world.layers[LayerName.LANDS.value].set_tile(Tile(position=1234, image_ref=LandType.ROCK.value))
+    world.layers[LayerName.RACE.value].set_tile(Tile(position=7, image_ref=ImageRef.CITY.value))
+
+    assert set(storage.save_world(1, world)) == {'layers/lands/5', 'layers/race/0', 'meta'}
+
+    world = storage.load_world(1)
+    world.layers[LayerName.RACE.value].set_tile(EmptyTile(position=7))
+
+    assert set(storage.save_world(1, world)) == {'layers/race/0', 'meta'}
+    assert storage.load_world(1).layers[LayerName.RACE.value].filled_tiles == {}
+
+
+def test_lazy_layer_chunks(storage):
+    manager = WorldManager(World(name='test_world', layers_shape=(40, 40)))
+    manager.add_init_layers()
+    storage.save_world(1, manager.world)
+    read_sections = []
+    world = storage.load_world(1)
+    read_section = world._read_section
+    world._read_section = lambda name: read_sections.append(name) or read_section(name)
+
+    layer = world.layers[LayerName.LANDS.value]
+    layer.set_tile(Tile(position=1234, image_ref=LandType.ROCK.value))
+    assert layer.get_tile(1234).image_ref == LandType.ROCK.value
+    assert read_sections == ['layers/lands', 'layers/lands/5']
+    assert set(storage.save_world(1, world)) == {'layers/lands/5', 'meta'}
+
+    assert world.load_all().layers[LayerName.LANDS.value] == storage.load_world(1).layers[LayerName.LANDS.value]
+    assert read_sections.count('layers/lands/5') == 1
+    assert {name for name in read_sections if name.startswith('layers/lands/')} == {
+        f'layers/lands/{chunk_position}' for chunk_position in range(9)
+    }
+
+
+def test_load_whole_layer_section(storage, manager):
+    storage.save_world(1, manager.world)
+    shutil.rmtree(storage.get_world_dir(1) / 'layers' / 'lands')
+    storage._get_section_path(1, 'layers/lands').write_text(manager.world.layers[LayerName.LANDS.value].json())
+
+    world = storage.load_world(1)
+    assert world.layers[LayerName.LANDS.value] == manager.world.layers[LayerName.LANDS.value]
+
+    assert set(storage.save_world(1, world)) == {'layers/lands', 'layers/lands/0', 'meta'}
+    assert storage.load_world(1).load_all() == manager.world.copy(update={'last_mutation_at': world.last_mutation_at})
+
+
+def test_stale_world_is_not_mixed_with_newer_save(storage, manager):
+    storage.save_world(1, manager.world)
+    stale_world = storage.load_world(1)
+    world = storage.load_world(1)
+    world.races['race'] = Race(name='race', description='', init_position=0, god_creator='god')
+    storage.save_world(1, world)
+    world.events.append('событие')
+    storage.save_world(1, world)
+
+    with pytest.raises(WorldChangedError):
+        stale_world.races
+    stale_world.gods[1].name = 'stale god'
+    with pytest.raises(WorldChangedError):
+        storage.save_world(1, stale_world)
+    storage.remove_world(1)
+    with pytest.raises(WorldChangedError):
+        world.layers[LayerName.LANDS.value]
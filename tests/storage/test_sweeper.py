@@ -0,0 +1,138 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.storage.storage import Storage, WorldChangedError
+from app.storage.sweeper import FINISHED_MAX_IDLE, MAX_IDLE, find_abandoned_worlds, sweep
+from app.world_creator.controller import WorldController
+from app.world_creator.world_manager import WorldManager
+
+
+@pytest.fixture
+def storage(tmp_path) -> Storage:
+    return Storage(tmp_path)
+
+
+@pytest.fixture
+def manager(world) -> WorldManager:
+    manager = WorldManager(world)
+    manager.add_init_layers()
+    manager.fill_base_lands_layer(50)
+    manager.log('Мир создан')
+    return manager
+
+
+def test_save_marks_mutation_time(storage, manager):
+    start = datetime.now(timezone.utc)
+    storage.save_world(1, manager.world)
+    saved_at = manager.world.last_mutation_at
+
+    world = storage.load_world(1)
+    storage.save_world(1, world)
+
+    assert saved_at >= start
+    assert world.last_mutation_at == saved_at
+
+
+def test_freeze_and_thaw(storage, manager):
+    storage.save_world(1, manager.world)
+    storage.get_snapshot_store(1).record(manager.world)
+    sections = storage.read_world_sections(1)
+
+    assert storage.freeze_world(1) > 0
+
+    assert storage.is_world_frozen(1) and not storage.is_world_hot(1) and storage.is_world_exist(1)
+    assert storage.get_world_ids() == []
+    assert storage.get_world_ids(include_frozen=True) == [1]
+    assert storage.read_world_sections(1) == sections
+    assert storage.get_snapshot_store(1).load_history().snapshots == []
+
+    storage.thaw_world(1)
+
+    assert storage.is_world_hot(1) and not storage.is_world_frozen(1)
+    assert storage.read_world_sections(1) == sections
+
+
+def test_save_frozen_world(storage, manager):
+    storage.save_world(1, manager.world)
+    world = storage.load_world(1).load_all()
+    storage.freeze_world(1)
+    world.events.append('событие')
+
+    with pytest.raises(WorldChangedError):
+        storage.save_world(1, world)
+    assert storage.is_world_frozen(1)
+
+    manager.world.events.append('событие')
+    storage.save_world(1, manager.world)
+
+    assert not storage.is_world_frozen(1)
+    assert storage.load_world(1).events == ['событие']
+
+
+def test_world_saved_after_sweep_decision_is_not_frozen(storage, manager):
+    storage.save_world(1, manager.world)
+    now = manager.world.last_mutation_at + timedelta(days=1)
+    abandoned = find_abandoned_worlds(storage, now, max_idle=timedelta(hours=1))
+    manager.world.events.append('событие')
+    storage.save_world(1, manager.world)
+
+    with pytest.raises(WorldChangedError):
+        storage.freeze_world(1, abandoned[1])
+    assert storage.is_world_hot(1) and not storage.is_world_frozen(1)
+
+
+def test_world_saved_during_freeze_is_not_frozen(storage, manager, monkeypatch):
+    storage.save_world(1, manager.world)
+    write_archive = storage._write_archive
+
+    def write_archive_during_save(path, file_name, sections):
+        write_archive(path, file_name, sections)
+        manager.world.events.append('событие')
+        storage.save_world(1, manager.world)
+
+    monkeypatch.setattr(storage, '_write_archive', write_archive_during_save)
+
+    with pytest.raises(WorldChangedError):
+        storage.freeze_world(1)
+    assert storage.is_world_hot(1) and not storage.is_world_frozen(1)
+    assert list(storage._get_cold_dir().iterdir()) == []
+    assert storage.load_world(1).events == ['событие']
+
+
+def test_controller_thaws_world(storage, manager, monkeypatch):
+    monkeypatch.setattr('app.storage.storage.STORAGE_DIR', storage.storage_dir)
+    storage.save_world(1, manager.world)
+    storage.freeze_world(1)
+
+    controller = WorldController(world_id=1, god_id=1)
+
+    assert controller.world.name == manager.world.name
+    assert storage.is_world_hot(1) and not storage.is_world_frozen(1)
+
+
+def test_find_abandoned_worlds(storage, manager):
+    storage.save_world(1, manager.world)
+    manager.world.set_trusted(is_creation_end=True)
+    storage.save_world(2, manager.world)
+    storage._get_legacy_path(3).write_text(manager.world.copy(update={'last_mutation_at': None}).json())
+    legacy_time = (datetime.now(timezone.utc) - 2 * MAX_IDLE).timestamp()
+    os.utime(storage._get_legacy_path(3), (legacy_time, legacy_time))
+    now = manager.world.last_mutation_at
+
+    assert list(find_abandoned_worlds(storage, now)) == [3]
+    assert list(find_abandoned_worlds(storage, now + 2 * FINISHED_MAX_IDLE)) == [2, 3]
+    assert list(find_abandoned_worlds(storage, now + 2 * MAX_IDLE)) == [1, 2, 3]
+
+
+def test_sweep(storage, manager):
+    storage.save_world(1, manager.world)
+    storage.save_world(2, manager.world)
+    storage.get_world_dir(3).mkdir()
+    storage._get_section_path(3, 'meta').write_text('{')
+
+    frozen = sweep(storage, manager.world.last_mutation_at + timedelta(days=1), max_idle=timedelta(hours=1))
+
+    assert frozen == [1, 2]
+    assert storage.get_world_ids() == [3]
@@ -0,0 +1,23 @@
+import pytest
+
+from app.world_creator.model import GodProfile
+from app.world_creator.tiles import LandType, Tile
+
+
+def test_set_trusted():
+    god = GodProfile(name='god')
+    god.set_trusted(value_force=3, confirm_end_round=True)
+
+    assert god.value_force == 3
+    assert god.confirm_end_round
+    assert {'value_force', 'confirm_end_round'} <= god.__fields_set__
+    with pytest.raises(ValueError):
+        god.set_trusted(force=1)
+
+
+def test_strings_are_shared_after_parsing():
+    first_tile = Tile.parse_raw('{"position": 0, "image_ref": "WATER", "creator": "god"}')
+    second_tile = Tile.parse_raw('{"position": 1, "image_ref": "WATER", "creator": "god"}')
+
+    assert first_tile.image_ref is second_tile.image_ref is LandType.WATER.value
+    assert first_tile.creator is second_tile.creator
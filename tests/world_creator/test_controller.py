@@ -0,0 +1,110 @@
+import pytest
+from PIL import Image
+
+from app.storage import storage
+from app.world_creator.controller import PREVIEW_RADIUS, ROUTES_CACHE_NAME, SEARCH_INDEX_CACHE_NAME, WorldController
+from app.world_creator.image_encoder import EncodingPolicy, ImageFormat
+from app.world_creator.image_manager import load_land_tiles
+from app.world_creator.landmass_index import is_land_tile
+from app.world_creator.model import LayerName
+from app.world_creator.search_index import SearchIndex
+
+
+@pytest.fixture
+def controller(tmp_path, monkeypatch) -> WorldController:
+    monkeypatch.setattr(storage, 'STORAGE_DIR', tmp_path)
+    controller = WorldController(world_id=1, god_id=1)
+    controller.create_world('test_world', (10, 10), 50, seed=1)
+    return controller
+
+
+@pytest.mark.parametrize('position, layer_name, num_tiles', [
+    (55, LayerName.LANDS, 2 * PREVIEW_RADIUS + 1),
+    (0, LayerName.LANDS, PREVIEW_RADIUS + 1),
+    (0, LayerName.RACE, PREVIEW_RADIUS + 1),
+    (899, LayerName.RACE, PREVIEW_RADIUS + 1),
+])
+def test_render_preview(controller, position, layer_name, num_tiles):
+    tile_size = load_land_tiles().image_size
+
+    image = controller.render_preview(position, layer_name)
+
+    assert image.size == (num_tiles * tile_size[0], num_tiles * tile_size[1])
+    assert image.size[0] < controller.render_map().size[0]
+
+
+def test_is_land(controller):
+    lands_layer = controller.manager.get_layer(LayerName.LANDS)
+
+    for position, race_position in ((0, 31), (55, 497), (99, 899)):
+        is_land = is_land_tile(lands_layer.get_tile(position))
+        assert controller.is_land(position) == is_land
+        assert controller.is_land(race_position, LayerName.RACE) == is_land
+    assert controller.world._landmass_index is None and controller.world._spatial_index is None
+
+    controller = WorldController(world_id=1, god_id=1)
+    controller.is_land(55)
+    assert controller.world.loaded_layer_names == [LayerName.LANDS.value]
+    assert list(controller.world.layers[LayerName.LANDS.value].chunks.get_loaded()) == [0]
+
+
+def test_landmass_info_cached_per_version(controller):
+    info = controller.get_landmass_info()
+    controller.world._landmass_index = None
+
+    assert controller.get_landmass_info() == info
+    assert controller.world._landmass_index is None
+    assert info in controller.world_info
+
+    controller.manager.log('новое действие')
+    controller.get_landmass_info()
+    assert controller.world._landmass_index is not None
+
+
+def test_routes_cached_between_requests(controller):
+    land = [position for position in range(100) if controller.is_land(position)]
+    route = controller.find_route(land[0], land[-1])
+    assert (controller.storage.get_cache_dir(1) / ROUTES_CACHE_NAME).exists()
+
+    controller = WorldController(world_id=1, god_id=1)
+    assert set(controller.routing.routes) == {(land[0], land[-1])}
+    assert controller.find_route(land[0], land[-1]) == route
+
+
+def test_search_index_cached_between_requests(controller, monkeypatch):
+    controller.manager.log('Один поднял горы', god='Один')
+    controller.save()
+    assert [document.text for document in controller.search('гор')] == ['Один поднял горы']
+    assert (controller.storage.get_cache_dir(1) / SEARCH_INDEX_CACHE_NAME).exists()
+
+    controller = WorldController(world_id=1, god_id=1)
+    controller.manager.log('Локи поднял еще горы', god='Локи')
+    monkeypatch.setattr(SearchIndex, '__init__', None)
+
+    assert [document.text for document in controller.search('гор')] == ['Локи поднял еще горы', 'Один поднял горы']
+
+
+def test_timelapse_cached_per_version(controller):
+    path = controller.get_timelapse_path()
+    assert controller.get_timelapse_path() == path
+
+    controller.manager.log('новое действие')
+    new_path = controller.get_timelapse_path()
+
+    assert new_path != path
+    assert not path.exists()
+    assert Image.open(new_path).format == 'GIF'
+
+
+def test_map_cached_per_version_and_policy(controller):
+    path = controller.get_map_path(EncodingPolicy())
+    webp_path = controller.get_map_path(EncodingPolicy(image_format=ImageFormat.WEBP))
+    assert controller.get_map_path(EncodingPolicy()) == path
+
+    controller.manager.log('новое действие')
+    new_path = controller.get_map_path(EncodingPolicy())
+
+    assert new_path != path
+    assert not path.exists()
+    assert webp_path.exists()
+    assert Image.open(new_path).size == controller.render_map().size
@@ -69,7 +69,7 @@ def test_start_new_era(world, n_era, n_round):
             assert god.confirm_end_round is False
             assert god.confirm_end_era is False
     else:
-        assert world.change_log[-1] == 'Мир создан'
+        assert world.change_log[-1].message == 'Мир создан'
 
 
 def test_get_controlled_race_names(world):
@@ -0,0 +1,54 @@
+import gzip
+
+import pytest
+
+from app.storage.migrations import migrate_world
+from app.world_creator.history import iter_gzip, iter_story_bytes
+from app.world_creator.model import LogEntry, World
+from app.world_creator.world_manager import WorldManager
+
+
+@pytest.fixture
+def manager(world) -> WorldManager:
+    manager = WorldManager(world)
+    for n_era in range(2):
+        world.n_era = n_era
+        for n_round in range(3):
+            world.n_round = n_round
+            manager.log(f'запись {n_era} {n_round} а')
+            manager.log(f'запись {n_era} {n_round} б')
+    return manager
+
+
+def test_legacy_log_entries():
+    world = World.parse_obj(migrate_world({'name': 'world', 'layers_shape': (2, 2), 'change_log': ['Мир создан']}))
+
+    assert world.change_log == [LogEntry(message='Мир создан')]
+    assert world.change_log[0].title == 'Мир создан'
+
+
+def test_iter_story_bytes(manager):
+    chunks = list(iter_story_bytes(manager.world.iter_log_entries(), chunk_size=100))
+
+    assert len(chunks) > 1
+    assert all(len(chunk) < 200 for chunk in chunks)
+    assert b''.join(chunks).decode().splitlines()[1] == '[эпоха 0, раунд 0] запись 0 0 б'
+
+
+def test_iter_story_compressed(manager):
+    story = b''.join(manager.iter_story())
+
+    assert gzip.decompress(b''.join(manager.iter_story(compress=True))) == story
+    assert gzip.decompress(b''.join(iter_gzip([]))) == b''
+
+
+def test_get_last_log_entries(manager):
+    assert [entry.message for entry in manager.get_last_log_entries(3)] == [
+        'запись 1 1 б', 'запись 1 2 а', 'запись 1 2 б'
+    ]
+    assert len(manager.get_last_log_entries(100)) == 12
+
+
+def test_get_round_log_entries(manager):
+    assert [entry.message for entry in manager.get_round_log_entries(0, 1)] == ['запись 0 1 а', 'запись 0 1 б']
+    assert manager.get_round_log_entries(3, 0) == []
@@ -0,0 +1,58 @@
+import io
+
+import pytest
+from PIL import Image
+
+from app.world_creator.image_encoder import EncodingPolicy, ImageFormat, encode_image, fit_pixel_budget
+
+
+@pytest.fixture
+def image() -> Image.Image:
+    image = Image.new('RGBA', (64, 32), (0, 0, 255, 255))
+    image.paste((0, 255, 0, 255), (0, 0, 32, 32))
+    return image
+
+
+def test_policy_from_env():
+    policy = EncodingPolicy.from_env({
+        'IMAGE_FORMAT': 'webp',
+        'IMAGE_PALETTE_COLORS': '16',
+        'IMAGE_MAX_PIXELS': '',
+        'OTHER': '1',
+    })
+
+    assert policy == EncodingPolicy(image_format=ImageFormat.WEBP, palette_colors=16)
+    with pytest.raises(ValueError):
+        EncodingPolicy.from_env({'IMAGE_PNG_COMPRESS_LEVEL': '10'})
+
+
+def test_fit_pixel_budget(image):
+    assert fit_pixel_budget(image, None) is image
+    assert fit_pixel_budget(image, 64 * 32) is image
+    assert fit_pixel_budget(image, 512).size == (32, 16)
+
+
+@pytest.mark.parametrize('policy, mode', [
+    (EncodingPolicy(), 'RGBA'),
+    (EncodingPolicy(png_compress_level=1, palette_colors=8), 'P'),
+    (EncodingPolicy(image_format=ImageFormat.WEBP), 'RGB'),
+    (EncodingPolicy(image_format=ImageFormat.JPEG, max_pixels=512), 'RGB'),
+])
+def test_encode_image(image, policy, mode):
+    encoded = encode_image(image, policy)
+    decoded = Image.open(io.BytesIO(encoded.data))
+
+    assert decoded.format == policy.image_format.value
+    assert decoded.mode == mode
+    assert decoded.size == encoded.size
+    assert encoded.num_bytes > 0
+    assert encoded.encode_time >= 0
+    assert encoded.filename == f'map.{policy.image_format.value.lower()}'
+
+
+def test_palette_keeps_colors(image):
+    encoded = encode_image(image, EncodingPolicy(palette_colors=8))
+
+    decoded = Image.open(io.BytesIO(encoded.data)).convert('RGBA')
+    assert decoded.getpixel((0, 0)) == (0, 255, 0, 255)
+    assert decoded.getpixel((63, 0)) == (0, 0, 255, 255)
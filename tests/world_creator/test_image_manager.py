@@ -1,13 +1,23 @@
+import numpy as np
 import pytest
 from PIL import Image
 
 from app.world_creator.image_manager import (
+    IMAGE_COLLECTION_LOADERS,
     ImageCollection,
     load_event_tiles,
     load_land_tiles,
     load_race_init_tiles,
     load_climate_tiles,
+    render_layer,
+    get_chunk_image,
+    get_tile_boxes,
+    paste_scaled_image_with_alpha,
+    Viewport,
 )
+from app.world_creator.model import LayerName
+from app.world_creator.tiles import ClimateType, ImageRef, LandType, Tile
+from app.world_creator.world_manager import Manager, WorldManager
 
 
 @pytest.mark.parametrize('size', [(10, 10), (1, 1)])
@@ -29,3 +39,78 @@ def test_image_collection_invalid(size):
 def test_work_load_functions(load_function):
     """К сожалению тут можно только проверить, что картинки успешно загрузились"""
     load_function()
+
+
+def test_render_layer(world):
+    layer_name = LayerName.EVENT
+    manager = Manager(world)
+    manager.create_layer(layer_name, shape=(20, 20))
+    manager.change_tile(layer_name, Tile(position=21, image_ref=ImageRef.EVENT.value))
+    images = load_event_tiles()
+
+    image = render_layer(manager.get_layer(layer_name), images)
+
+    assert image.size == (20 * images.image_size[0], 20 * images.image_size[1])
+    assert image.getbbox() == (images.image_size[0], images.image_size[1], 2 * images.image_size[0], 2 * images.image_size[1])
+
+
+@pytest.mark.parametrize(
+    'position, radius, shape, true_viewport',
+    [(0, 1, (5, 5), (0, 0, 2, 2)), (12, 1, (5, 5), (1, 1, 3, 3)), (12, 10, (5, 5), (0, 0, 5, 5)), (9, 0, (5, 4), (4, 1, 1, 1))]
+)
+def test_viewport_from_center(position, radius, shape, true_viewport):
+    viewport = Viewport.from_center(position, radius, shape)
+
+    assert (viewport.x, viewport.y, viewport.width, viewport.height) == true_viewport
+
+
+def test_viewport_around_positions():
+    viewport = Viewport.around_positions([6, 7, 12], (5, 5))
+
+    assert (viewport.x, viewport.y, viewport.width, viewport.height) == (0, 0, 4, 4)
+
+
+def test_viewport_outside_map():
+    with pytest.raises(ValueError, match='Область просмотра находится за пределами карты'):
+        Viewport(x=10, y=0, width=2, height=2).clip((5, 5))
+
+
+def test_get_tile_boxes():
+    assert get_tile_boxes(3, 12.5) == [(0, 12), (12, 13), (25, 13)]
+
+
+def test_get_chunk_image_sizes():
+    images = load_land_tiles()
+    image_refs = (LandType.WATER.value, None, None, LandType.ROCK.value)
+
+    full_image = get_chunk_image(images, image_refs, (2, 2))
+    reduced_image = get_chunk_image(images, image_refs, (2, 2), (25, 25))
+
+    assert full_image.size == (2 * images.image_size[0], 2 * images.image_size[1])
+    assert get_chunk_image(images, image_refs, (2, 2), full_image.size) is full_image
+    assert reduced_image.size == (25, 25)
+    assert reduced_image.getpixel((24, 0))[3] == 0
+    assert get_chunk_image(images, image_refs, (2, 2), (25, 25)) is reduced_image
+
+
+@pytest.mark.parametrize('zoom', [0, 1, 2, 3])
+def test_render_map_matches_full_resolution(world, zoom):
+    """Карта, собранная из уменьшенных тайлов, почти не отличается от уменьшенной карты в исходном разрешении"""
+    world.layers_shape = (7, 5)
+    manager = WorldManager(world)
+    manager.add_init_layers()
+    manager.fill_base_lands_layer(50)
+    manager.change_tile(LayerName.CLIMATE, Tile(position=3, image_ref=ClimateType.RAIN.value))
+    manager.change_tile(LayerName.RACE, Tile(position=50, image_ref=ImageRef.CITY.value))
+    manager.change_tile(LayerName.EVENT, Tile(position=40, image_ref=ImageRef.EVENT.value))
+
+    image = manager.render_map(zoom=zoom)
+    full_image = render_layer(manager.get_layer(LayerName.LANDS), IMAGE_COLLECTION_LOADERS[LayerName.LANDS]())
+    for layer_name in (LayerName.CLIMATE, LayerName.RACE, LayerName.EVENT):
+        paste_scaled_image_with_alpha(
+            full_image, render_layer(manager.get_layer(layer_name), IMAGE_COLLECTION_LOADERS[layer_name]())
+        )
+    diff = np.abs(np.asarray(image, dtype=int) - np.asarray(full_image.resize(image.size), dtype=int))
+
+    assert diff.mean() < 6
+    assert (diff.max(axis=2) > 64).mean() < 0.01
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from app.world_creator.landmass_index import LandmassIndex, label_landmasses
+from app.world_creator.model import LayerName
+from app.world_creator.tiles import ClimateType, LandType, Tile
+from app.world_creator.world_manager import Manager
+
+#: Карта 4x5: материк слева сверху, остров справа снизу
+LAND_MAP = [
+    '##..',
+    '##..',
+    '#...',
+    '...#',
+    '...#',
+]
+
+
+@pytest.fixture
+def manager(world) -> Manager:
+    manager = Manager(world)
+    manager.create_layer(LayerName.LANDS)
+    manager.create_layer(LayerName.CLIMATE)
+    for y, row in enumerate(LAND_MAP):
+        for x, symbol in enumerate(row):
+            land_type = LandType.PLATEAU if symbol == '#' else LandType.WATER
+            manager.change_tile(LayerName.LANDS, Tile(position=x + y * 4, image_ref=land_type.value))
+    return manager
+
+
+def _set_land(manager: Manager, position: int, land_type: LandType):
+    manager.change_tile(LayerName.LANDS, Tile(position=position, image_ref=land_type.value))
+
+
+def _get_landmasses(index: LandmassIndex) -> list[set[int]]:
+    return sorted((set(members) for members in index.members.values()), key=min)
+
+
+def test_label_landmasses():
+    land = np.array([[1, 0, 1], [1, 0, 1], [1, 1, 1], [0, 0, 0], [1, 0, 1]], dtype=bool)
+
+    labels = label_landmasses(land)
+
+    assert labels.tolist() == [[0, -1, 0], [0, -1, 0], [0, 0, 0], [-1, -1, -1], [12, -1, 14]]
+
+
+def test_landmasses(manager):
+    index = manager.landmass_index
+
+    assert _get_landmasses(index) == [{0, 1, 4, 5, 8}, {15, 19}]
+    assert index.num_continents == 2
+    assert index.num_islands == 0
+    assert index.get_landmass_id(2) is None
+    assert index.get_landmass_id(0) == index.get_landmass_id(8)
+    assert index.is_coast(1)
+    assert not index.is_coast(0)
+    assert index.num_coast_tiles == 5
+
+
+def test_incremental_update_matches_rebuild(manager, world):
+    index = manager.landmass_index
+
+    _set_land(manager, 11, LandType.SAND)
+    assert _get_landmasses(index) == [{0, 1, 4, 5, 8}, {11, 15, 19}]
+    _set_land(manager, 9, LandType.FOREST)
+    _set_land(manager, 10, LandType.FOREST)
+    assert _get_landmasses(index) == [{0, 1, 4, 5, 8, 9, 10, 11, 15, 19}]
+
+    _set_land(manager, 10, LandType.WATER)
+    _set_land(manager, 4, LandType.WATER)
+    assert _get_landmasses(index) == [{0, 1, 5, 8, 9}, {11, 15, 19}]
+
+    rebuilt_index = LandmassIndex(world)
+    assert _get_landmasses(index) == _get_landmasses(rebuilt_index)
+    assert index.coast.tolist() == rebuilt_index.coast.tolist()
+
+
+def test_fill_resets_index(manager):
+    assert manager.landmass_index.num_continents == 2
+
+    manager.fill_layer(LayerName.LANDS, Tile(position=0, image_ref=LandType.WATER.value))
+
+    assert manager.landmass_index.num_continents == 0
+
+
+def test_climate_summary(manager):
+    manager.change_tile(LayerName.CLIMATE, Tile(position=0, image_ref=ClimateType.SNOW.value))
+    manager.change_tile(LayerName.CLIMATE, Tile(position=19, image_ref=ClimateType.RAIN.value))
+
+    summary = manager.landmass_index.get_climate_summary()
+
+    assert summary[0] == {'CLEAR': 4, ClimateType.SNOW.value: 1}
+    assert summary[15] == {'CLEAR': 1, ClimateType.RAIN.value: 1}
+
+
+def test_info(manager):
+    manager.change_tile(LayerName.CLIMATE, Tile(position=0, image_ref=ClimateType.SNOW.value))
+    _set_land(manager, 19, LandType.WATER)
+
+    assert manager.landmass_index.info == 'Материки: 1, острова: 1\n' \
+                                          'Береговых тайлов: 4\n' \
+                                          'Материк из 5 тайлов: CLEAR: 4, SNOW: 1\n' \
+                                          'Острова: CLEAR: 1\n'
@@ -1,6 +1,6 @@
 from app.world_creator.tiles import Tile, EmptyTile
 from app.world_creator.world_manager import Manager
-from app.world_creator.model import LayerName, Layer, GodProfile
+from app.world_creator.model import LayerName, Layer, GodProfile, SparseLayer, World
 import pytest
 
 
@@ -70,3 +70,60 @@ def test_spend_force(world, value):
 
     assert world.gods[god_id].value_force == init_value_force - value
 
+
+def test_change_tile(world):
+    layer_name = LayerName.LANDS
+    manager = Manager(world)
+    manager.create_layer(layer_name=layer_name, shape=(40, 40))
+
+    manager.change_tile(layer_name, Tile(position=1234, image_ref='aaa'))
+
+    layer = manager.get_layer(layer_name)
+    assert layer.get_tile(1234).image_ref == 'aaa'
+    assert [chunk.is_empty for chunk in layer.chunks.values()].count(False) == 1
+
+
+@pytest.mark.parametrize('layer_name, layer_class', [
+    (LayerName.LANDS, Layer),
+    (LayerName.CLIMATE, Layer),
+    (LayerName.RACE, SparseLayer),
+    (LayerName.EVENT, SparseLayer),
+])
+def test_create_layer_type(world, layer_name, layer_class):
+    manager = Manager(world)
+    manager.create_layer(layer_name)
+
+    assert isinstance(manager.get_layer(layer_name), layer_class)
+
+
+def test_sparse_layer_tiles(world):
+    layer_name = LayerName.EVENT
+    manager = Manager(world)
+    manager.create_layer(layer_name=layer_name, shape=(300, 300))
+    layer = manager.get_layer(layer_name)
+
+    manager.change_tile(layer_name, Tile(position=7, image_ref='aaa'))
+    manager.change_tile(layer_name, Tile(position=8, image_ref='bbb'))
+    manager.change_tile(layer_name, EmptyTile(position=8))
+
+    assert layer.get_tile(7).image_ref == 'aaa'
+    assert isinstance(layer.get_tile(8), EmptyTile)
+    assert [tile.position for tile in layer.iter_filled_tiles()] == [7]
+    for position in (-1, layer.num_tiles):
+        with pytest.raises(IndexError):
+            manager.change_tile(layer_name, Tile(position=position, image_ref='aaa'))
+
+
+@pytest.mark.parametrize('layer_name', [LayerName.LANDS, LayerName.EVENT])
+def test_random_filling_reproducible(layer_name):
+    filled_positions = []
+    for seed in [1, 1, 2]:
+        world = World(name='test_world', layers_shape=(20, 20), seed=seed)
+        manager = Manager(world)
+        manager.create_layer(layer_name=layer_name)
+        manager.random_partial_fill_layer(layer_name, 30, Tile(position=0, image_ref='aaa'))
+        filled_positions.append(sorted(t.position for t in manager.get_layer(layer_name).iter_filled_tiles()))
+
+    assert len(filled_positions[0]) == 120
+    assert filled_positions[0] == filled_positions[1]
+    assert filled_positions[0] != filled_positions[2]
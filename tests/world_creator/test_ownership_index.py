@@ -0,0 +1,39 @@
+from app.world_creator.model import City, GodProfile, Race, RaceFraction
+from app.world_creator.ownership_index import OwnershipIndex
+from app.world_creator.world_manager import GodManager, RaceManager
+
+
+def _race(name: str, god_creator: str, fraction_owners: list[str]) -> Race:
+    return Race(
+        name=name,
+        description='aaa',
+        init_position=0,
+        god_creator=god_creator,
+        fractions=[RaceFraction(name=f'{name}_{owner}', god_owner=owner) for owner in fraction_owners]
+    )
+
+
+def test_index_built_on_load(world):
+    world.races = {r.name: r for r in [_race('race0', 'god0', ['god0', 'god1']), _race('race1', 'god1', ['god1'])]}
+    world.cities = [City(name='city', base_race_name='race1', fractions=[], alignment=0)]
+
+    index = OwnershipIndex(world)
+
+    assert index.get_created_race_names('god0') == ['race0']
+    assert index.get_controlled_race_names('god1') == ['race0', 'race1']
+    assert [f.name for f in index.get_fractions('god1', 'race0')] == ['race0_god1']
+    assert [c.name for c in index.get_cities('race1')] == ['city']
+    assert index.get_controlled_race_names('unknown') == []
+
+
+def test_index_updated_incrementally(world):
+    world.gods = {0: GodProfile(name='god0')}
+    manager = RaceManager(world)
+    god_manager = GodManager(world, 0)
+    assert god_manager.get_controlled_race_names() == []
+
+    manager.add_race(_race('race0', 'god1', ['god1', 'god0']))
+    manager.add_city(City(name='city', base_race_name='race0', fractions=[], alignment=0))
+
+    assert god_manager.get_controlled_race_names() == ['race0']
+    assert [c.name for c in manager.ownership_index.get_cities('race0')] == ['city']
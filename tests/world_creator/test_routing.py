@@ -0,0 +1,114 @@
+import pytest
+
+from app.world_creator.model import LayerName, World
+from app.world_creator.routing import RoutingService
+from app.world_creator.tiles import LandType, Tile
+from app.world_creator.world_manager import Manager
+
+#: Карта 4x5: P - плато, R - горы, ~ - вода
+LAND_MAP = [
+    'PPP~',
+    'RP~P',
+    'PPP~',
+    '~~P~',
+    'PPPP',
+]
+LAND_TYPES = {'P': LandType.PLATEAU, 'R': LandType.ROCK, '~': LandType.WATER}
+
+
+@pytest.fixture
+def manager(world) -> Manager:
+    manager = Manager(world)
+    for layer_name in LayerName:
+        shape = world.layers_shape if layer_name in (LayerName.LANDS, LayerName.CLIMATE) else (12, 15)
+        manager.create_layer(layer_name, shape)
+    for y, row in enumerate(LAND_MAP):
+        for x, symbol in enumerate(row):
+            manager.change_tile(LayerName.LANDS, Tile(position=x + y * 4, image_ref=LAND_TYPES[symbol].value))
+    return manager
+
+
+def _set_land(manager: Manager, position: int, land_type: LandType):
+    manager.change_tile(LayerName.LANDS, Tile(position=position, image_ref=land_type.value))
+
+
+def test_find_route_avoids_costly_tiles(manager):
+    route = manager.routing.find_route(0, 8)
+
+    assert route.positions == [0, 1, 5, 9, 8]
+    assert route.cost == 4
+
+
+def test_find_route_unreachable(manager):
+    assert manager.routing.find_route(0, 7) is None
+    assert manager.routing.find_route(0, 3) is None
+    assert manager.routing.get_distance(0, 19) == 7
+
+
+def test_route_cache_invalidation(manager):
+    routing = manager.routing
+    routing.find_route(0, 8)
+    routing.find_route(16, 19)
+    assert set(routing.routes) == {(0, 8), (16, 19)}
+
+    _set_land(manager, 19, LandType.FOREST)
+    assert set(routing.routes) == {(0, 8)}
+
+    _set_land(manager, 4, LandType.PLATEAU)
+    assert set(routing.routes) == set()
+    assert routing.find_route(0, 8).positions == [0, 4, 8]
+
+
+def test_route_through_new_land(manager):
+    assert manager.routing.find_route(0, 7) is None
+
+    _set_land(manager, 6, LandType.SAND)
+
+    route = manager.routing.find_route(0, 7)
+    assert route.positions[-2:] == [6, 7]
+    assert route.cost == 4.5
+
+
+def test_load_cache(manager):
+    manager.routing.find_route(0, 8)
+    cache = manager.routing.dump_cache()
+
+    routing = RoutingService(manager.world)
+    routing.load_cache(cache)
+    assert set(routing.routes) == {(0, 8)}
+    assert not routing.is_changed
+
+    _set_land(manager, 4, LandType.PLATEAU)
+    routing = RoutingService(manager.world)
+    routing.load_cache(cache)
+    assert routing.routes == {}
+
+
+def test_load_cache_drops_routes_near_changed_chunks():
+    manager = Manager(World(name='test_world', layers_shape=(40, 4)))
+    manager.create_layer(LayerName.LANDS)
+    manager.fill_layer(LayerName.LANDS, Tile(position=0, image_ref=LandType.PLATEAU.value))
+    manager.routing.find_route(0, 3)
+    manager.routing.find_route(36, 39)
+    cache = manager.routing.dump_cache()
+
+    _set_land(manager, 38, LandType.ROCK)
+    routing = RoutingService(manager.world)
+    routing.load_cache(cache)
+
+    assert set(routing.routes) == {(0, 3)}
+
+
+def test_get_distances(manager):
+    distances = RoutingService(manager.world).get_distances({'a': 0, 'b': 2, 'c': 3})
+
+    assert distances == {('a', 'b'): 2, ('a', 'c'): None, ('b', 'c'): None}
+
+
+def test_render_route(manager):
+    route = manager.routing.find_route(0, 8)
+
+    image = manager.render_route(route, zoom=2)
+
+    assert image.size == (100, 125)
+    assert image.getpixel((12, 12))[:3] == (255, 0, 0)
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from app.world_creator.model import LayerName, Race
+from app.world_creator.search_index import SearchIndex, tokenize
+from app.world_creator.world_manager import RaceManager
+
+
+@pytest.fixture
+def manager(world) -> RaceManager:
+    manager = RaceManager(world)
+    for layer_name in LayerName:
+        shape = world.layers_shape if layer_name in (LayerName.LANDS, LayerName.CLIMATE) else (12, 15)
+        manager.create_layer(layer_name, shape)
+    return manager
+
+
+def _fill_history(manager: RaceManager):
+    manager.log('Мир создан')
+    manager.log('Один поднял горы', god='Один', tile=3)
+    manager.world.n_era = 1
+    manager.add_race(Race(name='эльфы', description='Живут в лесах', init_position=40, god_creator='Локи'))
+    manager.log('Локи создал расу эльфы', god='Локи', race='эльфы', tile=5)
+    manager.add_event('Великий потоп')
+    manager.log('Один создал событие Великий потоп', god='Один', tile=3, event='Великий потоп')
+
+
+def test_tokenize():
+    assert tokenize('Ёжики, ёлки и Горы-2!') == ['ежики', 'елки', 'и', 'горы', '2']
+
+
+def test_search_by_words(manager):
+    index = manager.search_index
+    _fill_history(manager)
+
+    assert [document.text for document in index.search('гор')] == ['Один поднял горы']
+    assert [document.kind for document in index.search('потоп')] == ['log', 'event']
+    assert [document.kind for document in index.search('лес')] == ['race']
+    assert index.search('потоп горы') == []
+
+
+def test_search_by_facets(manager):
+    index = manager.search_index
+    _fill_history(manager)
+
+    assert [document.text for document in index.search(god='Один', n_era=0)] == ['Один поднял горы']
+    assert [document.kind for document in index.search(race='эльфы')] == ['log', 'race']
+    assert [document.text for document in index.search('создал', tile=3)] == ['Один создал событие Великий потоп']
+    assert len(index.search(limit=2)) == 2
+    with pytest.raises(ValueError):
+        index.search(position=3)
+
+
+def test_index_updated_incrementally(manager, world):
+    index = manager.search_index
+    _fill_history(manager)
+
+    rebuilt_index = SearchIndex(world, manager.spatial_index.get_base_position)
+
+    assert [document.text for document in index.search('потоп', kind='log')] == \
+        [document.text for document in rebuilt_index.search('потоп', kind='log')]
+    assert index.search(race='эльфы', kind='race')[0].tile == 5
+    assert index.search('потоп', kind='event') == rebuilt_index.search('потоп', kind='event')
+    assert [document.text for document in rebuilt_index.search(god='Один', n_era=1, tile=3, kind='event')] == [
+        'Великий потоп'
+    ]
+
+
+def test_dump_and_update(manager, world):
+    index = manager.search_index
+    _fill_history(manager)
+    data = json.loads(json.dumps(index.dump()))
+    manager.log('Один поднял новые горы', god='Один')
+    manager.add_event('Засуха')
+    manager.log('Тор создал событие Засуха', god='Тор', event='Засуха')
+
+    index = SearchIndex.from_dump(data, manager.spatial_index.get_base_position)
+    assert not index.is_changed
+    assert index.update(world)
+
+    assert index.is_changed
+    assert [document.text for document in index.search('гор')] == ['Один поднял новые горы', 'Один поднял горы']
+    assert [document.kind for document in index.search('засух')] == ['log', 'event']
+    assert [document.text for document in index.search(god='Тор', kind='event')] == ['Засуха']
+    assert [document.kind for document in index.search(race='эльфы')] == ['log', 'race']
+
+
+def test_update_after_undo(manager, world):
+    _fill_history(manager)
+    data = manager.search_index.dump()
+    world.change_log.pop()
+    manager.log('Тор создал событие Великий потоп', god='Тор')
+
+    assert not SearchIndex.from_dump(data, manager.spatial_index.get_base_position).update(world)
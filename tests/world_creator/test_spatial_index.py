@@ -0,0 +1,75 @@
+import pytest
+
+from app.world_creator.model import City, LayerName, Race
+from app.world_creator.spatial_index import SpatialIndex
+from app.world_creator.tiles import EmptyTile, ImageRef, Tile
+from app.world_creator.world_manager import RaceManager
+
+
+@pytest.fixture
+def manager(world) -> RaceManager:
+    manager = RaceManager(world)
+    for layer_name in LayerName:
+        shape = world.layers_shape if layer_name in (LayerName.LANDS, LayerName.CLIMATE) else (12, 15)
+        manager.create_layer(layer_name, shape)
+    return manager
+
+
+def _create_race(manager: RaceManager, name: str, init_position: int):
+    manager.add_race(Race(name=name, description='', init_position=init_position, god_creator='god'))
+
+
+def _create_city(manager: RaceManager, name: str, position: int):
+    manager.add_city(City(name=name, base_race_name='race', fractions=[], alignment=0, position=position))
+
+
+@pytest.mark.parametrize('position, fine_positions', [(0, [0, 1, 2, 12, 13, 14, 24, 25, 26]), (5, [39, 40, 41, 51, 52, 53, 63, 64, 65])])
+def test_get_fine_positions(manager, position, fine_positions):
+    index = manager.spatial_index
+
+    assert index.get_fine_positions(position) == fine_positions
+    for fine_position in fine_positions:
+        assert index.get_base_position(fine_position) == position
+
+
+def test_index_built_on_load(manager, world):
+    _create_race(manager, 'race', 40)
+    _create_city(manager, 'city', 41)
+    manager.change_tile(LayerName.EVENT, Tile(position=52, image_ref=ImageRef.EVENT.value))
+
+    index = SpatialIndex(world)
+    contents = index.get_tile_contents(5)
+
+    assert [race.name for race in contents.races] == ['race']
+    assert [city.name for city in contents.cities] == ['city']
+    assert [tile.position for tile in contents.fine_tiles[LayerName.EVENT.value]] == [52]
+    assert set(contents.tiles) == {LayerName.LANDS.value, LayerName.CLIMATE.value}
+
+
+def test_index_updated_incrementally(manager):
+    index = manager.spatial_index
+
+    _create_race(manager, 'race', 0)
+    _create_city(manager, 'city', 26)
+    manager.change_tile(LayerName.EVENT, Tile(position=13, image_ref=ImageRef.EVENT.value))
+
+    contents = index.get_tile_contents(0)
+    assert [race.name for race in contents.races] == ['race']
+    assert [city.name for city in contents.cities] == ['city']
+    assert len(contents.fine_tiles[LayerName.EVENT.value]) == 1
+
+    manager.change_tile(LayerName.EVENT, EmptyTile(position=13))
+
+    assert LayerName.EVENT.value not in index.get_tile_contents(0).fine_tiles
+
+
+@pytest.mark.parametrize('radius, city_names', [(0, ['city0']), (1, ['city0', 'city1']), (1.5, ['city0', 'city1', 'city2'])])
+def test_get_cities_in_radius(manager, radius, city_names):
+    _create_city(manager, 'city0', 0)
+    _create_city(manager, 'city1', 3)
+    _create_city(manager, 'city2', 39)
+    _create_city(manager, 'city3', 11)
+
+    cities = manager.spatial_index.get_cities_in_radius(0, radius)
+
+    assert sorted(city.name for city in cities) == city_names
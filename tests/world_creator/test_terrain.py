@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from app.world_creator.model import LayerName
+from app.world_creator.terrain import NoiseTerrainGenerator, LAND_TYPES, land_code, smooth_mask, value_noise
+from app.world_creator.tiles import LandType
+from app.world_creator.world_manager import WorldManager
+
+
+@pytest.mark.parametrize('shape', [(1, 1), (4, 5), (13, 7)])
+def test_value_noise(shape):
+    noise = value_noise(shape, period=2, rng=np.random.default_rng(0))
+
+    assert noise.shape == (shape[1], shape[0])
+    assert noise.min() >= 0
+    assert noise.max() <= 1
+
+
+def test_smooth_mask_removes_single_tiles():
+    mask = np.zeros((5, 5), dtype=bool)
+    mask[2, 2] = True
+
+    assert not smooth_mask(mask, 1).any()
+
+
+@pytest.mark.parametrize('percent', [0, 40, 100])
+def test_noise_generator(percent):
+    shape = (30, 20)
+    generator = NoiseTerrainGenerator(percent)
+
+    codes = generator.generate(shape, np.random.default_rng(1))
+
+    assert codes.shape == (shape[0] * shape[1],)
+    assert set(codes.tolist()) <= set(range(len(LAND_TYPES)))
+    land_percent = 100 * np.count_nonzero(codes != land_code(LandType.WATER)) / codes.size
+    assert abs(land_percent - percent) < 10
+
+
+def test_noise_generator_reproducible():
+    generator = NoiseTerrainGenerator(50)
+
+    first = generator.generate((40, 40), np.random.default_rng(5))
+    second = generator.generate((40, 40), np.random.default_rng(5))
+    other = generator.generate((40, 40), np.random.default_rng(6))
+
+    assert (first == second).all()
+    assert (first != other).any()
+
+
+def test_fill_base_lands_with_generator(world):
+    manager = WorldManager(world)
+    manager.create_layer(layer_name=LayerName.LANDS, shape=(10, 10))
+
+    manager.fill_base_lands_layer(50, NoiseTerrainGenerator(50))
+
+    land_refs = {land_type.value for land_type in LandType}
+    assert all(tile.image_ref in land_refs for tile in manager.get_layer(LayerName.LANDS).tiles)
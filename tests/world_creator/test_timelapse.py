@@ -0,0 +1,63 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+
+from app.world_creator.model import LayerName
+from app.world_creator.tiles import ImageRef, LandType, Tile
+from app.world_creator.timelapse import get_initial_world, iter_timelapse_gif
+from app.world_creator.world_manager import WorldManager
+
+
+@pytest.fixture
+def manager(world) -> WorldManager:
+    world.layers_shape = (6, 5)
+    manager = WorldManager(world)
+    manager.add_init_layers()
+    manager.fill_base_lands_layer(50)
+    return manager
+
+
+def _act(manager: WorldManager):
+    manager.change_tile(LayerName.LANDS, Tile(position=7, image_ref=LandType.ROCK.value))
+    manager.log('горы')
+    manager.log('без изменений карты')
+    manager.change_tile(LayerName.LANDS, Tile(position=7, image_ref=LandType.FOREST.value))
+    manager.change_tile(LayerName.EVENT, Tile(position=80, image_ref=ImageRef.EVENT.value))
+    manager.log('лес и событие')
+
+
+def test_log_records_tile_changes(manager):
+    previous_image_ref = manager.get_layer(LayerName.LANDS).get_tile(7).image_ref
+    _act(manager)
+
+    first_changes, no_changes, last_changes = [entry.tile_changes for entry in manager.world.change_log[-3:]]
+    assert [(change.position, change.image_ref, change.previous_image_ref) for change in first_changes] == \
+        [(7, LandType.ROCK.value, previous_image_ref)]
+    assert no_changes == []
+    assert [(change.layer_name, change.previous_image_ref) for change in last_changes] == \
+        [(LayerName.LANDS.value, LandType.ROCK.value), (LayerName.EVENT.value, None)]
+
+
+def test_get_initial_world(manager):
+    initial_lands = manager.get_layer(LayerName.LANDS).copy(deep=True)
+    _act(manager)
+
+    initial_world = get_initial_world(manager.world)
+
+    assert initial_world.layers[LayerName.LANDS.value] == initial_lands
+    assert initial_world.layers[LayerName.EVENT.value].filled_tiles == {}
+    assert manager.get_layer(LayerName.LANDS).get_tile(7).image_ref == LandType.FOREST.value
+
+
+def test_iter_timelapse_gif(manager):
+    _act(manager)
+
+    animation = Image.open(io.BytesIO(b''.join(iter_timelapse_gif(manager.world, 300))))
+    frames = [frame.convert('RGB') for frame in ImageSequence.Iterator(animation)]
+
+    assert len(frames) == 3
+    assert animation.size == (300, 250)
+    final_map = manager.render_map(zoom=1).convert('RGB')
+    assert np.abs(np.asarray(frames[-1], dtype=int) - np.asarray(final_map, dtype=int)).mean() < 3
@@ -0,0 +1,127 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.storage.storage import Storage
+from app.world_creator.controller import GodController, WorldController
+from app.world_creator.model import World
+from app.world_creator.turn_scheduler import MAX_HEAP_GROWTH, TurnScheduler
+
+TIMEOUT = timedelta(hours=1)
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_world(turn_started_at: datetime) -> World:
+    return World(
+        name='test_world', layers_shape=(4, 5), is_start_game=True, redactor_god_id=1, turn_started_at=turn_started_at
+    )
+
+
+@pytest.fixture
+def scheduler(tmp_path) -> TurnScheduler:
+    return TurnScheduler(Storage(tmp_path), TIMEOUT)
+
+
+@pytest.fixture
+def game(scheduler) -> WorldController:
+    WorldController(world_id=1, god_id=1, storage=scheduler.storage).create_world('test_world', (4, 5), 50, seed=1)
+    for god_id, name in ((1, 'Локи'), (2, 'Тор'), (3, 'Один')):
+        GodController(world_id=1, god_id=god_id, storage=scheduler.storage, on_save=scheduler.schedule).add_god(name)
+    controller = WorldController(world_id=1, god_id=1, storage=scheduler.storage, on_save=scheduler.schedule)
+    controller.start_game()
+    return controller
+
+
+def test_pop_expired_in_deadline_order(scheduler):
+    for world_id, hours in ((1, 3), (2, 1), (3, 2)):
+        scheduler.schedule(world_id, make_world(START + timedelta(hours=hours)))
+    scheduler.schedule(2, make_world(START + timedelta(hours=5)))
+
+    assert scheduler.get_next_deadline() == START + timedelta(hours=3)
+    assert scheduler.pop_expired(START + timedelta(hours=4)) == [3, 1]
+    assert scheduler.pop_expired(START + timedelta(hours=4)) == []
+    assert len(scheduler) == 1
+
+
+def test_stale_deadlines_are_compacted(scheduler):
+    for minutes in range(100):
+        scheduler.schedule(1, make_world(START + timedelta(minutes=minutes)))
+
+    assert len(scheduler) == 1
+    assert len(scheduler._heap) <= MAX_HEAP_GROWTH + 1
+    assert scheduler.pop_expired(START + timedelta(days=1)) == [1]
+
+
+def test_finished_turn_is_unscheduled(scheduler):
+    world = make_world(START)
+    scheduler.schedule(1, world)
+    world.is_creation_end = True
+    scheduler.schedule(1, world)
+
+    assert scheduler.get_next_deadline() is None
+
+
+def test_game_turns_are_scheduled(scheduler, game):
+    world = game.world
+
+    assert scheduler.get_next_deadline() == world.last_mutation_at + TIMEOUT
+    assert world.redactor_god_id == 1 and world.turn_started_at is not None
+
+    GodController(world_id=1, god_id=1, storage=scheduler.storage).next_redactor_god()
+    reloaded = TurnScheduler(scheduler.storage, TIMEOUT)
+
+    assert reloaded.load() == 1
+    assert reloaded.get_next_deadline() == reloaded.get_deadline(scheduler.storage.load_world(1))
+
+
+def test_skip_silent_god_turn(scheduler, game):
+    last_mutation_at = scheduler.storage.load_world(1).last_mutation_at
+    now = scheduler.get_next_deadline()
+
+    god_id = scheduler.get_silent_god_id(1, now)
+    GodController(world_id=1, god_id=god_id, storage=scheduler.storage, on_save=scheduler.schedule).skip_turn()
+
+    world = scheduler.storage.load_world(1)
+    assert god_id == 1
+    assert world.redactor_god_id == 2
+    assert world.gods[1].confirm_end_round
+    assert world.last_mutation_at == last_mutation_at
+    assert scheduler.get_next_deadline() == world.turn_started_at + TIMEOUT
+    assert scheduler.get_silent_god_id(1, now) is None
+
+
+def test_abandoned_world_is_not_skipped(scheduler, game):
+    now = scheduler.storage.load_world(1).last_mutation_at + 3 * TIMEOUT
+
+    assert scheduler.get_silent_god_id(1, now - timedelta(seconds=1)) == 1
+    assert scheduler.get_silent_god_id(1, now) is None
+
+
+def test_skipped_round_ends(scheduler, game):
+    for god_id in (1, 2, 3):
+        GodController(world_id=1, god_id=god_id, storage=scheduler.storage).skip_turn()
+
+    world = scheduler.storage.load_world(1)
+    assert world.n_round == 1
+    assert world.redactor_god_id == 1
+    assert not any(god.confirm_end_round for god in world.gods.values())
+
+
+def test_run_skips_expired_turns(scheduler):
+    skipped = []
+
+    async def skip_turn(world_id: int, god_id: int):
+        skipped.append((world_id, god_id))
+
+    async def run_scheduler():
+        task = asyncio.create_task(scheduler.run(skip_turn))
+        await asyncio.sleep(0)
+        scheduler.storage.save_world(1, make_world(datetime.now(timezone.utc) - TIMEOUT), touch=False)
+        scheduler.schedule(1, scheduler.storage.load_world(1))
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(run_scheduler())
+
+    assert skipped == [(1, 1)]
@@ -1,6 +1,16 @@
+import numpy as np
 import pytest
 
-from app.world_creator.utils import get_coord_from_position, get_position_from_coord
+from app.world_creator.utils import (
+    get_base_position,
+    get_chunk_from_position,
+    get_chunk_shape,
+    get_chunks_from_positions,
+    get_coord_from_position,
+    get_num_chunks,
+    get_position_from_chunk,
+    get_position_from_coord,
+)
 
 
 @pytest.mark.parametrize(
@@ -21,3 +31,47 @@ def test_get_position(x, y, len_row, true_position):
     position = get_position_from_coord(x, y, len_row)
 
     assert position == true_position
+
+
+@pytest.mark.parametrize('len_row, chunk_size, num_chunks', [(1, 16, 1), (16, 16, 1), (17, 16, 2), (200, 16, 13)])
+def test_get_num_chunks(len_row, chunk_size, num_chunks):
+    assert get_num_chunks(len_row, chunk_size) == num_chunks
+
+
+@pytest.mark.parametrize(
+    'position, len_row, chunk_size, true_chunk',
+    [(0, 10, 4, (0, 0)), (5, 10, 4, (1, 1)), (9, 10, 4, (2, 1)), (19, 10, 4, (2, 3)), (45, 10, 4, (4, 1))]
+)
+def test_get_chunk_from_position(position, len_row, chunk_size, true_chunk):
+    chunk = get_chunk_from_position(position, len_row, chunk_size)
+
+    assert chunk == true_chunk
+
+
+@pytest.mark.parametrize('shape, chunk_size', [((10, 7), 4), ((3, 3), 16), ((33, 17), 16)])
+def test_chunk_addressing_roundtrip(shape, chunk_size):
+    chunk_tiles_count = {}
+    for position in range(shape[0] * shape[1]):
+        chunk_position, local_position = get_chunk_from_position(position, shape[0], chunk_size)
+        chunk_tiles_count[chunk_position] = chunk_tiles_count.get(chunk_position, 0) + 1
+
+        assert get_position_from_chunk(chunk_position, local_position, shape[0], chunk_size) == position
+
+    for chunk_position, count in chunk_tiles_count.items():
+        chunk_shape = get_chunk_shape(chunk_position, shape, chunk_size)
+        assert chunk_shape[0] * chunk_shape[1] == count
+
+
+@pytest.mark.parametrize('shape, chunk_size', [((10, 7), 4), ((33, 17), 16)])
+def test_get_chunks_from_positions(shape, chunk_size):
+    positions = np.arange(shape[0] * shape[1])
+
+    chunk_positions, local_positions = get_chunks_from_positions(positions, shape[0], chunk_size)
+
+    for position, chunk_position, local_position in zip(positions, chunk_positions, local_positions):
+        assert get_chunk_from_position(int(position), shape[0], chunk_size) == (chunk_position, local_position)
+
+
+@pytest.mark.parametrize('position, len_row, expected', [(31, 30, 0), (497, 30, 55), (899, 30, 99), (55, 10, 55)])
+def test_get_base_position(position, len_row, expected):
+    assert get_base_position(position, len_row, 10) == expected
@@ -1,5 +1,6 @@
 import pytest
 
+from app.world_creator.image_manager import Viewport
 from app.world_creator.model import LayerName
 from app.world_creator.tiles import LandType
 from app.world_creator.world_manager import WorldManager
@@ -23,3 +24,32 @@ def test_fill_base_lands(world, percent):
 
     assert len([t for t in layer.tiles if t.image_ref == LandType.WATER.value]) == 100 - percent
     assert len([t for t in layer.tiles if t.image_ref == LandType.PLATEAU.value]) == percent
+
+
+@pytest.mark.parametrize('zoom', [0, 1, 3])
+def test_render_map_viewport(world, zoom):
+    manager = WorldManager(world)
+    manager.add_init_layers()
+    manager.fill_base_lands_layer(50)
+    viewport = Viewport(x=1, y=2, width=2, height=3)
+
+    image = manager.render_map(LayerName.RACE, viewport=viewport, zoom=zoom)
+
+    assert image.size == (round(200 / 2 ** zoom), round(300 / 2 ** zoom))
+
+
+def test_get_viewport_around(world):
+    manager = WorldManager(world)
+    manager.add_init_layers()
+
+    viewport = manager.get_viewport_around(position=40, radius=1, layer_name=LayerName.RACE)
+
+    assert (viewport.x, viewport.y, viewport.width, viewport.height) == (0, 0, 3, 3)
+
+
+def test_calc_fit_zoom(world):
+    manager = WorldManager(world)
+    manager.add_init_layers()
+
+    assert manager.calc_fit_zoom(max_image_size=500) == 0
+    assert manager.calc_fit_zoom(max_image_size=200) == 2